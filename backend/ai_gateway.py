@@ -0,0 +1,314 @@
+# backend/ai_gateway.py
+"""
+Provider gateway for the AI assistant.
+
+All model calls go through a single AIGateway per process:
+  - bounded worker pool + bounded queue (a slow provider can't pin every worker)
+  - per-call deadline
+  - circuit breaker (fail fast while the provider is unhealthy)
+  - queue-depth / latency counters exposed via stats()
+
+Providers:
+  AI_PROVIDER=gemini  -> Google Gemini (default, needs GOOGLE_API_KEY)
+  AI_PROVIDER=stub    -> deterministic local replies, no network (CI / load tests)
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+import hashlib
+import os
+import threading
+import time
+
+AI_PROVIDER = (os.getenv("AI_PROVIDER") or "gemini").strip().lower()
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "16"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "25"))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("AI_BREAKER_COOLDOWN_SECONDS", "30"))
+AI_MODEL_CACHE_SIZE = int(os.getenv("AI_MODEL_CACHE_SIZE", "256"))
+AI_STUB_LATENCY_MS = int(os.getenv("AI_STUB_LATENCY_MS", "0"))
+
+
+# ---------------- Errors ----------------
+class AIError(Exception):
+    """Provider failure; `status` is the HTTP code the API should answer with."""
+    status = 502
+
+class AIUnavailable(AIError):
+    """Circuit open or queue full -> shed load instead of waiting."""
+    status = 503
+
+class AITimeout(AIError):
+    status = 504
+# ------------------------------------------------
+
+
+def ai_history_to_gemini(history):
+    """
+    Convert our history array to Gemini format.
+    history: [{role: 'user'|'assistant', 'content': '...'}]
+    """
+    out = []
+    for m in history or []:
+        role = "user" if m.get("role") == "user" else "model"
+        out.append({"role": role, "parts": [{"text": m.get("content","")}]})
+    return out
+
+def prompt_key(system_prompt: str) -> str:
+    return hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+
+
+# ---------------- Providers ----------------
+class GeminiProvider:
+    """
+    Google Gemini. The SDK is imported lazily and GenerativeModel objects are
+    reused per system-prompt hash (LRU bounded), instead of one per request.
+    """
+    name = "gemini"
+
+    def __init__(self, api_key=None, model_name=None, cache_size=AI_MODEL_CACHE_SIZE):
+        self.api_key = api_key if api_key is not None else os.getenv("GOOGLE_API_KEY")
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+        self.cache_size = max(1, cache_size)
+        self._genai = None
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.model_cache_hits = 0
+        self.model_cache_misses = 0
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def _sdk(self):
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai  # pip install google-generativeai
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def _model_for(self, system_prompt):
+        key = prompt_key(system_prompt)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.model_cache_hits += 1
+                return model
+        genai = self._sdk()
+        model = genai.GenerativeModel(model_name=self.model_name, system_instruction=system_prompt)
+        with self._lock:
+            self.model_cache_misses += 1
+            self._models[key] = model
+            while len(self._models) > self.cache_size:
+                self._models.popitem(last=False)
+        return model
+
+    def generate(self, system_prompt, history, message, generation_config=None, timeout=None):
+        model = self._model_for(system_prompt)
+        chat = model.start_chat(history=ai_history_to_gemini(history))
+        opts = {"timeout": timeout} if timeout else None
+        resp = chat.send_message(message, generation_config=generation_config, request_options=opts)
+        return (resp.text or "").strip()
+
+    def stats(self):
+        with self._lock:
+            cached = len(self._models)
+        return {
+            "model": self.model_name,
+            "modelCache": {"size": cached, "hits": self.model_cache_hits, "misses": self.model_cache_misses},
+        }
+
+
+class StubProvider:
+    """
+    Deterministic, offline provider: the same (system prompt, history, message)
+    always yields the same reply. AI_STUB_LATENCY_MS simulates provider latency.
+    """
+    name = "stub"
+    configured = True
+
+    def __init__(self, latency_ms=AI_STUB_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    def generate(self, system_prompt, history, message, generation_config=None, timeout=None):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        digest = hashlib.sha256(
+            "\x1f".join([prompt_key(system_prompt), str(len(history or [])), message or ""]).encode("utf-8")
+        ).hexdigest()[:12]
+        return f"[stub:{digest}] You asked: {(message or '').strip()[:200]}"
+
+    def stats(self):
+        return {"latencyMs": self.latency_ms}
+
+
+PROVIDERS = {"gemini": GeminiProvider, "stub": StubProvider}
+# ------------------------------------------------
+
+
+# ---------------- Circuit breaker ----------------
+class CircuitBreaker:
+    """
+    closed -> (N consecutive failures) -> open -> (cooldown) -> half_open
+    half_open lets a single trial call through; success closes, failure re-opens.
+    """
+    def __init__(self, failure_threshold=AI_BREAKER_FAILURES, cooldown=AI_BREAKER_COOLDOWN_SECONDS, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+            self._trial_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "consecutiveFailures": self.failures}
+# ------------------------------------------------
+
+
+# ---------------- Gateway ----------------
+class AIGateway:
+    def __init__(self, provider, max_concurrency=AI_MAX_CONCURRENCY, max_queue=AI_MAX_QUEUE,
+                 timeout=AI_TIMEOUT_SECONDS, breaker=None):
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ai-gw")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.counters = {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "rejected": 0, "shortCircuited": 0}
+        self._completed = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    @property
+    def configured(self):
+        return bool(getattr(self.provider, "configured", False))
+
+    def _bump(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _run(self, *args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        t0 = time.perf_counter()
+        try:
+            return self.provider.generate(*args)
+        finally:
+            dt = time.perf_counter() - t0
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._latency_total += dt
+                self._latency_max = max(self._latency_max, dt)
+
+    def ask(self, system_prompt, history, message, generation_config=None, timeout=None):
+        """
+        Run one completion under the gateway limits. Returns the reply text or
+        raises AIUnavailable / AITimeout / AIError.
+        """
+        timeout = timeout or self.timeout
+        with self._lock:
+            self.counters["calls"] += 1
+            if self._queued + self._running >= self.max_concurrency + self.max_queue:
+                self.counters["rejected"] += 1
+                raise AIUnavailable("AI assistant is busy, please retry shortly")
+            self._queued += 1
+
+        if not self.breaker.allow():
+            with self._lock:
+                self._queued -= 1
+                self.counters["shortCircuited"] += 1
+            raise AIUnavailable("AI provider temporarily unavailable")
+
+        fut = self._pool.submit(self._run, system_prompt, history, message, generation_config, timeout)
+        try:
+            answer = fut.result(timeout=timeout)
+        except FuturesTimeout:
+            fut.cancel()  # no-op if already running; the provider's own timeout frees the thread
+            self._bump("timeouts")
+            self.breaker.record_failure()
+            raise AITimeout(f"AI provider timed out after {timeout:g}s")
+        except Exception as e:
+            self._bump("errors")
+            self.breaker.record_failure()
+            raise AIError(f"{self.provider.name} error: {e}") from e
+
+        self._bump("ok")
+        self.breaker.record_success()
+        return answer
+
+    def stats(self):
+        with self._lock:
+            finished = self._completed
+            out = {
+                "provider": self.provider.name,
+                "configured": self.configured,
+                "maxConcurrency": self.max_concurrency,
+                "maxQueue": self.max_queue,
+                "timeoutSeconds": self.timeout,
+                "queueDepth": self._queued,
+                "inFlight": self._running,
+                **self.counters,
+                "completed": finished,
+                "latencyTotalMs": round(self._latency_total * 1000, 1),
+                "latencyAvgMs": round(self._latency_total / finished * 1000, 1) if finished else None,
+                "latencyMaxMs": round(self._latency_max * 1000, 1),
+            }
+        out["breaker"] = self.breaker.snapshot()
+        out.update(self.provider.stats())
+        return out
+# ------------------------------------------------
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_gateway():
+    """Process-wide gateway, built on first use from AI_PROVIDER."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                provider_cls = PROVIDERS.get(AI_PROVIDER)
+                if provider_cls is None:
+                    raise RuntimeError(f"Unknown AI_PROVIDER '{AI_PROVIDER}' (expected one of {sorted(PROVIDERS)})")
+                _gateway = AIGateway(provider_cls())
+    return _gateway
@@ -1,144 +1,271 @@
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import hashlib
 import os
+import threading
+import time
 from functools import wraps
 import re
 import json
-import requests
 from collections import defaultdict
 
 from bson import ObjectId, Decimal128
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, g, Response, send_from_directory
+load_dotenv()  # before local imports: ai_gateway / weather read their settings from env
+from flask import Flask, Blueprint, request, jsonify, g, Response
 from flask_cors import CORS
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ServerSelectionTimeoutError
-from db import mongo                           # <-- PyMongo instance from db.py
+from pymongo import ASCENDING, DESCENDING
+from db import mongo, MONGO_PROFILE           # <-- shared MongoClient from db.py
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from prices_today import bp as prices_today_bp  # <-- import is fine here (registration happens later)
+from price_history import bp as price_history_bp, ensure_history_indexes
+from price_alerts import bp as price_alerts_bp, ensure_alert_indexes
 
 # ---- NEW: certification blueprint + admin seeder ----
 from certs import bp as certs_bp
+from uploads import bp as uploads_bp
+from upload_sessions import bp as upload_sessions_bp, ensure_upload_session_indexes
+from storage import UPLOAD_ROOT
 from seed_admin import ensure_admin
 
-# ---- Gemini (AI) ----
-# pip install google-generativeai
-import google.generativeai as genai
+# ---- AI provider gateway (Gemini / local stub) ----
+from ai_gateway import get_gateway, AIError
 
-load_dotenv()
+# ---- Weather (OpenWeather + grid-cell cache) ----
+from weather import (get_weather, get_weather_many, summarize_now, advisory_tips, weather_cache_stats,
+                     _aggregate_3days, _format_location_from_owm)
+from http_client import get_http
+from query_stats import init_query_stats, query_stats
+from metrics import init_metrics, internal_required, track_stream
+from profiling import init_profiling
+
+# ---- Background jobs (JOBS_ENABLED=all|name,...) ----
+from jobs import start_scheduler, jobs_stats
 
 # ---- Config ----
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME", "farmunity")
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret")
 JWT_EXPIRE_DAYS = 7
+# Mongo ping + index setup + admin seed: "background" (after startup, default),
+# "sync" (before create_app returns; use with gunicorn --preload) or "off"
+INDEX_SETUP = os.getenv("INDEX_SETUP", "background").strip().lower()
+
+# Every route in this module hangs off this blueprint; create_app() registers it
+api = Blueprint("api", __name__)
+
+# ---- Mongo handles (bound by create_app -> bind_db) ----
+client = None
+db = None
+users = crops = conversations = messages_col = equipment_col = None
+notifications = bookings = ai_sessions = ai_messages = discussions = None
+
+def bind_db(mongo_client, db_name):
+    global client, db, users, crops, conversations, messages_col, equipment_col
+    global notifications, bookings, ai_sessions, ai_messages, discussions
+    client = mongo_client
+    # Always select the DB explicitly; do NOT rely on defaults
+    db = client[db_name or "farmunity"]
+    users           = db["users"]
+    crops           = db["crops"]
+    conversations   = db["conversations"]
+    messages_col    = db["messages"]
+    equipment_col   = db["equipment"]
+    notifications   = db["notifications"]
+    bookings        = db["bookings"]
+    ai_sessions     = db["ai_sessions"]
+    ai_messages     = db["ai_messages"]
+    discussions     = db["discussions"]
+
+# ---- Indexes (idempotent & resilient; created once per deployment) ----
+# (collection, keys, create_index options)
+INDEXES = [
+    ("users", [("email", ASCENDING)], {"unique": True}),
+    ("crops", [("createdAt", DESCENDING)], {}),
+    ("conversations", [("participantHash", ASCENDING), ("cropId", ASCENDING)], {}),
+    ("messages", [("conversationId", ASCENDING), ("createdAt", ASCENDING)], {}),
+
+    # Equipment helpful indexes
+    ("equipment", [("category", ASCENDING)], {}),
+    ("equipment", [("available", ASCENDING)], {}),
+    ("equipment", [("location.city", ASCENDING)], {}),
+    ("equipment", [("price.day", ASCENDING)], {}),
+    ("equipment", [("rating", DESCENDING)], {}),
+    ("equipment", [("title", "text"), ("features", "text")], {}),
+    # Admin certification queue (status, oldest first, cursor tie-break on _id)
+    ("equipment", [("certification.status", ASCENDING), ("updatedAt", ASCENDING), ("_id", ASCENDING)], {}),
+    ("equipment", [("certification.expiryDate", ASCENDING)], {}),  # expiry sweeper (certs.sweep_cert_expiry)
+
+    # Notifications / bookings indexes
+    ("notifications", [("userId", ASCENDING), ("createdAt", DESCENDING)], {}),
+    ("notifications", [("dedupeKey", ASCENDING)],
+     {"unique": True, "partialFilterExpression": {"dedupeKey": {"$exists": True}}}),
+    ("bookings", [("equipmentId", ASCENDING), ("createdAt", DESCENDING)], {}),
+
+    # AI session indexes
+    ("ai_sessions", [("userId", ASCENDING), ("updatedAt", DESCENDING)], {}),
+    ("ai_messages", [("sessionId", ASCENDING), ("ts", ASCENDING), ("_id", ASCENDING)], {}),
+
+    # NEW: forum indexes
+    ("discussions", [("createdAt", DESCENDING)], {}),
+    ("discussions", [("title", "text"), ("text", "text"), ("category", "text")], {}),
+]
+# Indexes owned by blueprint modules: (collection, ensure function)
+INDEX_HOOKS = [
+    ("price_history", ensure_history_indexes),
+    ("price_alerts", ensure_alert_indexes),
+    ("upload_sessions", ensure_upload_session_indexes),
+]
+INDEX_VERSION = hashlib.sha1(
+    repr((INDEXES, [(c, fn.__module__, fn.__name__) for c, fn in INDEX_HOOKS])).encode("utf-8")
+).hexdigest()[:12]
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY") or os.getenv("OWM_API_KEY")
-
-# Configure Gemini once
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-
-# ---- Flask app & CORS (CREATE APP BEFORE REGISTERING BLUEPRINTS) ----
-app = Flask(__name__)
-# In production, lock origins to your exact frontend origin
-CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-
-# ---- File uploads / static serving for certification docs ----
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")  # we'll store certs/invoices here
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-app.config["MAX_CONTENT_LENGTH"] = 6 * 1024 * 1024  # ~6 MB guardrail
-
-# Public route to serve uploaded files (supports subfolders via <path:filename>)
-@app.get("/uploads/<path:filename>")
-def serve_uploads(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
-
-# ---- PyMongo init for blueprints that use `from db import mongo` ----
-app.config["MONGO_URI"] = MONGO_URI
-mongo.init_app(app)  # <-- IMPORTANT: init before registering prices_today_bp
-
-# ---- Seed the single admin user once ----
-with app.app_context():
-    ensure_admin(mongo)
-
-# ---- Register blueprints AFTER mongo is initialized ----
-app.register_blueprint(prices_today_bp)
-app.register_blueprint(certs_bp)  # <--- certification endpoints
-
-# ---- Native pymongo (Atlas-safe init) ----
-if not MONGO_URI:
-    raise RuntimeError(
-        "MONGO_URI is missing. Example:\n"
-        "mongodb+srv://<user>:<pass>@farmunity.x7hhyxj.mongodb.net/farmunity"
-    )
-
-client = MongoClient(
-    MONGO_URI,
-    serverSelectionTimeoutMS=8000,   # fast fail if DNS/IP/auth is wrong
-    retryWrites=True,
-    w="majority",
-    appname="farmunity-api"
-)
-
-# Always select the DB explicitly; do NOT rely on defaults
-DB_NAME = DB_NAME or "farmunity"
-db = client[DB_NAME]
-
-# Fail fast if Atlas is unreachable / auth blocked
-try:
-    client.admin.command("ping")
-    print(f"✅ Connected to MongoDB Atlas · DB='{DB_NAME}'")
-except ServerSelectionTimeoutError as e:
-    raise RuntimeError(f"❌ Could not reach MongoDB Atlas: {e}") from e
-except Exception as e:
-    raise RuntimeError(f"❌ MongoDB Atlas auth/connection failed: {e}") from e
-
-# Collections
-users           = db["users"]
-crops           = db["crops"]
-conversations   = db["conversations"]
-messages_col    = db["messages"]
-equipment_col   = db["equipment"]
-notifications   = db["notifications"]
-bookings        = db["bookings"]
-ai_sessions     = db["ai_sessions"]
-discussions     = db["discussions"]
-
-# ---- Indexes (idempotent & resilient) ----
 def safe_index(col, spec, **kwargs):
+    """create_index that logs instead of raising; returns False on failure."""
     try:
         col.create_index(spec, **kwargs)
+        return True
     except Exception as e:
         print(f"[index] {col.name} {spec} -> {e}", flush=True)
+        return False
 
-safe_index(users, [("email", ASCENDING)], unique=True)
-safe_index(crops, [("createdAt", DESCENDING)])
-safe_index(conversations, [("participantHash", ASCENDING), ("cropId", ASCENDING)])
-safe_index(messages_col, [("conversationId", ASCENDING), ("createdAt", ASCENDING)])
+def ensure_indexes(database, force=False):
+    """
+    Create every index unless this deployment already has them: the spec hash
+    (INDEX_VERSION) is recorded in app_meta, so only the first worker after an
+    index change pays for the create_index calls. The version is only recorded
+    when every index and hook succeeded, so a failure is retried on the next
+    boot. Returns True if it ran.
+    """
+    meta = database["app_meta"]
+    if not force and (meta.find_one({"_id": "indexes"}) or {}).get("version") == INDEX_VERSION:
+        return False
+    failed = 0
+    for name, spec, kwargs in INDEXES:
+        failed += not safe_index(database[name], spec, **kwargs)
+    for name, fn in INDEX_HOOKS:
+        try:
+            fn(database[name])
+        except Exception as e:
+            failed += 1
+            print(f"[index] {name} -> {e}", flush=True)
+    if failed:
+        print(f"[index] {failed} index step(s) failed; version {INDEX_VERSION} not recorded, will retry", flush=True)
+        return True
+    meta.update_one({"_id": "indexes"}, {"$set": {"version": INDEX_VERSION, "updatedAt": datetime.utcnow()}},
+                    upsert=True)
+    return True
+
+# ---- Startup phases / readiness ----
+_startup = {"phases": [], "ready": False, "error": None}
+
+@contextmanager
+def _phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _startup["phases"].append({"phase": name, "ms": round((time.perf_counter() - t0) * 1000, 1)})
 
-# Equipment helpful indexes
-safe_index(equipment_col, [("category", ASCENDING)])
-safe_index(equipment_col, [("available", ASCENDING)])
-safe_index(equipment_col, [("location.city", ASCENDING)])
-safe_index(equipment_col, [("price.day", ASCENDING)])
-safe_index(equipment_col, [("rating", DESCENDING)])
-safe_index(equipment_col, [("title", "text"), ("features", "text")])
+def _phase_report(phases):
+    return " · ".join(f"{p['phase']} {p['ms']}ms" for p in phases)
 
-# Notifications / bookings indexes
-safe_index(notifications, [("userId", ASCENDING), ("createdAt", DESCENDING)])
-safe_index(bookings, [("equipmentId", ASCENDING), ("createdAt", DESCENDING)])
+def _bootstrap(app, retry=True):
+    """
+    Deferred setup that needs the database: ping, indexes (once per
+    deployment), admin seed. In background mode it retries with backoff until
+    Atlas is reachable; /api/health/ready reports 503 until it succeeds.
+    """
+    attempt = 0
+    while True:
+        mark = len(_startup["phases"])
+        try:
+            with _phase("mongo_ping"):
+                client.admin.command("ping")
+            with _phase("indexes"):
+                created = ensure_indexes(db)
+            with _phase("admin_seed"), app.app_context():
+                ensure_admin(mongo)
+            _startup.update(ready=True, error=None)
+            print(f"✅ Connected to MongoDB · DB='{db.name}' · indexes {'created' if created else 'up to date'} · "
+                  f"{_phase_report(_startup['phases'][mark:])}", flush=True)
+            return
+        except Exception as e:
+            _startup["error"] = f"{type(e).__name__}: {e}"
+            if not retry:
+                raise RuntimeError(f"❌ MongoDB bootstrap failed: {e}") from e
+            attempt += 1
+            delay = min(60, 2 ** attempt)
+            print(f"[startup] bootstrap failed ({_startup['error']}); retrying in {delay}s", flush=True)
+            time.sleep(delay)
+
+def create_app(config=None):
+    """
+    Build the Flask app. No network I/O happens here: the shared Mongo client
+    connects lazily, the Gemini SDK is imported on the first AI call
+    (ai_gateway), and ping / indexes / admin seed run in _bootstrap according
+    to INDEX_SETUP. Per-phase timings are printed and served by /api/health/ready.
 
-# AI session indexes
-safe_index(ai_sessions, [("userId", ASCENDING), ("updatedAt", DESCENDING)])
+    config: optional dict of overrides (MONGO_URI, DB_NAME, INDEX_SETUP, TESTING, ...)
+    """
+    _startup.update(phases=[], ready=False, error=None)
+    t0 = time.perf_counter()
+    app = Flask(__name__)
+
+    with _phase("config"):
+        app.config.update(
+            MONGO_URI=MONGO_URI,
+            DB_NAME=DB_NAME,
+            INDEX_SETUP=INDEX_SETUP,
+            MONGO_PROFILE=MONGO_PROFILE,             # pool limits, see db.PROFILES
+            # ---- File uploads / static serving for certification docs ----
+            UPLOAD_FOLDER=UPLOAD_ROOT,                # <backend>/uploads unless UPLOAD_FOLDER is set; see storage.py
+            MAX_CONTENT_LENGTH=6 * 1024 * 1024,       # ~6 MB guardrail
+        )
+        app.config.update(config or {})
+        if not app.config["MONGO_URI"]:
+            raise RuntimeError(
+                "MONGO_URI is missing. Example:\n"
+                "mongodb+srv://<user>:<pass>@farmunity.x7hhyxj.mongodb.net/farmunity"
+            )
+        os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+        # In production, lock origins to your exact frontend origin
+        CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+
+    with _phase("mongo_client"):
+        # One shared client (db.py) for app.py, the blueprints and the job scheduler
+        mongo.init_app(app)
+        bind_db(mongo.cx, app.config["DB_NAME"])
+        init_query_stats(app)  # per-route command counts, slow-query log, query budget
+
+    with _phase("blueprints"):
+        init_profiling(app)  # first, so the api before_request (JWT decode) falls inside profiles
+        app.register_blueprint(api)
+        app.register_blueprint(prices_today_bp)
+        app.register_blueprint(price_history_bp)
+        app.register_blueprint(price_alerts_bp)
+        app.register_blueprint(certs_bp)  # <--- certification endpoints
+        app.register_blueprint(uploads_bp)  # GET /uploads/<path> (caching, Range, proxy offload, signed private docs)
+        app.register_blueprint(upload_sessions_bp)  # resumable document uploads
+        init_metrics(app)  # GET /api/metrics (Prometheus); request latency/status/size, in-flight and SSE gauges
+
+    # ---- Background jobs (off unless JOBS_ENABLED is set) ----
+    with _phase("scheduler"):
+        start_scheduler(db)
+
+    setup = app.config["INDEX_SETUP"]
+    if setup == "sync":
+        _bootstrap(app, retry=False)
+    elif setup == "background":
+        threading.Thread(target=_bootstrap, args=(app,), name="bootstrap", daemon=True).start()
+    else:
+        _startup["ready"] = True
 
-# NEW: forum indexes
-safe_index(discussions, [("createdAt", DESCENDING)])
-safe_index(discussions, [("title", "text"), ("text", "text"), ("category", "text")])
+    _startup["createAppMs"] = round((time.perf_counter() - t0) * 1000, 1)
+    print(f"[startup] create_app {_startup['createAppMs']}ms ({_phase_report(_startup['phases'])}) "
+          f"· setup={setup}", flush=True)
+    return app
 
 # ---- Helpers ----
 def oid(x):
@@ -175,7 +302,7 @@ def decode_jwt_from_request():
     u["_id"] = str(u["_id"])
     return {"_id": u["_id"], "email": u.get("email"), "role": u.get("role", "buyer"), "name": u.get("name")}
 
-@app.before_request
+@api.before_app_request
 def attach_request_user():
     """
     Populate request.user for downstream blueprints (e.g., certs.py).
@@ -377,32 +504,74 @@ BEHAVIOR
 - Provide brief, actionable steps and a short checklist when helpful.
 """.strip()
 
-def ai_history_to_gemini(history):
-    """
-    Convert our history array to Gemini format.
-    history: [{role: 'user'|'assistant', 'content': '...'}]
-    """
-    out = []
-    for m in history or []:
-        role = "user" if m.get("role") == "user" else "model"
-        out.append({"role": role, "parts": [{"text": m.get("content","")}]})
-    return out
-
 # ---- Health ----
-@app.get("/api/health")
+@api.get("/api/health")
 def health():
+    """Liveness: the process is up and serving; never touches the database."""
     return {"status": "ok"}
 
-@app.get("/api/health/db")
+@api.get("/api/health/ready")
+def health_ready():
+    """Readiness: deferred setup finished and Mongo answers a ping. 503 otherwise."""
+    body = {"ready": _startup["ready"], "createAppMs": _startup.get("createAppMs"),
+            "phases": _startup["phases"], "indexVersion": INDEX_VERSION}
+    if not _startup["ready"]:
+        body["error"] = _startup["error"]
+        return body, 503
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        body.update(ready=False, error=str(e))
+        return body, 503
+    return body
+
+@api.get("/api/health/db")
 def health_db():
     try:
         client.admin.command("ping")
-        return {"ok": True, "db": DB_NAME}
+        return {"ok": True, "db": db.name}
     except Exception as e:
         return {"ok": False, "error": str(e)}, 500
 
+# Internal stats below: admin session or METRICS_TOKEN bearer (metrics.internal_required)
+@api.get("/api/health/mongo")
+@internal_required
+def health_mongo():
+    """Shared Mongo pool: profile/limits, checkout wait histogram, in-use and open connections."""
+    return mongo.stats()
+
+@api.get("/api/health/queries")
+@internal_required
+def health_queries():
+    """Mongo commands per route: counts, latency histogram, commands per request, over-budget requests."""
+    return query_stats()
+
+@api.get("/api/health/ai")
+@internal_required
+def health_ai():
+    """AI gateway state: provider, breaker, queue depth, in-flight calls, latency."""
+    return get_gateway().stats()
+
+@api.get("/api/health/weather")
+@internal_required
+def health_weather():
+    """Weather cache entries, in-flight fetches and hit/miss/stale counters."""
+    return weather_cache_stats()
+
+@api.get("/api/health/http")
+@internal_required
+def health_http():
+    """Outbound HTTP latency histograms / error counts per upstream host."""
+    return get_http().stats()
+
+@api.get("/api/health/jobs")
+@internal_required
+def health_jobs():
+    """Background job intervals and last-run outcome in this process."""
+    return to_jsonable(jobs_stats())
+
 # ---- Auth ----
-@app.post("/api/auth/signup")
+@api.post("/api/auth/signup")
 def signup():
     body = request.get_json(force=True)
     name = (body.get("name") or "").strip()
@@ -439,7 +608,7 @@ def signup():
     except Exception:
         return jsonify({"error": "Email already registered"}), 409
 
-@app.post("/api/auth/login")
+@api.post("/api/auth/login")
 def login():
     body = request.get_json(force=True)
     email = (body.get("email") or "").lower().strip()
@@ -460,13 +629,13 @@ def login():
     token = make_token(user["_id"], user["role"])
     return jsonify({"token": token, "user": serialize_user(user)}), 200
 
-@app.get("/api/auth/me")
+@api.get("/api/auth/me")
 @token_required
 def me():
     return jsonify({"user": serialize_user(g.current_user)})
 
 # ---- User profile (update current user) ----
-@app.put("/api/users/me")
+@api.put("/api/users/me")
 @token_required
 def update_me():
     body = request.get_json(force=True)
@@ -497,14 +666,14 @@ def update_me():
     return jsonify({"user": serialize_user(user)}), 200
 
 # ---- Protected sample ----
-@app.get("/api/secure/sample")
+@api.get("/api/secure/sample")
 @token_required
 def secure_sample():
     u = serialize_user(g.current_user)
     return jsonify({"message": f"Hello {u['name']}!", "role": u["role"]})
 
 # ---- CROPS: real-time from Mongo (protected) ----
-@app.get("/api/crops")
+@api.get("/api/crops")
 @token_required
 def get_crops():
     q = (request.args.get("q") or "").strip()
@@ -553,7 +722,7 @@ def get_crops():
     items = [serialize_crop(d) for d in docs]
     return jsonify({"items": items, "total": total, "skip": skip, "limit": limit})
 
-@app.post("/api/crops")
+@api.post("/api/crops")
 @token_required
 def create_crop():
     """Create a crop listing (owner = current user)."""
@@ -619,7 +788,7 @@ def inquiries_map_for_owner_crops(owner_id, crop_ids):
     return dict(out)
 
 # ---- Farmer's own crops (with inquiries & status) ----
-@app.get("/api/crops/mine")
+@api.get("/api/crops/mine")
 @token_required
 def my_crops():
     uid = g.current_user["_id"]
@@ -650,7 +819,7 @@ def my_crops():
     return jsonify({"items": items})
 
 # ---- Delete crop (owner only) ----
-@app.delete("/api/crops/<id>")
+@api.delete("/api/crops/<id>")
 @token_required
 def delete_crop(id):
     try:
@@ -665,7 +834,7 @@ def delete_crop(id):
     return jsonify({"ok": True})
 
 # ---- Dashboard summary (protected) ----
-@app.get("/api/dashboard/summary")
+@api.get("/api/dashboard/summary")
 @token_required
 def dashboard_summary():
     uid = g.current_user["_id"]
@@ -683,7 +852,7 @@ def dashboard_summary():
 # =============================
 
 # Public listing (no auth required for browsing)
-@app.get("/api/equipment")
+@api.get("/api/equipment")
 def list_equipment():
     """
     Query params (all optional):
@@ -751,7 +920,7 @@ def list_equipment():
         "hasMore": page * limit < total
     })
 
-@app.get("/api/equipment/<id>")
+@api.get("/api/equipment/<id>")
 def get_equipment(id):
     try:
         doc = equipment_col.find_one({"_id": oid(id)})
@@ -762,7 +931,7 @@ def get_equipment(id):
     return jsonify(serialize_equipment(to_jsonable(doc)))
 
 # Create equipment (Farmer only)
-@app.post("/api/equipment")
+@api.post("/api/equipment")
 @token_required
 def create_equipment():
     if (g.current_user.get("role") or "").lower() != "farmer":
@@ -803,7 +972,7 @@ def create_equipment():
     return jsonify({"item": serialize_equipment(to_jsonable(doc))}), 201
 
 # --- My equipment (owner-only list) ---
-@app.get("/api/equipment/mine")
+@api.get("/api/equipment/mine")
 @token_required
 def my_equipment():
     uid = g.current_user["_id"]
@@ -817,7 +986,7 @@ def my_equipment():
     return jsonify({"items": items})
 
 # Update equipment (owner only)
-@app.put("/api/equipment/<id>")
+@api.put("/api/equipment/<id>")
 @token_required
 def update_equipment(id):
     try:
@@ -848,7 +1017,7 @@ def update_equipment(id):
     return jsonify({"item": serialize_equipment(to_jsonable(doc))})
 
 # Delete equipment (owner only)
-@app.delete("/api/equipment/<id>")
+@api.delete("/api/equipment/<id>")
 @token_required
 def delete_equipment(id):
     try:
@@ -863,7 +1032,7 @@ def delete_equipment(id):
     return jsonify({"ok": True})
 
 # Realtime stream (MongoDB change streams; requires replica set/Atlas)
-@app.get("/api/equipment/stream")
+@api.get("/api/equipment/stream")
 def equipment_stream():
     def gen():
         try:
@@ -873,10 +1042,10 @@ def equipment_stream():
                     yield f"data: {json.dumps(payload)}\n\n"
         except Exception:
             yield "event: error\ndata: {}\n\n"
-    return Response(gen(), mimetype="text/event-stream")
+    return Response(track_stream("equipment", gen()), mimetype="text/event-stream")
 
 # ===== Book Now -> notify owner + open chat =====
-@app.post("/api/equipment/<id>/request")
+@api.post("/api/equipment/<id>/request")
 @token_required
 def request_equipment(id):
     me = g.current_user
@@ -967,7 +1136,7 @@ def request_equipment(id):
     }), 201
 
 # ---- Notifications ----
-@app.get("/api/notifications")
+@api.get("/api/notifications")
 @token_required
 def my_notifications():
     me = g.current_user["_id"]
@@ -982,7 +1151,7 @@ def my_notifications():
 # =============================
 #        CHAT ENDPOINTS
 # =============================
-@app.post("/api/chat/start")
+@api.post("/api/chat/start")
 @token_required
 def chat_start():
     body = request.get_json(force=True)
@@ -1027,7 +1196,7 @@ def chat_start():
         }
     })
 
-@app.get("/api/chat/conversations")
+@api.get("/api/chat/conversations")
 @token_required
 def chat_conversations():
     me = oid_str(g.current_user["_id"])
@@ -1053,7 +1222,7 @@ def chat_conversations():
         })
     return jsonify({"conversations": out})
 
-@app.get("/api/chat/messages/<conversation_id>")
+@api.get("/api/chat/messages/<conversation_id>")
 @token_required
 def chat_messages(conversation_id):
     me = oid_str(g.current_user["_id"])
@@ -1074,7 +1243,7 @@ def chat_messages(conversation_id):
         "createdAt": m["createdAt"],
     } for m in msgs]})
 
-@app.post("/api/chat/messages")
+@api.post("/api/chat/messages")
 @token_required
 def chat_send_message():
     body = request.get_json(force=True)
@@ -1121,7 +1290,7 @@ def chat_send_message():
 # =============================
 #     COMMUNITY DISCUSSIONS
 # =============================
-@app.get("/api/forum/discussions")
+@api.get("/api/forum/discussions")
 def forum_list():
     """
     Public list of discussions.
@@ -1148,7 +1317,7 @@ def forum_list():
     total = discussions.count_documents(filt)
     return jsonify({"items": items, "total": total, "skip": skip, "limit": limit})
 
-@app.get("/api/forum/discussions/<id>")
+@api.get("/api/forum/discussions/<id>")
 def forum_get(id):
     try:
         doc = discussions.find_one({"_id": oid(id)})
@@ -1158,7 +1327,7 @@ def forum_get(id):
         return jsonify({"error": "Not found"}), 404
     return jsonify({"item": serialize_discussion(to_jsonable(doc))})
 
-@app.post("/api/forum/discussions")
+@api.post("/api/forum/discussions")
 @token_required
 def forum_create():
     """
@@ -1185,7 +1354,7 @@ def forum_create():
     doc["_id"] = res.inserted_id
     return jsonify({"item": serialize_discussion(to_jsonable(doc))}), 201
 
-@app.post("/api/forum/discussions/<id>/replies")
+@api.post("/api/forum/discussions/<id>/replies")
 @token_required
 def forum_reply(id):
     """
@@ -1230,14 +1399,44 @@ def forum_reply(id):
 # =============================
 #      AI ASSISTANT (Gemini)
 # =============================
-@app.post("/api/ai/ask")
+# Sessions hold only a summary; each turn is its own ai_messages document:
+#   { sessionId, userId, role: 'user'|'assistant', content, ts }
+AI_SESSION_SUMMARY_FIELDS = {"userId": 1, "title": 1, "createdAt": 1, "updatedAt": 1, "messagesCount": 1}
+AI_HISTORY_LIMIT = int(os.getenv("AI_HISTORY_LIMIT", "40"))
+
+def _ai_append_message(session, role, content, title=None):
+    now = datetime.utcnow()
+    ai_messages.insert_one({
+        "sessionId": session["_id"],
+        "userId": session["userId"],
+        "role": role,
+        "content": content,
+        "ts": now,
+    })
+    upd = {"updatedAt": now}
+    if title:
+        upd["title"] = title
+    ai_sessions.update_one({"_id": session["_id"]}, {"$inc": {"messagesCount": 1}, "$set": upd})
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _ai_cursor_encode(m):
+    # "<ts epoch ms>_<message id>" of the oldest message already returned
+    return f"{(m['ts'] - _EPOCH) // timedelta(milliseconds=1)}_{m['_id']}"
+
+def _ai_cursor_decode(cursor):
+    ms, _id = cursor.split("_", 1)
+    return _EPOCH + timedelta(milliseconds=int(ms)), ObjectId(_id)
+
+@api.post("/api/ai/ask")
 @token_required
 def ai_ask():
     """
     Body: { "message": str, "sessionId": optional str }
     Returns: { "sessionId": str, "reply": str }
     """
-    if not GOOGLE_API_KEY:
+    gateway = get_gateway()
+    if not gateway.configured:
         return jsonify({"error": "GOOGLE_API_KEY not configured on server"}), 500
 
     body = request.get_json(force=True)
@@ -1247,10 +1446,13 @@ def ai_ask():
     if not text:
         return jsonify({"error": "message is required"}), 400
 
-    # Load/create session
+    # Load/create session (summary only; messages live in ai_messages)
     if session_id:
         try:
-            session = ai_sessions.find_one({"_id": oid(session_id), "userId": g.current_user["_id"]})
+            session = ai_sessions.find_one(
+                {"_id": oid(session_id), "userId": g.current_user["_id"]},
+                AI_SESSION_SUMMARY_FIELDS
+            )
         except Exception:
             return jsonify({"error": "Invalid sessionId"}), 400
     else:
@@ -1259,135 +1461,44 @@ def ai_ask():
     if not session:
         session_doc = {
             "userId": g.current_user["_id"],
-            "messages": [],  # [{role, content, ts}]
+            "messagesCount": 0,
             "createdAt": datetime.utcnow(),
             "updatedAt": datetime.utcnow(),
             "title": None
         }
         ins = ai_sessions.insert_one(session_doc)
-        session_id = oid_str(ins.inserted_id)
-        session = ai_sessions.find_one({"_id": ins.inserted_id})
+        session = {**session_doc, "_id": ins.inserted_id}
+
+    # Prior turns for context (most recent AI_HISTORY_LIMIT, oldest first)
+    history = list(
+        ai_messages.find({"sessionId": session["_id"]}, {"_id": 0, "role": 1, "content": 1})
+        .sort([("ts", DESCENDING), ("_id", DESCENDING)])
+        .limit(AI_HISTORY_LIMIT)
+    )[::-1]
 
     # Append user message
-    ai_sessions.update_one(
-        {"_id": session["_id"]},
-        {"$push": {"messages": {"role": "user", "content": text, "ts": datetime.utcnow()}},
-         "$set": {"updatedAt": datetime.utcnow(),
-                  "title": session.get("title") or (text[:50] + ("..." if len(text) > 50 else ""))}}
-    )
+    _ai_append_message(session, "user", text,
+                       title=session.get("title") or (text[:50] + ("..." if len(text) > 50 else "")))
 
-    # Build system prompt + history
+    # Build system prompt + ask the provider
     system_prompt = build_system_prompt(g.current_user)
-    model = genai.GenerativeModel(model_name=GEMINI_MODEL, system_instruction=system_prompt)
-    history = ai_sessions.find_one({"_id": session["_id"]})["messages"]
-    g_history = ai_history_to_gemini(history)
 
     try:
-        chat = model.start_chat(history=g_history)
-        resp = chat.send_message(text, generation_config=GENERATION_CONFIG)
-        answer = (resp.text or "").strip()
-    except Exception as e:
-        return jsonify({"error": f"Gemini error: {e}"}), 500
+        answer = gateway.ask(system_prompt, history, text, generation_config=GENERATION_CONFIG)
+    except AIError as e:
+        return jsonify({"error": f"AI error: {e}"}), e.status
 
     # Save assistant reply
-    ai_sessions.update_one(
-        {"_id": session["_id"]},
-        {"$push": {"messages": {"role": "assistant", "content": answer, "ts": datetime.utcnow()}},
-         "$set": {"updatedAt": datetime.utcnow()}}
-    )
+    _ai_append_message(session, "assistant", answer)
 
     return jsonify({"sessionId": str(session["_id"]), "reply": answer})
 
 # =============================
 #           WEATHER
 # =============================
-def _owm_request(endpoint, params):
-    if not OPENWEATHER_API_KEY:
-        raise RuntimeError("OPENWEATHER_API_KEY missing")
-    url = f"https://api.openweathermap.org/data/2.5/{endpoint}"
-    p = {"appid": OPENWEATHER_API_KEY, "units": "metric", **params}
-    r = requests.get(url, params=p, timeout=12)
-    r.raise_for_status()
-    return r.json()
-
-def _resolve_current(lat=None, lon=None, q=None):
-    if lat is not None and lon is not None:
-        return _owm_request("weather", {"lat": float(lat), "lon": float(lon)})
-    elif q:
-        return _owm_request("weather", {"q": q})
-    else:
-        raise ValueError("Provide lat/lon or q")
-
-def _resolve_forecast(lat=None, lon=None, q=None):
-    if lat is not None and lon is not None:
-        return _owm_request("forecast", {"lat": float(lat), "lon": float(lon)})
-    elif q:
-        return _owm_request("forecast", {"q": q})
-    else:
-        raise ValueError("Provide lat/lon or q")
-
-def _aggregate_3days(forecast_json):
-    """
-    Input: OpenWeather 5-day/3-hour forecast JSON
-    Output: list of up to 3 day summaries [{date, min, max, rain_mm, main, desc}]
-    """
-    from collections import defaultdict, Counter
-    buckets = defaultdict(list)
-    for it in forecast_json.get("list", []):
-        dt_txt = it.get("dt_txt")  # 'YYYY-MM-DD HH:MM:SS'
-        if not dt_txt:
-            continue
-        day = dt_txt.split(" ")[0]
-        buckets[day].append(it)
-
-    out = []
-    today = datetime.utcnow().date()
-    for i, day in enumerate(sorted(buckets.keys())):
-        # Skip "today" partial day; take next 3 calendar days total including today if early enough
-        d_date = datetime.strptime(day, "%Y-%m-%d").date()
-        if d_date < today:
-            continue
-        temps = [x["main"]["temp"] for x in buckets[day] if x.get("main")]
-        rains = []
-        for x in buckets[day]:
-            # rain can be {'3h': mm}
-            mm = (x.get("rain") or {}).get("3h", 0.0)
-            if isinstance(mm, (int, float)):
-                rains.append(float(mm))
-        mains = [ (x.get("weather") or [{}])[0].get("main") for x in buckets[day] ]
-        descs = [ (x.get("weather") or [{}])[0].get("description") for x in buckets[day] ]
-        if not temps:
-            continue
-        main = Counter([m for m in mains if m]).most_common(1)[0][0] if mains else None
-        desc = Counter([d for d in descs if d]).most_common(1)[0][0] if descs else None
-        out.append({
-            "date": day,
-            "min": round(min(temps), 1),
-            "max": round(max(temps), 1),
-            "rain_mm": round(sum(rains), 1) if rains else 0.0,
-            "main": main,
-            "desc": desc
-        })
-        if len(out) == 3:
-            break
-    return out
-
-def _format_location_from_owm(cur):
-    name = cur.get("name")
-    sys = cur.get("sys") or {}
-    country = sys.get("country")
-    coord = cur.get("coord") or {}
-    return {
-        "display": ", ".join([x for x in [name, country] if x]),
-        "lat": coord.get("lat"),
-        "lon": coord.get("lon"),
-        "name": name,
-        "country": country
-    }
-
 # --- NEW: Weather endpoints used by the frontend ---
 
-@app.get("/api/weather/now")
+@api.get("/api/weather/now")
 def weather_now():
     """
     Public endpoint used by api.weatherNow({ lat, lon, q }).
@@ -1398,30 +1509,44 @@ def weather_now():
     q = request.args.get("q")
 
     try:
-        cur = _resolve_current(lat=lat, lon=lon, q=q)
-        fc = _resolve_forecast(lat=lat, lon=lon, q=q)
+        bundle, cache_status = get_weather(lat=lat, lon=lon, q=q)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Weather provider error: {e}"}), 502
 
-    loc = _format_location_from_owm(cur)
-    outlook = _aggregate_3days(fc)
-    return jsonify({
-        "location": loc,
-        "current": {
-            "temp": (cur.get("main") or {}).get("temp"),
-            "feels_like": (cur.get("main") or {}).get("feels_like"),
-            "humidity": (cur.get("main") or {}).get("humidity"),
-            "pressure": (cur.get("main") or {}).get("pressure"),
-            "wind_speed": (cur.get("wind") or {}).get("speed"),
-            "wind_deg": (cur.get("wind") or {}).get("deg"),
-            "weather": (cur.get("weather") or [{}])[0]
-        },
-        "outlook3d": outlook
-    })
+    resp = jsonify(summarize_now(bundle))
+    resp.headers["X-Cache"] = cache_status
+    return resp
+
+# Each distinct location can cost up to two OpenWeather calls
+WEATHER_BATCH_MAX = int(os.getenv("WEATHER_BATCH_MAX", "20"))
+
+@api.post("/api/weather/batch")
+@token_required
+def weather_batch():
+    """
+    Auth-only batch variant of /api/weather/now for dashboards.
+    Body: { "locations": [{lat, lon} | {q}, ...] }   (max WEATHER_BATCH_MAX)
+    Returns: { items: [{key, cache, location, current, outlook3d} | {error}] }
+    in request order; locations in the same grid cell share one lookup.
+    """
+    body = request.get_json(silent=True) or {}
+    locations = body.get("locations")
+    if not isinstance(locations, list) or not locations:
+        return jsonify({"error": "locations must be a non-empty list"}), 400
+    if len(locations) > WEATHER_BATCH_MAX:
+        return jsonify({"error": f"At most {WEATHER_BATCH_MAX} locations per request"}), 400
 
-@app.get("/api/weather/advisory")
+    items = []
+    for r in get_weather_many(locations):
+        if r.get("error"):
+            items.append({"error": r["error"]})
+        else:
+            items.append({"key": r["key"], "cache": r["cache"], **summarize_now(r["bundle"])})
+    return jsonify({"items": items})
+
+@api.get("/api/weather/advisory")
 @token_required
 def weather_advisory():
     """
@@ -1433,30 +1558,20 @@ def weather_advisory():
     q = request.args.get("q")
 
     try:
-        cur = _resolve_current(lat=lat, lon=lon, q=q)
-        fc = _resolve_forecast(lat=lat, lon=lon, q=q)
+        bundle, cache_status = get_weather(lat=lat, lon=lon, q=q)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Weather provider error: {e}"}), 502
 
+    cur, fc = bundle["current"], bundle["forecast"]
     loc = _format_location_from_owm(cur)
     days = _aggregate_3days(fc)
 
-    # Very lightweight rule-based advice
-    tips = []
-    if any(d["rain_mm"] >= 5 for d in days):
-        tips.append("Rain likely — delay irrigation and keep harvested grain covered.")
-    if any(d["max"] is not None and d["max"] >= 35 for d in days):
-        tips.append("High heat — irrigate in the evening/morning; mulch to reduce evap loss.")
-    if any(d["min"] is not None and d["min"] <= 10 for d in days):
-        tips.append("Cool nights — consider row covers for nurseries/seedlings.")
-    if any((d["main"] or "").lower() in ["thunderstorm"] for d in days):
-        tips.append("Thunderstorms possible — secure shade nets and tall trellises.")
-    if not tips:
-        tips.append("No severe signals — proceed with routine field work.")
+    # Rule-based advice (general + crop-specific for the user's crops)
+    tips = advisory_tips(days, g.current_user.get("crops"))
 
-    return jsonify({
+    resp = jsonify({
         "location": loc,
         "today": {
             "temp": (cur.get("main") or {}).get("temp"),
@@ -1465,11 +1580,16 @@ def weather_advisory():
         "outlook3d": days,
         "advice": tips
     })
+    resp.headers["X-Cache"] = cache_status
+    return resp
 
-@app.get("/api/ai/sessions")
+@api.get("/api/ai/sessions")
 @token_required
 def ai_list_sessions():
-    cur = ai_sessions.find({"userId": g.current_user["_id"]}).sort("updatedAt", DESCENDING).limit(50)
+    cur = (ai_sessions
+           .find({"userId": g.current_user["_id"]}, AI_SESSION_SUMMARY_FIELDS)
+           .sort("updatedAt", DESCENDING)
+           .limit(50))
     out = []
     for s in cur:
         out.append({
@@ -1477,41 +1597,72 @@ def ai_list_sessions():
             "title": s.get("title") or "AI Session",
             "createdAt": s.get("createdAt"),
             "updatedAt": s.get("updatedAt"),
-            "messagesCount": len(s.get("messages", [])),
+            "messagesCount": int(s.get("messagesCount") or 0),
         })
     return jsonify({"sessions": out})
 
-@app.get("/api/ai/sessions/<sid>")
+@api.get("/api/ai/sessions/<sid>")
 @token_required
 def ai_get_session(sid):
+    """
+    Session summary + one page of messages (oldest first within the page).
+    Query params:
+      limit (default 50, <=200)
+      before=<cursor>   older page; use `nextCursor` from the previous response
+    """
     try:
-        s = ai_sessions.find_one({"_id": oid(sid), "userId": g.current_user["_id"]})
+        s = ai_sessions.find_one({"_id": oid(sid), "userId": g.current_user["_id"]}, AI_SESSION_SUMMARY_FIELDS)
     except Exception:
         return jsonify({"error": "Invalid id"}), 400
     if not s:
         return jsonify({"error": "Not found"}), 404
-    msgs = [{"role": m.get("role"), "content": m.get("content"), "ts": m.get("ts")} for m in s.get("messages", [])]
+
+    try:
+        limit = min(200, max(1, int(request.args.get("limit", 50))))
+    except Exception:
+        limit = 50
+
+    filt = {"sessionId": s["_id"]}
+    before = request.args.get("before")
+    if before:
+        try:
+            ts, mid = _ai_cursor_decode(before)
+        except Exception:
+            return jsonify({"error": "Invalid cursor"}), 400
+        filt["$or"] = [{"ts": {"$lt": ts}}, {"ts": ts, "_id": {"$lt": mid}}]
+
+    page = list(
+        ai_messages.find(filt, {"role": 1, "content": 1, "ts": 1})
+        .sort([("ts", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+    msgs = [{"role": m.get("role"), "content": m.get("content"), "ts": m.get("ts")} for m in reversed(page)]
     return jsonify({
         "id": oid_str(s["_id"]),
         "title": s.get("title") or "AI Session",
         "createdAt": s.get("createdAt"),
         "updatedAt": s.get("updatedAt"),
-        "messages": msgs
+        "messagesCount": int(s.get("messagesCount") or 0),
+        "messages": msgs,
+        "nextCursor": _ai_cursor_encode(page[-1]) if has_more else None
     })
 
-@app.delete("/api/ai/sessions/<sid>")
+@api.delete("/api/ai/sessions/<sid>")
 @token_required
 def ai_delete_session(sid):
     try:
-        s = ai_sessions.find_one({"_id": oid(sid), "userId": g.current_user["_id"]})
+        s = ai_sessions.find_one({"_id": oid(sid), "userId": g.current_user["_id"]}, {"_id": 1})
     except Exception:
         return jsonify({"error": "Invalid id"}), 400
     if not s:
         return jsonify({"error": "Not found"}), 404
+    ai_messages.delete_many({"sessionId": s["_id"]})
     ai_sessions.delete_one({"_id": s["_id"]})
     return jsonify({"ok": True})
 
 # ---- Main ----
 if __name__ == "__main__":
     # Consider debug=False in production
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,32 @@
+# backend/auth.py
+# Auth helpers for blueprints. app.before_request decodes the JWT and sets
+# request.user; these read it back without another users lookup.
+from flask import request, jsonify, g
+from functools import wraps
+
+def current_user():
+    # Prefer request.user (set in app.before_request), then g.current_user (used elsewhere)
+    u = getattr(request, "user", None) or getattr(g, "current_user", None)
+    if not u:
+        return None
+    # Normalize to a minimal dict with string id + role
+    uid = str(u.get("_id")) if u.get("_id") is not None else None
+    role = (u.get("role") or "").lower()
+    return {"_id": uid, "role": role, "email": u.get("email"), "name": u.get("name")}
+
+def auth_required(fn):
+    @wraps(fn)
+    def wrap(*args, **kwargs):
+        if not current_user():
+            return jsonify({"error": "Unauthorized"}), 401
+        return fn(*args, **kwargs)
+    return wrap
+
+def admin_required(fn):
+    @wraps(fn)
+    def wrap(*args, **kwargs):
+        u = current_user()
+        if not u or u.get("role") != "admin":
+            return jsonify({"error": "Admin only"}), 403
+        return fn(*args, **kwargs)
+    return wrap
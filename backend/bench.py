@@ -0,0 +1,256 @@
+# bench.py  (run from backend folder)
+# Endpoint latency benchmark against a seeded local mongod.
+#
+#   python bench.py [--uri mongodb://127.0.0.1:27017] [--db farmunity_bench]
+#                   [--users 2000 --crops 20000 ...] [--workers 4] [--reseed]
+#                   [-n 200] [--warmup 20] [--concurrency 1] [--only chat.,prices.]
+#                   [--base-url http://127.0.0.1:5000] [--out bench_results.jsonl] [--fail-over 20]
+#
+# The database is (re)seeded with synth.generate() when it is empty or was
+# seeded with other volumes; the volumes/seed are recorded in bench_meta. Requests run
+# in-process through create_app() and the Flask test client (app + Mongo, no
+# WSGI server), or against a running server with --base-url (same JWT_SECRET).
+#
+# Every run appends one JSON line to --out: commit, volumes, and per endpoint
+# p50/p95/p99/mean/max ms, error count and Mongo commands per request (from the
+# Server-Timing header). The table printed at the end compares p95 with the
+# previous run of the same volumes; --fail-over PCT exits 1 if any endpoint's
+# p95 got more than PCT% slower.
+import argparse, json, math, os, platform, random, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Per-request query accounting stays on (it feeds the queries column) but the
+# slow-query / budget log lines would drown the output
+os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+os.environ.setdefault("QUERY_BUDGET", "1000000000")
+
+import synth
+
+ap = argparse.ArgumentParser(description="Benchmark hot API endpoints against a seeded database")
+ap.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://127.0.0.1:27017"))
+ap.add_argument("--db", default=os.getenv("BENCH_DB_NAME", "farmunity_bench"))
+ap.add_argument("--force", action="store_true", help="allow a database name without 'bench' in it")
+ap.add_argument("--reseed", action="store_true", help="drop and seed even if the volumes match")
+ap.add_argument("--seed", type=int, default=42)
+ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes used to seed")
+for k, v in synth.VOLUMES.items():
+  ap.add_argument(f"--{k.replace('_', '-')}", dest=k, type=int, default=v)
+ap.add_argument("-n", "--requests", type=int, default=200, help="measured requests per endpoint")
+ap.add_argument("--warmup", type=int, default=20)
+ap.add_argument("--concurrency", type=int, default=1)
+ap.add_argument("--only", default="", help="comma-separated endpoint name prefixes")
+ap.add_argument("--base-url", default="", help="benchmark a running server instead of in-process")
+ap.add_argument("--out", default="bench_results.jsonl")
+ap.add_argument("--fail-over", type=float, default=0, help="exit 1 if any p95 regressed by more than this %%")
+args = ap.parse_args()
+
+if "bench" not in args.db and not args.force:
+  sys.exit(f"Refusing to drop/seed '{args.db}': use a *bench* database name or --force")
+
+volumes = {k: getattr(args, k) for k in synth.VOLUMES}
+
+import app as api_app
+
+app = api_app.create_app({"MONGO_URI": args.uri, "DB_NAME": args.db, "INDEX_SETUP": "off", "TESTING": True})
+db = api_app.db
+
+
+# ---------------- Seed ----------------
+def seed_if_needed():
+  marker = {"volumes": volumes, "seed": args.seed, "skew": synth.SKEW}
+  meta = db.bench_meta.find_one({"_id": "seed"}) or {}
+  if not args.reseed and {k: meta.get(k) for k in marker} == marker:
+    print(f"Using existing seed in {args.db}", flush=True)
+    api_app.ensure_indexes(db)
+    return
+  print(f"Seeding {args.db} {volumes} ...", flush=True)
+  t0 = time.perf_counter()
+  db.client.drop_database(args.db)
+  counts = synth.generate(db, volumes, seed=args.seed, workers=args.workers, uri=args.uri,
+                          log=lambda m: print("  " + m, flush=True))
+  api_app.ensure_indexes(db, force=True)
+  db.bench_meta.replace_one({"_id": "seed"}, {**marker, "counts": counts, "seededAt": datetime.utcnow()}, upsert=True)
+  print(f"Seeded in {time.perf_counter() - t0:.1f}s", flush=True)
+
+seed_if_needed()
+
+
+# ---------------- Fixtures ----------------
+def top(coll, field, n=20, unwind=False):
+  pipe = ([{"$unwind": f"${field}"}] if unwind else []) + [
+    {"$group": {"_id": f"${field}", "n": {"$sum": 1}}}, {"$sort": {"n": -1}}, {"$limit": n}]
+  return [r["_id"] for r in coll.aggregate(pipe, allowDiskUse=True)]
+
+def token_for(uid):
+  u = db.users.find_one({"_id": uid}, {"role": 1})
+  return api_app.make_token(uid, (u or {}).get("role") or "buyer")
+
+rng = random.Random(args.seed)
+sample_users = [u["_id"] for u in db.users.aggregate([{"$sample": {"size": 50}}])]
+inbox_users = top(db.conversations, "participants", unwind=True)
+sellers = top(db.crops, "createdBy")
+notified = top(db.notifications, "userId")
+threads = []
+for cid in top(db.messages, "conversationId"):
+  c = db.conversations.find_one({"_id": api_app.oid(cid)}, {"participants": 1})
+  if c:
+    threads.append((cid, c["participants"][0]))
+tokens = {uid: token_for(uid) for uid in set(sample_users + inbox_users + sellers + notified + [p for _, p in threads])}
+states = synth._states()
+today = date.today()
+
+def any_user():
+  return tokens[rng.choice(sample_users)]
+
+def thread_request():
+  cid, participant = rng.choice(threads)
+  return f"/api/chat/messages/{cid}", tokens[participant]
+
+# name -> () -> (path, bearer token or None)
+ENDPOINTS = {
+  "crops.list": lambda: ("/api/crops", any_user()),
+  "crops.search": lambda: (f"/api/crops?q={rng.choice(['oni', 'Whe', 'Pune', 'User 1'])}", any_user()),
+  "crops.filter": lambda: ("/api/crops?category=vegetables&minPrice=20&maxPrice=80&sort=price&order=asc", any_user()),
+  "crops.mine": lambda: ("/api/crops/mine", tokens[rng.choice(sellers)]),
+  "equipment.list": lambda: (f"/api/equipment?page={rng.randint(1, 5)}", None),
+  "equipment.search": lambda: (f"/api/equipment?q={rng.choice(['tractor', 'drone', 'pump', 'harvester'])}", None),
+  "equipment.filter": lambda: (f"/api/equipment?category=Tractors&city={rng.choice(synth.CITIES)[0]}&sort=price:asc", None),
+  "chat.inbox": lambda: ("/api/chat/conversations", tokens[rng.choice(inbox_users)]),
+  "chat.thread": thread_request,
+  "notifications": lambda: ("/api/notifications", tokens[rng.choice(notified)]),
+  "forum.list": lambda: (f"/api/forum/discussions?skip={rng.randint(0, 4) * 20}", None),
+  "forum.search": lambda: (f"/api/forum/discussions?q={rng.choice(['irrigation', 'pest', 'market'])}", None),
+  "prices.today": lambda: (f"/api/prices/today?state={rng.choice(states)}&type={rng.choice(['wholesale', 'retail'])}", None),
+  "prices.matrix": lambda: ("/api/prices/matrix", None),
+  "prices.history": lambda: (f"/api/prices/history?from={(today - timedelta(days=364)).isoformat()}&to={today.isoformat()}"
+                             f"&crop={rng.choice(synth.CROPS)}&interval=weekly", None),
+}
+if not threads:
+  ENDPOINTS.pop("chat.thread")
+if args.only:
+  prefixes = [p.strip() for p in args.only.split(",") if p.strip()]
+  ENDPOINTS = {k: v for k, v in ENDPOINTS.items() if any(k.startswith(p) for p in prefixes)}
+
+
+# ---------------- Runner ----------------
+def make_caller():
+  if args.base_url:
+    import requests
+    s = requests.Session()
+    def call(path, token):
+      r = s.get(args.base_url.rstrip("/") + path, headers={"Authorization": f"Bearer {token}"} if token else {})
+      return r.status_code, r.headers.get("Server-Timing", "")
+    return call
+  client = app.test_client()
+  def call(path, token):
+    r = client.get(path, headers={"Authorization": f"Bearer {token}"} if token else {})
+    r.close()
+    return r.status_code, r.headers.get("Server-Timing", "")
+  return call
+
+def queries_of(server_timing):
+  # db;dur=3.1;desc="4 queries"
+  for part in server_timing.split(","):
+    if part.strip().startswith("db;") and 'desc="' in part:
+      try:
+        return int(part.split('desc="', 1)[1].split(" ", 1)[0])
+      except ValueError:
+        return None
+  return None
+
+def pct(sorted_ms, p):
+  if not sorted_ms:
+    return None
+  k = max(0, min(len(sorted_ms) - 1, math.ceil(p / 100 * len(sorted_ms)) - 1))  # nearest rank
+  return round(sorted_ms[k], 2)
+
+_local = threading.local()
+
+def one(fn):
+  call = getattr(_local, "call", None)
+  if call is None:
+    call = _local.call = make_caller()
+  path, token = fn()
+  t0 = time.perf_counter()
+  status, timing = call(path, token)
+  return (time.perf_counter() - t0) * 1000, status, queries_of(timing)
+
+def bench(name, fn):
+  with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+    list(pool.map(lambda _: one(fn), range(args.warmup)))
+    samples = list(pool.map(lambda _: one(fn), range(args.requests)))
+  ms = sorted(s[0] for s in samples)
+  qs = [s[2] for s in samples if s[2] is not None]
+  return {
+    "n": len(ms),
+    "p50": pct(ms, 50), "p95": pct(ms, 95), "p99": pct(ms, 99),
+    "mean": round(sum(ms) / len(ms), 2) if ms else None, "max": round(ms[-1], 2) if ms else None,
+    "errors": sum(1 for s in samples if s[1] >= 400),
+    "queries": round(sum(qs) / len(qs), 1) if qs else None,
+  }
+
+def git_commit():
+  try:
+    sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], stderr=subprocess.DEVNULL) != 0
+    return sha + ("-dirty" if dirty else "")
+  except Exception:
+    return None
+
+def previous_run():
+  if not os.path.exists(args.out):
+    return None
+  last = None
+  with open(args.out, "r", encoding="utf-8") as f:
+    for line in f:
+      try:
+        rec = json.loads(line)
+      except ValueError:
+        continue
+      if rec.get("volumes") == volumes and rec.get("seed") == args.seed and rec.get("target") == target:
+        last = rec
+  return last
+
+
+target = args.base_url or "in-process"
+prev = previous_run()
+results = {}
+for name, fn in ENDPOINTS.items():
+  results[name] = r = bench(name, fn)
+  print(f"  {name:<18} p50 {r['p50']:>8} p95 {r['p95']:>8} p99 {r['p99']:>8} ms"
+        f"  q/req {r['queries'] if r['queries'] is not None else '-':>6}  errors {r['errors']}", flush=True)
+
+record = {
+  "ts": datetime.utcnow().isoformat() + "Z",
+  "commit": git_commit(),
+  "target": target,
+  "python": platform.python_version(),
+  "volumes": volumes,
+  "seed": args.seed,
+  "requests": args.requests,
+  "concurrency": args.concurrency,
+  "results": results,
+}
+with open(args.out, "a", encoding="utf-8") as f:
+  f.write(json.dumps(record) + "\n")
+print(f"Results appended to {args.out}")
+
+regressed = []
+if prev:
+  print(f"\np95 vs {prev.get('commit')} ({prev.get('ts')}):")
+  for name, r in results.items():
+    old = (prev["results"].get(name) or {}).get("p95")
+    if not old or r["p95"] is None:
+      continue
+    delta = (r["p95"] - old) / old * 100
+    flag = ""
+    if args.fail_over and delta > args.fail_over:
+      regressed.append(name)
+      flag = "  <-- regression"
+    print(f"  {name:<18} {old:>8} -> {r['p95']:>8} ms ({delta:+.0f}%){flag}")
+if regressed:
+  sys.exit(f"p95 regressed by more than {args.fail_over}% on: {', '.join(regressed)}")
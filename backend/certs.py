@@ -1,47 +1,25 @@
 # backend/certs.py
-from flask import Blueprint, request, jsonify, current_app, g
+from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
-from datetime import datetime
-from functools import wraps
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
 import hashlib, os
 
 from db import mongo
+from auth import current_user as _current_user, auth_required, admin_required
+from notify import ensure_notification_indexes, insert_notifications, make_notification
+from storage import content_key, get_storage
+from upload_sessions import completed_document
+from uploads import sign_documents
 
 bp = Blueprint("certs", __name__)
 
 ALLOWED_EXTS = {"pdf", "jpg", "jpeg", "png"}
-MAX_MB = 5  # soft limit; relies on app.config["MAX_CONTENT_LENGTH"] for hard cap
-
-
-# ---------------- Auth helpers ----------------
-def _current_user():
-    # Prefer request.user (set in app.before_request), then g.current_user (used elsewhere)
-    u = getattr(request, "user", None) or getattr(g, "current_user", None)
-    if not u:
-        return None
-    # Normalize to a minimal dict with string id + role
-    uid = str(u.get("_id")) if u.get("_id") is not None else None
-    role = (u.get("role") or "").lower()
-    return {"_id": uid, "role": role, "email": u.get("email"), "name": u.get("name")}
-
-def auth_required(fn):
-    @wraps(fn)
-    def wrap(*args, **kwargs):
-        if not _current_user():
-            return jsonify({"error": "Unauthorized"}), 401
-        return fn(*args, **kwargs)
-    return wrap
-
-def admin_required(fn):
-    @wraps(fn)
-    def wrap(*args, **kwargs):
-        u = _current_user()
-        if not u or u.get("role") != "admin":
-            return jsonify({"error": "Admin only"}), 403
-        return fn(*args, **kwargs)
-    return wrap
-# ------------------------------------------------
+MAX_MB = 5  # per file; app.config["MAX_CONTENT_LENGTH"] caps the whole request
+UPLOAD_CHUNK = 64 * 1024
+# Owners are notified this many days before a certificate expires
+CERT_EXPIRY_NOTICE_DAYS = int(os.getenv("CERT_EXPIRY_NOTICE_DAYS", "30"))
 
 
 # ---------------- Utils ----------------
@@ -51,50 +29,83 @@ def _oid(x):
 def _allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTS
 
-def _sha256_of(path):
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return "sha256:" + h.hexdigest()
-
 def _save_file(file_storage, subdir):
+    """
+    Stream the upload to a temp file, hashing as it goes, then store it under
+    its content hash (storage.content_key). Re-uploading identical bytes
+    reuses the stored file.
+    """
     if not file_storage or file_storage.filename == "":
         return None, "No file uploaded"
 
     if not _allowed_file(file_storage.filename):
         return None, "Only PDF/JPG/PNG allowed"
 
-    # soft size check from Content-Length of this part if available
-    try:
-        file_storage.stream.seek(0, os.SEEK_END)
-        size = file_storage.stream.tell()
-        file_storage.stream.seek(0)
-        if size and size > MAX_MB * 1024 * 1024:
-            return None, f"File exceeds {MAX_MB} MB"
-    except Exception:
-        # If we cannot measure, rely on Flask's MAX_CONTENT_LENGTH
-        pass
-
+    # secure_filename drops non-ASCII characters ("बिल.pdf" -> "pdf"), so the
+    # extension comes from the validated original name
+    ext = file_storage.filename.rsplit(".", 1)[1].lower()
     filename = secure_filename(file_storage.filename)
-    root = current_app.config.get("UPLOAD_FOLDER") or os.path.join(os.getcwd(), "uploads")
-    folder = os.path.join(root, subdir)
-    os.makedirs(folder, exist_ok=True)
+    if not filename.lower().endswith("." + ext):
+        filename = f"document.{ext}"
+    storage = get_storage()
 
-    # unique filename
-    ts = int(datetime.utcnow().timestamp())
-    name = f"{ts}_{filename}"
-    path = os.path.join(folder, name)
-    file_storage.save(path)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = storage.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK), b""):
+                size += len(chunk)
+                if size > MAX_MB * 1024 * 1024:
+                    raise ValueError(f"File exceeds {MAX_MB} MB")
+                h.update(chunk)
+                out.write(chunk)
+        if not size:
+            raise ValueError("Empty file")
+
+        digest = h.hexdigest()
+        key = content_key(subdir, digest, ext)
+        storage.put_file(tmp, key)  # no-op if the same content is already stored
+    except ValueError as e:
+        os.remove(tmp)
+        return None, str(e)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
     meta = {
-        "url": f"/uploads/{subdir}/{name}",
-        "hash": _sha256_of(path),
+        "url": storage.url(key),
+        "hash": "sha256:" + digest,
+        "name": filename,
+        "size": size,
     }
     return meta, None
 # ------------------------------------------------
 
 
+def _parse_cert_date(value, field):
+    """'YYYY-MM-DD' (or a full ISO timestamp) -> datetime; empty -> None; else ValueError."""
+    if value is None or isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"{field} must be YYYY-MM-DD")
+
+def _cert_out(cert):
+    """Certification as returned to clients: signed document URLs, dates as YYYY-MM-DD."""
+    if not cert:
+        return cert
+    cert = sign_documents(cert)
+    return {**cert, **{f: cert[f].strftime("%Y-%m-%d") for f in ("issueDate", "expiryDate")
+                       if isinstance(cert.get(f), datetime)}}
+# ------------------------------------------------
+
+
 # ============ Seller upload ============
 
 @bp.post("/api/equipment/<eqid>/certs")
@@ -121,25 +132,38 @@ def submit_certs(eqid):
     if str(owner_id) != str(user["_id"]):
         return jsonify({"error": "Forbidden"}), 403
 
-    # 3) Validate files present
+    # 3) Validate files present (multipart file, or a finalized resumable upload id)
     invoice = request.files.get("invoice")
     certificate = request.files.get("certificate")
-    if not invoice or not certificate:
+    invoice_upload = (request.form.get("invoiceUploadId") or "").strip()
+    certificate_upload = (request.form.get("certificateUploadId") or "").strip()
+    if not (invoice or invoice_upload) or not (certificate or certificate_upload):
         return jsonify({"error": "Both invoice and certificate required"}), 400
 
     # 4) Save files
-    inv_meta, err = _save_file(invoice, "invoices")
+    if invoice:
+        inv_meta, err = _save_file(invoice, "invoices")
+    else:
+        inv_meta, err = completed_document(invoice_upload, user["_id"], "invoice")
     if err:
         return jsonify({"error": err}), 400
-    cert_meta, err = _save_file(certificate, "certs")
+    if certificate:
+        cert_meta, err = _save_file(certificate, "certs")
+    else:
+        cert_meta, err = completed_document(certificate_upload, user["_id"], "certificate")
     if err:
         return jsonify({"error": err}), 400
 
     # 5) Extra fields
     issuer = (request.form.get("issuer") or "").strip() or "Not specified"
     certificate_no = (request.form.get("certificateNo") or "").strip()
-    issue_date = (request.form.get("issueDate") or "").strip()
-    expiry_date = (request.form.get("expiryDate") or "").strip()
+    try:
+        issue_date = _parse_cert_date(request.form.get("issueDate"), "issueDate")
+        expiry_date = _parse_cert_date(request.form.get("expiryDate"), "expiryDate")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if issue_date and expiry_date and expiry_date < issue_date:
+        return jsonify({"error": "expiryDate must be after issueDate"}), 400
 
     # 6) Upsert certification
     cert_obj = {
@@ -163,24 +187,97 @@ def submit_certs(eqid):
         {"$set": {"certification": cert_obj, "updatedAt": datetime.utcnow()}}
     )
 
-    return jsonify({"ok": True, "certification": cert_obj}), 200
+    return jsonify({"ok": True, "certification": _cert_out(cert_obj)}), 200
 
 
 # ============ Admin list/approve ============
 
+QUEUE_PAGE_SIZE = 50
+QUEUE_MAX_PAGE_SIZE = 200
+BULK_MAX_ITEMS = 1000
+CERT_STATUSES = ("pending", "certified", "rejected", "expired")
+_EPOCH = datetime(1970, 1, 1)
+
+def _queue_cursor_encode(doc):
+    # "<updatedAt epoch ms>_<equipment id>" of the last item returned
+    return f"{(doc['updatedAt'] - _EPOCH) // timedelta(milliseconds=1)}_{doc['_id']}"
+
+def _queue_cursor_decode(cursor):
+    ms, _id = cursor.split("_", 1)
+    return _EPOCH + timedelta(milliseconds=int(ms)), ObjectId(_id)
+
+def _decision_update(approve, notes, expiry_date):
+    """(status, $set) for an admin decision; ValueError on a bad expiryDate."""
+    expiry_date = _parse_cert_date(expiry_date, "expiryDate")
+    status = "certified" if approve else "rejected"
+    upd = {
+        "certification.status": status,
+        "certification.verifiedBy": _current_user()["_id"],
+        "certification.verifiedAt": datetime.utcnow().isoformat(),
+        "certification.notes": notes,
+    }
+    if expiry_date:
+        upd["certification.expiryDate"] = expiry_date
+    return status, upd
+
+
 @bp.get("/api/admin/certs/pending")
 @admin_required
 def list_pending():
-    cur = mongo.db.equipment.find(
-        {"certification.status": "pending"},
-        {"title": 1, "owner": 1, "certification": 1}
+    """
+    Oldest-first page of the certification queue
+    (index: certification.status + updatedAt + _id).
+    Query params:
+      status=pending|certified|rejected|expired   default: pending
+      issuer=<exact issuer>
+      minAgeDays / maxAgeDays                     age of the submission
+      limit (<= 200, default 50), cursor          from the previous nextCursor
+    Returns: { items, nextCursor }
+    """
+    status = (request.args.get("status") or "pending").strip().lower()
+    if status not in CERT_STATUSES:
+        return jsonify({"error": "Invalid status"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit") or QUEUE_PAGE_SIZE), 1), QUEUE_MAX_PAGE_SIZE)
+        min_age = int(request.args.get("minAgeDays") or 0)
+        max_age = int(request.args.get("maxAgeDays") or 0)
+    except ValueError:
+        return jsonify({"error": "limit, minAgeDays and maxAgeDays must be integers"}), 400
+
+    filt = {"certification.status": status, "updatedAt": {"$type": "date"}}
+    now = datetime.utcnow()
+    if min_age:
+        filt["updatedAt"]["$lte"] = now - timedelta(days=min_age)
+    if max_age:
+        filt["updatedAt"]["$gte"] = now - timedelta(days=max_age)
+    issuer = (request.args.get("issuer") or "").strip()
+    if issuer:
+        filt["certification.issuer"] = issuer
+
+    cursor = (request.args.get("cursor") or "").strip()
+    if cursor:
+        try:
+            ts, last_id = _queue_cursor_decode(cursor)
+        except Exception:
+            return jsonify({"error": "Invalid cursor"}), 400
+        filt["$or"] = [{"updatedAt": {"$gt": ts}}, {"updatedAt": ts, "_id": {"$gt": last_id}}]
+
+    page = list(
+        mongo.db.equipment.find(filt, {"title": 1, "owner": 1, "certification": 1, "updatedAt": 1})
+        .sort([("updatedAt", ASCENDING), ("_id", ASCENDING)])
+        .limit(limit + 1)
     )
+    has_more = len(page) > limit
+    page = page[:limit]
+    next_cursor = _queue_cursor_encode(page[-1]) if has_more else None
+
     items = []
-    for it in cur:
+    for it in page:
         it["_id"] = str(it["_id"])
+        it["certification"] = _cert_out(it.get("certification"))
         # keep a light payload for the UI
         items.append(it)
-    return jsonify({"items": items})
+    return jsonify({"items": items, "nextCursor": next_cursor})
 
 
 @bp.post("/api/admin/certs/<eqid>/approve")
@@ -191,19 +288,10 @@ def approve_or_reject(eqid):
     Body: { approve: bool, notes?: str, expiryDate?: 'YYYY-MM-DD' }
     """
     body = request.get_json(force=True) or {}
-    approve = bool(body.get("approve", True))
-    notes = body.get("notes")
-    expiry_date = body.get("expiryDate")
-
-    status = "certified" if approve else "rejected"
-    upd = {
-        "certification.status": status,
-        "certification.verifiedBy": _current_user()["_id"],
-        "certification.verifiedAt": datetime.utcnow().isoformat(),
-        "certification.notes": notes,
-    }
-    if expiry_date:
-        upd["certification.expiryDate"] = expiry_date
+    try:
+        status, upd = _decision_update(bool(body.get("approve", True)), body.get("notes"), body.get("expiryDate"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
         res = mongo.db.equipment.update_one({"_id": _oid(eqid)}, {"$set": upd})
@@ -213,3 +301,99 @@ def approve_or_reject(eqid):
     if res.matched_count == 0:
         return jsonify({"error": "Equipment not found"}), 404
     return jsonify({"ok": True, "status": status})
+
+
+@bp.post("/api/admin/certs/bulk")
+@admin_required
+def bulk_decide():
+    """
+    Approve/reject many pending certifications in one bulk_write.
+    Body: { ids: [eqid...], approve: bool, notes?: str }
+       or { items: [{ id, approve, notes?, expiryDate? }...] }
+    Only items still pending are changed.
+    Returns: { ok, matched, modified, invalid: [ids with a bad id or expiryDate],
+               errors: [{ index, status: 400, error }] }  (one per invalid item)
+    """
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "JSON object body required"}), 400
+    items = body.get("items")
+    if items is None:
+        ids = body.get("ids")
+        if not isinstance(ids, list):
+            return jsonify({"error": "ids must be a list"}), 400
+        items = [{"id": i, "approve": body.get("approve", True), "notes": body.get("notes")} for i in ids]
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "ids or items required"}), 400
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_MAX_ITEMS} items per request"}), 400
+
+    ops, invalid, errors = [], [], []
+    for i, it in enumerate(items):
+        if not isinstance(it, dict):
+            invalid.append(it)
+            errors.append({"index": i, "status": 400, "error": "item must be an object"})
+            continue
+        try:
+            _id = ObjectId(str(it.get("id")))
+        except Exception:
+            invalid.append(it.get("id"))
+            errors.append({"index": i, "status": 400, "error": "Invalid id"})
+            continue
+        try:
+            _, upd = _decision_update(bool(it.get("approve", True)), it.get("notes"), it.get("expiryDate"))
+        except ValueError as e:
+            invalid.append(it.get("id"))
+            errors.append({"index": i, "status": 400, "error": str(e)})
+            continue
+        ops.append(UpdateOne({"_id": _id, "certification.status": "pending"}, {"$set": upd}))
+
+    matched = modified = 0
+    if ops:
+        res = mongo.db.equipment.bulk_write(ops, ordered=False)
+        matched, modified = res.matched_count, res.modified_count
+    return jsonify({"ok": True, "matched": matched, "modified": modified, "invalid": invalid, "errors": errors})
+
+
+# ============ Expiry sweeper ============
+
+def sweep_cert_expiry(db):
+    """
+    Job (jobs.py: cert_expiry). Both steps are range scans on the
+    certification.expiryDate index:
+      - owners of certified items expiring within CERT_EXPIRY_NOTICE_DAYS get
+        one notice per (item, expiry date), inserted in batches (notify.py)
+      - certified items past their expiry date move to "expired" in one update_many
+    expiryDate is stored as 00:00 UTC of the last valid day (_parse_cert_date),
+    so both steps compare against the start of today, not the current time.
+    """
+    ensure_notification_indexes(db)
+    now = datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    soon = db.equipment.find(
+        {"certification.expiryDate": {"$gte": today, "$lte": today + timedelta(days=CERT_EXPIRY_NOTICE_DAYS)},
+         "certification.status": "certified"},
+        {"title": 1, "owner.userId": 1, "certification.expiryDate": 1},
+    )
+
+    def docs():
+        for eq in soon.batch_size(1000):
+            owner = (eq.get("owner") or {}).get("userId")
+            if not owner:
+                continue
+            exp = eq["certification"]["expiryDate"]
+            days = (exp - today).days
+            yield make_notification(
+                owner, "cert_expiry", "Certificate expiring soon",
+                f"The certificate for \"{eq.get('title') or 'your equipment'}\" expires on {exp:%Y-%m-%d}"
+                + (f" ({days} days left)." if days else " (today)."),
+                metadata={"equipmentId": str(eq["_id"]), "expiryDate": exp.strftime("%Y-%m-%d")},
+                dedupe_key=f"cert_expiry:{eq['_id']}:{exp:%Y-%m-%d}",
+            )
+
+    notices = insert_notifications(db, docs())
+    res = db.equipment.update_many(
+        {"certification.expiryDate": {"$lt": today}, "certification.status": "certified"},
+        {"$set": {"certification.status": "expired", "certification.expiredAt": now}},
+    )
+    return {"expired": res.modified_count, "notices": notices["inserted"], "duplicates": notices["duplicates"]}
@@ -1,5 +1,178 @@
 # backend/db.py
-from flask_pymongo import PyMongo
-from flask import Flask
+"""
+The process-wide MongoClient.
 
-mongo = PyMongo()
+app.py, the blueprints (`from db import mongo`; mongo.db) and the job runner
+all share this one client, so each process holds a single connection pool to
+the cluster. Pool limits come from a deployment profile (MONGO_PROFILE) with
+per-setting env overrides:
+
+  MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_MS,
+  MONGO_WAIT_QUEUE_TIMEOUT_MS
+
+A pool event listener keeps checkout wait times, in-use / open connection
+counts and checkout failures; mongo.stats() returns them (/api/health/mongo).
+Command events go to query_stats.monitor (per-route query accounting).
+"""
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+from http_client import HostStats
+from query_stats import monitor as query_monitor
+
+# Pool settings per deployment profile
+PROFILES = {
+    # gunicorn/flask workers: bounded pool, fail fast when exhausted
+    "web": {"maxPoolSize": 50, "minPoolSize": 0, "maxIdleTimeMS": 60_000, "waitQueueTimeoutMS": 2_000},
+    # background jobs / ingest: few connections, patient checkouts
+    "worker": {"maxPoolSize": 10, "minPoolSize": 0, "maxIdleTimeMS": 300_000, "waitQueueTimeoutMS": 30_000},
+    # free/shared Atlas tiers and many small instances: keep the connection count low
+    "small": {"maxPoolSize": 5, "minPoolSize": 0, "maxIdleTimeMS": 10_000, "waitQueueTimeoutMS": 5_000},
+}
+MONGO_PROFILE = os.getenv("MONGO_PROFILE", "web").strip().lower()
+_ENV_OVERRIDES = {
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_MS",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+}
+
+
+def pool_options(profile=None):
+    name = (profile or MONGO_PROFILE).strip().lower()
+    if name not in PROFILES:
+        raise RuntimeError(f"Unknown MONGO_PROFILE '{name}' (expected one of {sorted(PROFILES)})")
+    opts = dict(PROFILES[name])
+    for opt, env in _ENV_OVERRIDES.items():
+        if os.getenv(env):
+            opts[opt] = int(os.getenv(env))
+    return opts
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool events -> checkout wait histogram and per-server gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checkout = HostStats()   # wait histogram; .errors = failures by reason
+        self.servers = {}             # "host:port" -> {"inUse", "open", "created", "closed", "cleared"}
+
+    def _server(self, address):
+        key = "%s:%s" % address
+        s = self.servers.get(key)
+        if s is None:
+            s = self.servers[key] = {"inUse": 0, "open": 0, "created": 0, "closed": 0, "cleared": 0}
+        return s
+
+    # checkout: started and finished events fire on the requesting thread
+    def connection_check_out_started(self, event):
+        self._local.t0 = time.perf_counter()
+
+    def _waited_ms(self, event):
+        duration = getattr(event, "duration", None)  # pymongo >= 4.7
+        if duration is not None:
+            return duration * 1000
+        t0 = getattr(self._local, "t0", None)
+        return (time.perf_counter() - t0) * 1000 if t0 is not None else 0.0
+
+    def connection_checked_out(self, event):
+        ms = self._waited_ms(event)
+        with self._lock:
+            self.checkout.observe(ms)
+            self._server(event.address)["inUse"] += 1
+
+    def connection_check_out_failed(self, event):
+        ms = self._waited_ms(event)
+        with self._lock:
+            self.checkout.observe(ms)
+            reason = str(event.reason)
+            self.checkout.errors[reason] = self.checkout.errors.get(reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            s = self._server(event.address)
+            s["inUse"] = max(0, s["inUse"] - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            s = self._server(event.address)
+            s["created"] += 1
+            s["open"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            s = self._server(event.address)
+            s["closed"] += 1
+            s["open"] = max(0, s["open"] - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address)["cleared"] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def as_dict(self):
+        with self._lock:
+            return {"checkoutWait": self.checkout.as_dict(),
+                    "servers": {k: dict(v) for k, v in self.servers.items()}}
+
+
+class Mongo:
+    """Drop-in for the flask_pymongo object the blueprints use (mongo.db / mongo.cx)."""
+
+    def __init__(self):
+        self.cx = None
+        self.db = None
+        self.profile = None
+        self.options = {}
+        self.pool_stats = PoolStats()
+        self._lock = threading.Lock()
+
+    def connect(self, uri, db_name=None, profile=None, **overrides):
+        """Create the shared client once; later calls return the existing database."""
+        with self._lock:
+            if self.cx is None:
+                self.profile = (profile or MONGO_PROFILE).strip().lower()
+                self.options = {**pool_options(self.profile), **overrides}
+                self.cx = MongoClient(
+                    uri,
+                    serverSelectionTimeoutMS=8000,   # fast fail if DNS/IP/auth is wrong
+                    retryWrites=True,
+                    w="majority",
+                    appname="farmunity-api",
+                    event_listeners=[self.pool_stats, query_monitor],
+                    **self.options,
+                )
+                # Always select the DB explicitly; do NOT rely on defaults
+                self.db = self.cx[db_name or "farmunity"]
+            return self.db
+
+    def close(self):
+        """Close the client (tests / forked processes); the next connect() builds a new one."""
+        with self._lock:
+            if self.cx is not None:
+                self.cx.close()
+            self.cx = self.db = None
+
+    def init_app(self, app):
+        return self.connect(app.config["MONGO_URI"], app.config.get("DB_NAME"), app.config.get("MONGO_PROFILE"))
+
+    def stats(self):
+        return {"profile": self.profile, "options": self.options, **self.pool_stats.as_dict()}
+
+
+mongo = Mongo()
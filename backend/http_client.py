@@ -0,0 +1,180 @@
+# backend/http_client.py
+"""
+Shared outbound HTTP client for external APIs (OpenWeather, future integrations).
+
+  - one requests.Session per process with a keep-alive connection pool
+  - bounded retries with exponential backoff + full jitter (connection errors,
+    timeouts, 429 and 5xx; Retry-After is honoured up to the backoff cap)
+  - per-host timeouts:  HTTP_HOST_TIMEOUTS="api.openweathermap.org=6,example.com=3"
+  - per-host latency histograms and error counters via stats()
+
+Point integrations at a local stub server by overriding their base URL
+(e.g. OPENWEATHER_BASE_URL=http://127.0.0.1:8089) — nothing here is host-specific.
+"""
+from urllib.parse import urlsplit
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))   # distinct hosts kept
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))           # sockets per host
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.2"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "2"))
+
+# Upper bounds in ms; the last bucket is +Inf
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def _parse_host_timeouts(raw):
+    out = {}
+    for part in (raw or "").split(","):
+        host, _, secs = part.strip().partition("=")
+        if host and secs:
+            try:
+                out[host.strip().lower()] = float(secs)
+            except ValueError:
+                pass
+    return out
+
+
+class HostStats:
+    __slots__ = ("buckets", "count", "sum_ms", "errors", "retries")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.errors = {}
+        self.retries = 0
+
+    def observe(self, ms):
+        self.count += 1
+        self.sum_ms += ms
+        for i, ub in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= ub:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def as_dict(self):
+        cumulative, acc = {}, 0
+        for ub, n in zip(list(LATENCY_BUCKETS_MS) + ["+Inf"], self.buckets):
+            acc += n
+            cumulative[str(ub)] = acc
+        return {
+            "count": self.count,
+            "sumMs": round(self.sum_ms, 1),
+            "buckets": cumulative,
+            "errors": dict(self.errors),
+            "retries": self.retries,
+        }
+
+
+class HttpClient:
+    def __init__(self, timeout=HTTP_TIMEOUT_SECONDS, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF_SECONDS,
+                 backoff_max=HTTP_BACKOFF_MAX_SECONDS, host_timeouts=None,
+                 pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, sleep=time.sleep):
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.host_timeouts = host_timeouts if host_timeouts is not None else _parse_host_timeouts(os.getenv("HTTP_HOST_TIMEOUTS"))
+        self.sleep = sleep
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _host_stats(self, host):
+        with self._lock:
+            st = self._stats.get(host)
+            if st is None:
+                st = self._stats[host] = HostStats()
+            return st
+
+    def _record(self, host, ms=None, error=None, retried=False):
+        st = self._host_stats(host)
+        with self._lock:
+            if ms is not None:
+                st.observe(ms)
+            if error:
+                st.errors[error] = st.errors.get(error, 0) + 1
+            if retried:
+                st.retries += 1
+
+    def _delay(self, attempt, resp=None):
+        cap = min(self.backoff_max, self.backoff * (2 ** attempt))
+        if resp is not None:
+            ra = resp.headers.get("Retry-After")
+            if ra and ra.isdigit():
+                return min(self.backoff_max, float(ra))
+        return random.uniform(0, cap)  # full jitter
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """
+        Send a request through the shared session. Retries only idempotent
+        methods. Returns the final Response (status not checked).
+        """
+        method = method.upper()
+        host = (urlsplit(url).hostname or "").lower()
+        timeout = timeout or self.host_timeouts.get(host) or self.timeout
+        retries = self.retries if retries is None else max(0, retries)
+        if method not in IDEMPOTENT:
+            retries = 0
+
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(host, (time.perf_counter() - t0) * 1000, error=type(e).__name__)
+                if attempt >= retries:
+                    raise
+                self._record(host, retried=True)
+                self.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+
+            ms = (time.perf_counter() - t0) * 1000
+            err = f"http_{resp.status_code}" if resp.status_code >= 400 else None
+            self._record(host, ms, error=err)
+            if resp.status_code in RETRY_STATUSES and attempt < retries:
+                self._record(host, retried=True)
+                self.sleep(self._delay(attempt, resp))
+                resp.close()
+                attempt += 1
+                continue
+            return resp
+
+    def get_json(self, url, params=None, **kwargs):
+        resp = self.request("GET", url, params=params, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    def stats(self):
+        with self._lock:
+            return {host: st.as_dict() for host, st in self._stats.items()}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_http():
+    """Process-wide HttpClient (lazily created so gunicorn forks get their own pool)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
@@ -0,0 +1,357 @@
+# ingest_prices.py  (run from backend folder)
+"""
+Streaming ingest for large, multi-date / multi-state price feeds.
+
+  python ingest_prices.py FEED [--format json|ndjson|csv] [--batch 1000] [--workers 4]
+                               [--rejects rejects.ndjson] [--partial] [--dry-run]
+
+FEED may be a JSON array, NDJSON or CSV file (optionally .gz); it is parsed
+incrementally, so memory stays flat regardless of file size. One flat row per
+record:
+
+  date (YYYY-MM-DD), state, crop, type (wholesale|retail), price_per_qt,
+  change_pct?, unit?, yesterday_price?, district?, market?
+
+  - state-level rows (no district/market) go through the versioned snapshot
+    path of price_ingest.py: every date in the feed gets this run's version and
+    its pointer is switched only after all of that date's rows are written and
+    cover every state/crop/type already active (--partial merges instead);
+    price alert subscriptions are then evaluated against the activated dates.
+  - district/market rows are upserted into `market_prices`
+    (unique on date+state+district+market+crop+type), so re-runs are idempotent.
+
+Writes are unordered bulk_write batches with at most 2*workers batches in
+flight. Reports rows/sec, rejects and peak RSS at the end.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import secrets
+import sys
+import threading
+import time
+
+from pymongo import ASCENDING, UpdateOne
+
+from notify import ensure_notification_indexes
+from price_alerts import ensure_alert_indexes, evaluate_alerts
+from price_history import history_ops, ensure_history_indexes
+from price_ingest import activate, ensure_snapshot_indexes, snapshot_ops
+
+TYPES = ("wholesale", "retail")
+CHUNK_CHARS = 64 * 1024
+
+
+# ---------------- Readers ----------------
+def _open_text(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def detect_format(path):
+    base = path[:-3] if path.endswith(".gz") else path
+    ext = base.rsplit(".", 1)[-1].lower() if "." in base else ""
+    return {"ndjson": "ndjson", "jsonl": "ndjson", "csv": "csv"}.get(ext, "json")
+
+def iter_json_array(f, chunk_chars=CHUNK_CHARS):
+    """Yield elements of a top-level JSON array without loading the whole file."""
+    dec = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    started = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_chars)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            if buf[pos] == "," and not started:
+                raise ValueError("Unexpected ',' before '['")
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            fill()
+            continue
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                raise ValueError("Feed must be a JSON array")
+            started = True
+            pos += 1
+            continue
+        if ch == "]":
+            return
+        try:
+            obj, end = dec.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        # a number split across chunks ("12" of "12.5") decodes "successfully";
+        # only accept a value once the next delimiter is in the buffer
+        if not eof and (end == len(buf) or buf[end] not in " \t\r\n,]"):
+            fill()
+            continue
+        pos = end
+        yield obj
+
+def iter_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_csv(f):
+    for row in csv.DictReader(f):
+        yield {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+
+READERS = {"json": iter_json_array, "ndjson": iter_ndjson, "csv": iter_csv}
+# ------------------------------------------------
+
+
+# ---------------- Validation ----------------
+def _num(v, field, required=False):
+    if v is None or v == "":
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    try:
+        n = float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+    if not math.isfinite(n):
+        raise ValueError(f"{field} must be a finite number")
+    return n
+
+def validate_row(raw):
+    """Normalized row dict, or raises ValueError with the reason."""
+    if not isinstance(raw, dict):
+        raise ValueError("row must be an object")
+    day = str(raw.get("date") or "").strip()
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("date must be YYYY-MM-DD")
+    state = str(raw.get("state") or "").strip()
+    crop = str(raw.get("crop") or "").strip()
+    typ = str(raw.get("type") or "").strip().lower()
+    if not state or not crop:
+        raise ValueError("state and crop are required")
+    if typ not in TYPES:
+        raise ValueError("type must be wholesale or retail")
+    price = _num(raw.get("price_per_qt"), "price_per_qt", required=True)
+    if price < 0:
+        raise ValueError("price_per_qt must be >= 0")
+    return {
+        "date": day,
+        "state": state,
+        "crop": crop,
+        "type": typ,
+        "price_per_qt": price,
+        "change_pct": _num(raw.get("change_pct"), "change_pct"),
+        "unit": str(raw.get("unit") or "INR_PER_QT").strip(),
+        "yesterday_price": _num(raw.get("yesterday_price"), "yesterday_price"),
+        "district": str(raw.get("district") or "").strip() or None,
+        "market": str(raw.get("market") or "").strip() or None,
+    }
+# ------------------------------------------------
+
+
+def ensure_market_indexes(db):
+    db.market_prices.create_index(
+        [("date", ASCENDING), ("state", ASCENDING), ("district", ASCENDING), ("market", ASCENDING),
+         ("crop", ASCENDING), ("type", ASCENDING)],
+        unique=True,
+    )
+
+def market_ops(rows):
+    for r in rows:
+        key = {f: r[f] for f in ("date", "state", "district", "market", "crop", "type")}
+        yield UpdateOne(key, {"$set": {f: r[f] for f in ("price_per_qt", "change_pct", "unit", "yesterday_price")}},
+                        upsert=True)
+
+def _peak_rss_mb():
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except Exception:
+        return None
+
+
+class StreamIngest:
+    def __init__(self, db, batch_size=1000, workers=4, version=None, dry_run=False, rejects=None, partial=False):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.version = version or f"s{datetime.utcnow():%Y%m%dT%H%M%S}-{secrets.token_hex(3)}"
+        self.dry_run = dry_run
+        self.rejects = rejects
+        self.partial = partial
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self.slots = threading.BoundedSemaphore(self.workers * 2)
+        self.futures = []
+        self.per_date = {}            # date -> state-level row count for this version
+        self.stats = {"read": 0, "accepted": 0, "rejected": 0, "stateRows": 0, "marketRows": 0, "batches": 0}
+        self._state_batch, self._market_batch = [], []
+
+    # -- write side --
+    def _write(self, coll, ops):
+        try:
+            if not self.dry_run:
+                self.db[coll].bulk_write(ops, ordered=False)
+        finally:
+            self.slots.release()
+
+    def _submit(self, coll, ops):
+        self.slots.acquire()      # backpressure: bounded batches in flight
+        self.stats["batches"] += 1
+        self.futures.append(self.pool.submit(self._write, coll, ops))
+        self.futures = [f for f in self.futures if not f.done() or f.exception()]
+
+    def _flush_state(self):
+        if not self._state_batch:
+            return
+        rows, self._state_batch = self._state_batch, []
+        by_date = {}
+        for r in rows:
+            by_date.setdefault(r["date"], []).append(r)
+        ops = [op for day, rs in by_date.items() for op in snapshot_ops(day, self.version, rs)]
+        self._submit("state_prices_today", ops)
+
+    def _flush_market(self):
+        if self._market_batch:
+            rows, self._market_batch = self._market_batch, []
+            self._submit("market_prices", list(market_ops(rows)))
+
+    # -- read side --
+    def reject(self, raw, reason):
+        self.stats["rejected"] += 1
+        if self.rejects:
+            self.rejects.write(json.dumps({"reason": reason, "row": raw}, default=str) + "\n")
+
+    def add(self, raw):
+        self.stats["read"] += 1
+        try:
+            row = validate_row(raw)
+        except ValueError as e:
+            self.reject(raw, str(e))
+            return
+        self.stats["accepted"] += 1
+        if row["district"] or row["market"]:
+            self.stats["marketRows"] += 1
+            self._market_batch.append(row)
+            if len(self._market_batch) >= self.batch_size:
+                self._flush_market()
+        else:
+            self.stats["stateRows"] += 1
+            self.per_date[row["date"]] = self.per_date.get(row["date"], 0) + 1
+            self._state_batch.append(row)
+            if len(self._state_batch) >= self.batch_size:
+                self._flush_state()
+
+    def run(self, records):
+        if not self.dry_run:
+            ensure_snapshot_indexes(self.db)
+            ensure_market_indexes(self.db)
+            ensure_history_indexes(self.db.price_history)
+            ensure_alert_indexes(self.db.price_alerts)
+            ensure_notification_indexes(self.db)
+        t0 = time.perf_counter()
+        for raw in records:
+            self.add(raw)
+        self._flush_state()
+        self._flush_market()
+        self.pool.shutdown(wait=True)
+        errors = [f.exception() for f in self.futures if f.exception()]
+        if errors:
+            raise RuntimeError(f"{len(errors)} batch(es) failed, first: {errors[0]}")
+
+        activated, failed, alerts = [], {}, {"triggered": 0, "inserted": 0}
+        if not self.dry_run:
+            for day, n in sorted(self.per_date.items()):
+                try:
+                    activate(self.db, day, self.version, n, partial=self.partial)
+                    activated.append(day)
+                except RuntimeError as e:  # duplicate state/crop/type rows, or states missing vs the active day
+                    failed[day] = str(e)
+            self._record_history(activated)
+            for day in activated:
+                res = evaluate_alerts(self.db, day, self._version_rows(day))
+                alerts["triggered"] += res["triggered"]
+                alerts["inserted"] += res["inserted"]
+
+        secs = time.perf_counter() - t0
+        return {
+            **self.stats,
+            "version": self.version,
+            "dates": len(self.per_date),
+            "activated": len(activated),
+            "activationFailed": failed,
+            "alerts": alerts,
+            "seconds": round(secs, 2),
+            "rowsPerSec": round(self.stats["read"] / secs, 1) if secs else None,
+            "peakRssMb": _peak_rss_mb(),
+        }
+
+    def _version_rows(self, day):
+        return self.db.state_prices_today.find({"date": day, "version": self.version},
+                                               {"_id": 0}).batch_size(self.batch_size)
+
+    def _record_history(self, days):
+        """History from the now-active versions, streamed back in batches."""
+        for day in days:
+            batch = []
+            for r in self._version_rows(day):
+                batch.append(r)
+                if len(batch) >= self.batch_size:
+                    self.db.price_history.bulk_write(history_ops(batch), ordered=False)
+                    batch = []
+            if batch:
+                self.db.price_history.bulk_write(history_ops(batch), ordered=False)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    ap = argparse.ArgumentParser(description="Stream a large price feed into Mongo")
+    ap.add_argument("feed", help="path to .json / .ndjson / .csv (optionally .gz), or - for stdin")
+    ap.add_argument("--format", choices=sorted(READERS))
+    ap.add_argument("--batch", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--version", help="snapshot version id (default: generated per run)")
+    ap.add_argument("--rejects", help="write rejected rows (NDJSON, with reason) to this file")
+    ap.add_argument("--partial", action="store_true",
+                    help="feed updates some states only; keep the other rows of each day's active version")
+    ap.add_argument("--dry-run", action="store_true", help="parse + validate only")
+    args = ap.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"), maxPoolSize=max(10, args.workers * 2))[os.getenv("DB_NAME", "farmunity")]
+    fmt = args.format or detect_format(args.feed)
+    rejects = open(args.rejects, "w", encoding="utf-8") if args.rejects else None
+    try:
+        with _open_text(args.feed) as f:
+            job = StreamIngest(db, batch_size=args.batch, workers=args.workers, version=args.version,
+                               dry_run=args.dry_run, rejects=rejects, partial=args.partial)
+            summary = job.run(READERS[fmt](f))
+    finally:
+        if rejects:
+            rejects.close()
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["activationFailed"] else 0)
@@ -0,0 +1,118 @@
+# backend/jobs.py
+"""
+Periodic background jobs.
+
+Every job is a function `fn(db) -> dict` (a small summary that gets logged).
+Two ways to run them:
+
+  in-process   JOBS_ENABLED=all (or a comma list of names) starts one scheduler
+               thread per API process. Needed for jobs that warm process-local
+               caches (weather_prefetch). Not compatible with gunicorn --preload.
+  cron / CLI   python jobs.py <name> [<name> ...]   runs once and exits.
+               python jobs.py --list
+
+Intervals come from env (seconds), see JOBS below.
+"""
+from datetime import datetime
+import importlib
+import os
+import sys
+import threading
+import time
+
+# name -> (module, function, interval env var, default interval seconds)
+JOBS = {
+    "weather_prefetch": ("weather", "prefetch_user_locations", "WEATHER_PREFETCH_INTERVAL", 480),
+    "weather_advisories": ("weather", "send_weather_advisories", "WEATHER_ADVISORY_INTERVAL", 3 * 3600),
+    "cert_expiry": ("certs", "sweep_cert_expiry", "CERT_EXPIRY_INTERVAL", 6 * 3600),
+    "upload_sessions_gc": ("upload_sessions", "gc_upload_sessions", "UPLOAD_SESSION_GC_INTERVAL", 3600),
+    "upload_gc": ("upload_gc", "gc_orphan_uploads", "UPLOAD_GC_INTERVAL", 24 * 3600),
+}
+
+_state = {}          # name -> {runs, lastRun, lastDurationMs, lastResult, lastError}
+_state_lock = threading.Lock()
+_scheduler = None
+
+
+def _resolve(name):
+    module, fn, _env, _default = JOBS[name]
+    return getattr(importlib.import_module(module), fn)
+
+def interval_of(name):
+    _module, _fn, env, default = JOBS[name]
+    try:
+        return max(1.0, float(os.getenv(env, default)))
+    except ValueError:
+        return float(default)
+
+def run_job(name, db):
+    """Run one job now; records its outcome and never raises."""
+    t0 = time.perf_counter()
+    result, error = None, None
+    try:
+        result = _resolve(name)(db)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    ms = round((time.perf_counter() - t0) * 1000, 1)
+    with _state_lock:
+        st = _state.setdefault(name, {"runs": 0})
+        st.update({"runs": st["runs"] + 1, "lastRun": datetime.utcnow(), "lastDurationMs": ms,
+                   "lastResult": result, "lastError": error})
+    print(f"[job] {name} {ms}ms -> {error or result}", flush=True)
+    return result, error
+
+def enabled_jobs():
+    raw = (os.getenv("JOBS_ENABLED") or "").strip()
+    if not raw:
+        return []
+    if raw.lower() == "all":
+        return list(JOBS)
+    return [n.strip() for n in raw.split(",") if n.strip() in JOBS]
+
+def start_scheduler(db, names=None):
+    """Start the in-process scheduler thread once (no-op when nothing is enabled)."""
+    global _scheduler
+    names = enabled_jobs() if names is None else names
+    if not names or _scheduler is not None:
+        return _scheduler
+
+    def loop():
+        next_at = {n: time.monotonic() for n in names}
+        while True:
+            now = time.monotonic()
+            for n in names:
+                if now >= next_at[n]:
+                    run_job(n, db)
+                    next_at[n] = time.monotonic() + interval_of(n)
+            time.sleep(max(0.5, min(next_at.values()) - time.monotonic()))
+
+    _scheduler = threading.Thread(target=loop, name="jobs", daemon=True)
+    _scheduler.start()
+    print(f"[job] scheduler started: {', '.join(names)}", flush=True)
+    return _scheduler
+
+def jobs_stats():
+    with _state_lock:
+        return {n: {"interval": interval_of(n), **_state.get(n, {"runs": 0})} for n in JOBS}
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import mongo
+
+    load_dotenv()
+    args = sys.argv[1:]
+    if not args or args[0] == "--list":
+        for n in JOBS:
+            print(f"{n:24s} every {interval_of(n):.0f}s")
+        sys.exit(0)
+    unknown = [n for n in args if n not in JOBS]
+    if unknown:
+        sys.exit(f"Unknown job(s): {', '.join(unknown)}")
+
+    db = mongo.connect(os.getenv("MONGO_URI"), os.getenv("DB_NAME", "farmunity"), profile="worker")
+    failed = False
+    for n in args:
+        _result, err = run_job(n, db)
+        failed = failed or bool(err)
+    sys.exit(1 if failed else 0)
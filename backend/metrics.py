@@ -0,0 +1,304 @@
+# backend/metrics.py
+"""
+Prometheus metrics at GET /api/metrics (text exposition format 0.0.4).
+
+Request middleware records, per (method, route template, blueprint):
+  farmunity_http_requests_total{status}         counter
+  farmunity_http_request_duration_seconds       histogram
+  farmunity_http_response_size_bytes            histogram (bodies with a known length)
+  farmunity_http_request_size_bytes_total       counter
+plus the gauges farmunity_http_requests_in_flight and
+farmunity_sse_connections{stream} (track_stream() wraps SSE generators).
+
+Upstream and database timings already kept by other modules are rendered at
+scrape time only: http_client per-host histograms (OpenWeather), the AI
+gateway (Gemini) calls/latency/queue, the Mongo pool and per-route command
+counts. The per-request cost is two perf_counter() calls, one lock and a
+couple of bisects; label values are route templates, never raw paths, so the
+series count stays bounded.
+
+  METRICS_ENABLED=0     turn the middleware and endpoint off
+  METRICS_TOKEN=...     let scrapers in with "Authorization: Bearer <token>"
+
+Access fails closed: /api/metrics and the internal /api/health/* stats
+(internal_required) answer only to the METRICS_TOKEN bearer or an admin
+session, so with no token set only admins can read them.
+"""
+from bisect import bisect_left
+from functools import wraps
+import hmac
+import os
+import threading
+import time
+
+from flask import Blueprint, Response, g, jsonify, request
+
+from auth import current_user
+from http_client import LATENCY_BUCKETS_MS
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Upper bounds; the last bucket is +Inf
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+bp = Blueprint("metrics", __name__)
+
+
+def internal_allowed():
+    """Monitoring access: the METRICS_TOKEN bearer (scrapers) or an admin session."""
+    auth = request.headers.get("Authorization", "")
+    if METRICS_TOKEN and hmac.compare_digest(auth.encode("utf-8"), f"Bearer {METRICS_TOKEN}".encode("utf-8")):
+        return True
+    u = current_user()
+    return bool(u and u.get("role") == "admin")
+
+def internal_required(fn):
+    @wraps(fn)
+    def wrap(*args, **kwargs):
+        if not internal_allowed():
+            return jsonify({"error": "Admin or metrics token required"}), 403
+        return fn(*args, **kwargs)
+    return wrap
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        acc, out = 0, []
+        for ub, n in zip(list(self.bounds) + ["+Inf"], self.counts):
+            acc += n
+            out.append((ub, acc))
+        return out
+
+
+class _Series:
+    __slots__ = ("duration", "size", "statuses", "request_bytes")
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.statuses = {}
+        self.request_bytes = 0
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}       # (method, route, blueprint) -> _Series
+        self.in_flight = 0
+        self.sse = {}           # stream -> open connections
+        self.sse_total = {}     # stream -> connections opened
+
+    def before(self):
+        g._metrics_t0 = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+
+    def after(self, response):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is None:
+            return response
+        elapsed = time.perf_counter() - t0
+        rule = request.url_rule
+        key = (request.method, rule.rule if rule else "<unmatched>", request.blueprint or "")
+        length = response.content_length
+        with self._lock:
+            self.in_flight -= 1
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = _Series()
+            s.duration.observe(elapsed)
+            if length is not None:
+                s.size.observe(length)
+            s.statuses[response.status_code] = s.statuses.get(response.status_code, 0) + 1
+            s.request_bytes += request.content_length or 0
+        return response
+
+    def teardown(self, exc):
+        # after_request is skipped when a request dies with an unhandled exception
+        if g.pop("_metrics_t0", None) is not None:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stream_opened(self, name):
+        with self._lock:
+            self.sse[name] = self.sse.get(name, 0) + 1
+            self.sse_total[name] = self.sse_total.get(name, 0) + 1
+
+    def stream_closed(self, name):
+        with self._lock:
+            self.sse[name] = max(0, self.sse.get(name, 0) - 1)
+
+    def snapshot(self):
+        with self._lock:
+            series = {}
+            for key, s in self._series.items():
+                series[key] = (s.duration.cumulative(), s.duration.sum, s.duration.count,
+                               s.size.cumulative(), s.size.sum, s.size.count,
+                               dict(s.statuses), s.request_bytes)
+            return series, self.in_flight, dict(self.sse), dict(self.sse_total)
+
+
+request_metrics = RequestMetrics()
+
+def track_stream(name, iterable):
+    """Wrap an SSE generator so farmunity_sse_connections{stream=name} counts open clients."""
+    request_metrics.stream_opened(name)
+    try:
+        yield from iterable
+    finally:
+        request_metrics.stream_closed(name)
+
+
+# ---------------- Exposition ----------------
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(**kw):
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in kw.items()) + "}" if kw else ""
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, type_, help_):
+        self.lines.append(f"# HELP {name} {help_}")
+        self.lines.append(f"# TYPE {name} {type_}")
+
+    def sample(self, name, value, **labels):
+        self.lines.append(f"{name}{_labels(**labels)} {_num(value)}")
+
+    def histogram(self, name, cumulative, total, count, **labels):
+        for ub, n in cumulative:
+            self.sample(name + "_bucket", n, **labels, le=ub if ub == "+Inf" else _num(ub))
+        self.sample(name + "_sum", total, **labels)
+        self.sample(name + "_count", count, **labels)
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _http_section(w):
+    series, in_flight, sse, sse_total = request_metrics.snapshot()
+    w.family("farmunity_http_requests_total", "counter", "HTTP requests by route and status.")
+    for (method, route, blueprint), s in series.items():
+        for status, n in sorted(s[6].items()):
+            w.sample("farmunity_http_requests_total", n, method=method, route=route, blueprint=blueprint, status=status)
+    w.family("farmunity_http_request_duration_seconds", "histogram", "Time to produce the response (streams: until headers).")
+    for (method, route, blueprint), s in series.items():
+        w.histogram("farmunity_http_request_duration_seconds", s[0], s[1], s[2],
+                    method=method, route=route, blueprint=blueprint)
+    w.family("farmunity_http_response_size_bytes", "histogram", "Response body size (when Content-Length is known).")
+    for (method, route, blueprint), s in series.items():
+        w.histogram("farmunity_http_response_size_bytes", s[3], s[4], s[5],
+                    method=method, route=route, blueprint=blueprint)
+    w.family("farmunity_http_request_size_bytes_total", "counter", "Request body bytes received.")
+    for (method, route, blueprint), s in series.items():
+        w.sample("farmunity_http_request_size_bytes_total", s[7], method=method, route=route, blueprint=blueprint)
+    w.family("farmunity_http_requests_in_flight", "gauge", "Requests currently being handled.")
+    w.sample("farmunity_http_requests_in_flight", in_flight)
+    w.family("farmunity_sse_connections", "gauge", "Open server-sent event streams.")
+    for name, n in sse.items():
+        w.sample("farmunity_sse_connections", n, stream=name)
+    w.family("farmunity_sse_connections_total", "counter", "Server-sent event streams opened.")
+    for name, n in sse_total.items():
+        w.sample("farmunity_sse_connections_total", n, stream=name)
+
+def _upstream_section(w):
+    from http_client import get_http
+
+    hosts = get_http().stats()
+    bounds = [ub / 1000 for ub in LATENCY_BUCKETS_MS] + ["+Inf"]
+    w.family("farmunity_upstream_request_duration_seconds", "histogram", "Outbound HTTP attempts by host.")
+    for host, st in hosts.items():
+        cumulative = list(zip(bounds, st["buckets"].values()))
+        w.histogram("farmunity_upstream_request_duration_seconds", cumulative, st["sumMs"] / 1000, st["count"], host=host)
+    w.family("farmunity_upstream_errors_total", "counter", "Outbound HTTP failures by host and reason.")
+    for host, st in hosts.items():
+        for reason, n in st["errors"].items():
+            w.sample("farmunity_upstream_errors_total", n, host=host, reason=reason)
+    w.family("farmunity_upstream_retries_total", "counter", "Outbound HTTP retries by host.")
+    for host, st in hosts.items():
+        w.sample("farmunity_upstream_retries_total", st["retries"], host=host)
+
+def _ai_section(w):
+    from ai_gateway import get_gateway
+
+    try:
+        st = get_gateway().stats()
+    except RuntimeError:
+        return
+    provider = st["provider"]
+    w.family("farmunity_ai_calls_total", "counter", "AI gateway calls by outcome.")
+    for outcome in ("calls", "ok", "errors", "timeouts", "rejected", "shortCircuited"):
+        w.sample("farmunity_ai_calls_total", st.get(outcome, 0), provider=provider, outcome=outcome)
+    w.family("farmunity_ai_request_duration_seconds", "summary", "Provider call time (Gemini or stub).")
+    w.sample("farmunity_ai_request_duration_seconds_sum", st.get("latencyTotalMs", 0) / 1000, provider=provider)
+    w.sample("farmunity_ai_request_duration_seconds_count", st.get("completed", 0), provider=provider)
+    w.family("farmunity_ai_in_flight", "gauge", "Provider calls running.")
+    w.sample("farmunity_ai_in_flight", st["inFlight"], provider=provider)
+    w.family("farmunity_ai_queue_depth", "gauge", "Calls waiting for a provider slot.")
+    w.sample("farmunity_ai_queue_depth", st["queueDepth"], provider=provider)
+
+def _mongo_section(w):
+    from db import mongo
+    from query_stats import query_stats
+
+    pool = mongo.pool_stats.as_dict()
+    w.family("farmunity_mongo_pool_connections", "gauge", "Mongo pool connections by server and state.")
+    for server, s in pool["servers"].items():
+        w.sample("farmunity_mongo_pool_connections", s["inUse"], server=server, state="in_use")
+        w.sample("farmunity_mongo_pool_connections", s["open"], server=server, state="open")
+    wait = pool["checkoutWait"]
+    bounds = [ub / 1000 for ub in LATENCY_BUCKETS_MS] + ["+Inf"]
+    w.family("farmunity_mongo_checkout_wait_seconds", "histogram", "Time waiting for a pooled connection.")
+    w.histogram("farmunity_mongo_checkout_wait_seconds", list(zip(bounds, wait["buckets"].values())),
+                wait["sumMs"] / 1000, wait["count"])
+    routes = query_stats()["routes"]
+    w.family("farmunity_mongo_commands_total", "counter", "Mongo commands by issuing route.")
+    for route, st in routes.items():
+        w.sample("farmunity_mongo_commands_total", st["commands"], route=route)
+    w.family("farmunity_mongo_command_seconds_total", "counter", "Total Mongo command time by issuing route.")
+    for route, st in routes.items():
+        w.sample("farmunity_mongo_command_seconds_total", st["latency"]["sumMs"] / 1000, route=route)
+
+def render_metrics():
+    w = _Writer()
+    _http_section(w)
+    _upstream_section(w)
+    _ai_section(w)
+    _mongo_section(w)
+    return w.text()
+# ------------------------------------------------
+
+
+@bp.get("/api/metrics")
+def metrics():
+    if not internal_allowed():
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+def init_metrics(app):
+    if not METRICS_ENABLED:
+        return
+    app.before_request(request_metrics.before)
+    app.after_request(request_metrics.after)
+    app.teardown_request(request_metrics.teardown)
+    app.register_blueprint(bp)
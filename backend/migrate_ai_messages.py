@@ -0,0 +1,62 @@
+# migrate_ai_messages.py  (run from backend folder)
+# Moves embedded ai_sessions.messages into the ai_messages collection and
+# adds their number to messagesCount on the session. Safe to re-run: a
+# session is only rewritten while it still has an embedded `messages` array,
+# and copies are tagged `migrated` so an interrupted run only clears its own
+# documents, never turns the new code already wrote to ai_messages.
+#
+#   python migrate_ai_messages.py [--batch 200] [--dry-run]
+import argparse, os
+from pymongo import MongoClient, ASCENDING
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME   = os.getenv("DB_NAME", "farmunity")
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--batch", type=int, default=200, help="sessions per progress line")
+ap.add_argument("--dry-run", action="store_true")
+args = ap.parse_args()
+
+client = MongoClient(MONGO_URI)
+db = client[DB_NAME]
+sessions = db.ai_sessions
+messages = db.ai_messages
+
+messages.create_index([("sessionId", ASCENDING), ("ts", ASCENDING), ("_id", ASCENDING)])
+
+migrated = moved = 0
+cur = sessions.find({"messages": {"$exists": True}}, {"userId": 1, "messages": 1, "createdAt": 1}).batch_size(args.batch)
+for s in cur:
+  embedded = s.get("messages") or []
+  docs = [{
+    "sessionId": s["_id"],
+    "userId": s.get("userId"),
+    "role": m.get("role"),
+    "content": m.get("content"),
+    "ts": m.get("ts") or s.get("createdAt"),
+    "migrated": True,
+  } for m in embedded]
+
+  if not args.dry_run:
+    # Clear any partial copy from an interrupted earlier run, then copy + unset
+    messages.delete_many({"sessionId": s["_id"], "migrated": True})
+    if docs:
+      messages.insert_many(docs, ordered=True)
+    sessions.update_one(
+      {"_id": s["_id"]},
+      {"$inc": {"messagesCount": len(docs)}, "$unset": {"messages": ""}}
+    )
+
+  migrated += 1
+  moved += len(docs)
+  if migrated % args.batch == 0:
+    print(f"... {migrated} sessions, {moved} messages", flush=True)
+
+# Sessions created without the embedded array but missing a counter
+if not args.dry_run:
+  sessions.update_many({"messagesCount": {"$exists": False}}, {"$set": {"messagesCount": 0}})
+
+print(f"{'Would migrate' if args.dry_run else 'Migrated'} {migrated} sessions, {moved} messages")
@@ -0,0 +1,59 @@
+# migrate_cert_dates.py  (run from backend folder)
+# Converts certification.issueDate / expiryDate stored as form strings into
+# datetimes (so the expiry index and sweeper see them). Empty strings become
+# null; unparseable values are reported and left alone. Safe to re-run.
+#
+#   python migrate_cert_dates.py [--batch 500] [--dry-run]
+import argparse, os
+from datetime import datetime
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME   = os.getenv("DB_NAME", "farmunity")
+FIELDS    = ("issueDate", "expiryDate")
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--batch", type=int, default=500, help="updates per bulk_write")
+ap.add_argument("--dry-run", action="store_true")
+args = ap.parse_args()
+
+client = MongoClient(MONGO_URI)
+equipment = client[DB_NAME].equipment
+
+def parse(v):
+  v = v.strip()
+  return datetime.strptime(v[:10], "%Y-%m-%d") if v else None
+
+ops, converted, bad = [], 0, []
+cur = equipment.find(
+  {"$or": [{f"certification.{f}": {"$type": "string"}} for f in FIELDS]},
+  {f"certification.{f}": 1 for f in FIELDS},
+).batch_size(args.batch)
+for eq in cur:
+  upd = {}
+  for f in FIELDS:
+    v = (eq.get("certification") or {}).get(f)
+    if not isinstance(v, str):
+      continue
+    try:
+      upd[f"certification.{f}"] = parse(v)
+    except ValueError:
+      bad.append((str(eq["_id"]), f, v))
+  if upd:
+    converted += 1
+    ops.append(UpdateOne({"_id": eq["_id"]}, {"$set": upd}))
+  if len(ops) >= args.batch:
+    if not args.dry_run:
+      equipment.bulk_write(ops, ordered=False)
+    ops = []
+    print(f"... {converted} items", flush=True)
+
+if ops and not args.dry_run:
+  equipment.bulk_write(ops, ordered=False)
+
+for _id, f, v in bad:
+  print(f"skipped {_id} {f}={v!r}")
+print(f"{'Would convert' if args.dry_run else 'Converted'} {converted} items, {len(bad)} unparseable values")
@@ -0,0 +1,68 @@
+# backend/notify.py
+"""
+Bulk notification writer shared by background jobs.
+
+Documents use the same shape as the ones app.py writes
+  { userId, type, title, message, metadata, isRead, createdAt }
+plus an optional `dedupeKey`. A unique partial index on dedupeKey makes
+re-runs idempotent: duplicates are dropped by Mongo, not checked one by one.
+"""
+from datetime import datetime
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+NOTIFY_BATCH_SIZE = 1000
+DUPLICATE_KEY = 11000
+
+
+def ensure_notification_indexes(db):
+    db.notifications.create_index(
+        [("dedupeKey", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"dedupeKey": {"$exists": True}},
+    )
+
+def make_notification(user_id, type_, title, message, metadata=None, dedupe_key=None, created_at=None):
+    doc = {
+        "userId": user_id,
+        "type": type_,
+        "title": title,
+        "message": message,
+        "metadata": metadata or {},
+        "isRead": False,
+        "createdAt": created_at or datetime.utcnow(),
+    }
+    if dedupe_key:
+        doc["dedupeKey"] = dedupe_key
+    return doc
+
+def insert_notifications(db, docs, batch_size=NOTIFY_BATCH_SIZE):
+    """
+    insert_many in unordered batches. Returns {"inserted", "duplicates"}.
+    Accepts any iterable so callers can stream documents.
+    """
+    inserted = duplicates = 0
+    batch = []
+
+    def flush():
+        nonlocal inserted, duplicates
+        if not batch:
+            return
+        try:
+            inserted += len(db.notifications.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errs = e.details.get("writeErrors", [])
+            dup = sum(1 for w in errs if w.get("code") == DUPLICATE_KEY)
+            if dup != len(errs):
+                raise
+            duplicates += dup
+            inserted += e.details.get("nInserted", 0)
+        batch.clear()
+
+    for d in docs:
+        batch.append(d)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return {"inserted": inserted, "duplicates": duplicates}
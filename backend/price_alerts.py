@@ -0,0 +1,214 @@
+# backend/price_alerts.py
+"""
+Price alert subscriptions.
+
+A subscription fires a notification when a newly ingested state price meets
+its condition:
+  above   price_per_qt crossed up to/through `threshold` (INR per quintal)
+  below   price_per_qt crossed down to/through `threshold`
+  change  |change_pct| >= `threshold` (percent, either direction)
+"Crossed" uses the row's yesterday_price when the feed has it, so a price that
+stays above the line does not fire again every day; without it the condition
+alone is used. Either way a subscription fires at most once per date
+(notification dedupeKey "price_alert:<subId>:<date>").
+
+Evaluation (evaluate_alerts) runs after each ingest. For every price row it
+asks the (key, condition, threshold) index for the threshold range that
+triggers, so only triggering subscriptions are ever read.
+
+API (auth required):
+  GET    /api/prices/alerts
+  POST   /api/prices/alerts        {state, crop, type, condition, threshold}
+  DELETE /api/prices/alerts/<id>
+"""
+from datetime import date, datetime, timedelta
+import os
+
+from bson import ObjectId
+from flask import Blueprint, request, jsonify
+from pymongo import ASCENDING, DESCENDING
+
+from auth import current_user, auth_required
+from db import mongo
+from notify import insert_notifications, make_notification
+
+bp = Blueprint("price_alerts", __name__)
+
+CONDITIONS = ("above", "below", "change")
+TYPES = ("wholesale", "retail")
+PRICE_ALERTS_PER_USER = int(os.getenv("PRICE_ALERTS_PER_USER", "50"))
+# Rows per $or query when matching prices against subscriptions
+ALERT_MATCH_BATCH = 100
+# Don't notify for back-filled dates older than this
+ALERT_MAX_AGE_DAYS = 2
+
+
+def get_coll():
+    db = mongo.db
+    if db is None:
+        raise RuntimeError("Mongo is not initialized. Ensure mongo.init_app(app) runs before registering blueprints.")
+    return db.price_alerts
+
+def ensure_alert_indexes(coll):
+    coll.create_index([("key", ASCENDING), ("condition", ASCENDING), ("threshold", ASCENDING)],
+                      partialFilterExpression={"active": True})
+    coll.create_index([("userId", ASCENDING), ("createdAt", DESCENDING)])
+
+def series_key(state, crop, typ):
+    return f"{state}|{crop}|{typ}"
+
+
+# ---------------- Evaluation ----------------
+def _clauses(row):
+    """$or clauses selecting the subscriptions this row triggers."""
+    key = series_key(row["state"], row["crop"], row["type"])
+    price, prev, change = row.get("price_per_qt"), row.get("yesterday_price"), row.get("change_pct")
+    if price is None:
+        return []
+    out = []
+    up, down = {"$lte": price}, {"$gte": price}
+    if prev is not None:
+        up["$gt"] = prev
+        down["$lt"] = prev
+    if prev is None or price > prev:
+        out.append({"key": key, "condition": "above", "threshold": up})
+    if prev is None or price < prev:
+        out.append({"key": key, "condition": "below", "threshold": down})
+    if change:
+        out.append({"key": key, "condition": "change", "threshold": {"$lte": abs(change)}})
+    return out
+
+def _message(sub, row):
+    unit = "₹{:,.0f}/qt"
+    if sub["condition"] == "change":
+        return f"{row['crop']} {row['type']} in {row['state']} moved {row['change_pct']:+.1f}% " \
+               f"(now {unit.format(row['price_per_qt'])})"
+    return f"{row['crop']} {row['type']} in {row['state']} is {unit.format(row['price_per_qt'])}, " \
+           f"{sub['condition']} your {unit.format(sub['threshold'])} alert"
+
+def _triggered(coll, rows, day):
+    """
+    Yield (subscription, row) for every subscription triggered and not yet
+    fired for day, one query per batch of rows.
+    """
+    batch = []
+
+    def match():
+        by_key = {series_key(r["state"], r["crop"], r["type"]): r for r in batch}
+        clauses = [c for r in batch for c in _clauses(r)]
+        if not clauses:
+            return
+        cur = coll.find({"active": True, "lastTriggeredDate": {"$ne": day}, "$or": clauses},
+                        {"userId": 1, "key": 1, "condition": 1, "threshold": 1})
+        for sub in cur:
+            yield sub, by_key[sub["key"]]
+
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= ALERT_MATCH_BATCH:
+            yield from match()
+            batch = []
+    if batch:
+        yield from match()
+
+def evaluate_alerts(db, day, rows):
+    """
+    Match one date's price rows against active subscriptions and write the
+    notifications in bulk. Re-ingesting a day only fires subscriptions that
+    have not fired for it yet. Returns {"triggered", "inserted", "duplicates"}
+    where triggered counts notifications actually written.
+    """
+    if datetime.strptime(day, "%Y-%m-%d").date() < date.today() - timedelta(days=ALERT_MAX_AGE_DAYS):
+        return {"triggered": 0, "inserted": 0, "duplicates": 0, "skipped": "stale date"}
+    coll = db.price_alerts
+    fired = []
+
+    def docs():
+        for sub, row in _triggered(coll, rows, day):
+            fired.append(sub["_id"])
+            yield make_notification(
+                sub["userId"], "price_alert", f"Price alert: {row['crop']}", _message(sub, row),
+                metadata={"subscriptionId": str(sub["_id"]), "date": day, "state": row["state"],
+                          "crop": row["crop"], "type": row["type"], "price_per_qt": row.get("price_per_qt"),
+                          "change_pct": row.get("change_pct")},
+                dedupe_key=f"price_alert:{sub['_id']}:{day}",
+            )
+
+    res = insert_notifications(db, docs())
+    if fired:
+        coll.update_many({"_id": {"$in": fired}},
+                         {"$set": {"lastTriggeredDate": day, "lastTriggeredAt": datetime.utcnow()}})
+    return {"triggered": res["inserted"], **res}
+# ------------------------------------------------
+
+
+def _public(sub):
+    return {
+        "id": str(sub["_id"]),
+        "state": sub["state"],
+        "crop": sub["crop"],
+        "type": sub["type"],
+        "condition": sub["condition"],
+        "threshold": sub["threshold"],
+        "active": sub.get("active", True),
+        "createdAt": sub["createdAt"].isoformat() + "Z" if sub.get("createdAt") else None,
+        "lastTriggeredDate": sub.get("lastTriggeredDate"),
+    }
+
+@bp.get("/api/prices/alerts")
+@auth_required
+def list_price_alerts():
+    me = ObjectId(current_user()["_id"])
+    cur = get_coll().find({"userId": me}).sort("createdAt", DESCENDING)
+    return jsonify({"items": [_public(s) for s in cur]})
+
+@bp.post("/api/prices/alerts")
+@auth_required
+def create_price_alert():
+    me = ObjectId(current_user()["_id"])
+    data = request.get_json(silent=True) or {}
+    state = str(data.get("state") or "").strip()
+    crop = str(data.get("crop") or "").strip()
+    typ = str(data.get("type") or "wholesale").strip().lower()
+    condition = str(data.get("condition") or "").strip().lower()
+    if not state or not crop:
+        return jsonify({"error": "state and crop are required"}), 400
+    if typ not in TYPES:
+        return jsonify({"error": "type must be wholesale or retail"}), 400
+    if condition not in CONDITIONS:
+        return jsonify({"error": "condition must be above, below or change"}), 400
+    try:
+        threshold = float(data.get("threshold"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "threshold must be a number"}), 400
+    if threshold <= 0:
+        return jsonify({"error": "threshold must be > 0"}), 400
+
+    coll = get_coll()
+    if coll.count_documents({"userId": me}) >= PRICE_ALERTS_PER_USER:
+        return jsonify({"error": f"At most {PRICE_ALERTS_PER_USER} price alerts per user"}), 400
+    doc = {
+        "userId": me,
+        "state": state,
+        "crop": crop,
+        "type": typ,
+        "condition": condition,
+        "threshold": threshold,
+        "key": series_key(state, crop, typ),
+        "active": True,
+        "createdAt": datetime.utcnow(),
+    }
+    doc["_id"] = coll.insert_one(doc).inserted_id
+    return jsonify(_public(doc)), 201
+
+@bp.delete("/api/prices/alerts/<alert_id>")
+@auth_required
+def delete_price_alert(alert_id):
+    try:
+        _id = ObjectId(alert_id)
+    except Exception:
+        return jsonify({"error": "Invalid id"}), 400
+    res = get_coll().delete_one({"_id": _id, "userId": ObjectId(current_user()["_id"])})
+    if not res.deleted_count:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"ok": True})
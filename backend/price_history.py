@@ -0,0 +1,202 @@
+# backend/price_history.py
+"""
+Historical state prices.
+
+Storage: one bucket document per (state, crop, type, month) in `price_history`
+  { _id: "Karnataka|Onion|wholesale|2026-10", state, crop, type, month: "2026-10",
+    unit, prices: { "01": 2150.0, "02": 2180.0, ... } }
+so a year for every state/crop/type is ~12 small documents per series, and a
+re-ingest of a day just overwrites `prices.<dd>` (idempotent upserts).
+
+API:
+  GET /api/prices/history?from=YYYY-MM-DD&to=YYYY-MM-DD
+        [&state=A,B] [&crop=Onion,Rice] [&type=wholesale|retail]
+        [&interval=daily|weekly|monthly] [&ma=<points>]
+  -> { from, to, interval, dates: [...], series: [{state, crop, type, unit, values: [...], ma?: [...]}] }
+  values[i] belongs to dates[i] (null when there is no data); weekly buckets start
+  on Monday, monthly on the 1st, and hold the mean of the daily prices.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import sys
+
+from flask import Blueprint, request, jsonify
+from pymongo import ASCENDING, UpdateOne
+
+from db import mongo
+
+bp = Blueprint("price_history", __name__)
+
+HISTORY_MAX_DAYS = 5 * 366
+INTERVALS = ("daily", "weekly", "monthly")
+
+
+def get_coll():
+    db = mongo.db
+    if db is None:
+        raise RuntimeError("Mongo is not initialized. Ensure mongo.init_app(app) runs before registering blueprints.")
+    return db.price_history
+
+def ensure_history_indexes(coll):
+    coll.create_index([("month", ASCENDING), ("state", ASCENDING), ("crop", ASCENDING), ("type", ASCENDING)])
+
+
+# ---------------- Write path ----------------
+def bucket_id(state, crop, typ, month):
+    return f"{state}|{crop}|{typ}|{month}"
+
+def history_ops(rows):
+    """
+    UpdateOne upserts for snapshot rows {date, state, crop, type, price_per_qt, unit}.
+    Rows without a price are skipped.
+    """
+    ops = []
+    for r in rows:
+        if r.get("price_per_qt") is None:
+            continue
+        month, dd = r["date"][:7], r["date"][8:10]
+        ops.append(UpdateOne(
+            {"_id": bucket_id(r["state"], r["crop"], r["type"], month)},
+            {"$set": {f"prices.{dd}": float(r["price_per_qt"]), "unit": r.get("unit", "INR_PER_QT")},
+             "$setOnInsert": {"state": r["state"], "crop": r["crop"], "type": r["type"], "month": month}},
+            upsert=True,
+        ))
+    return ops
+
+def record_history(coll, rows, batch_size=1000):
+    """Append/overwrite daily prices in the month buckets. Returns #ops written."""
+    ops = history_ops(rows)
+    for i in range(0, len(ops), batch_size):
+        coll.bulk_write(ops[i:i + batch_size], ordered=False)
+    return len(ops)
+# ------------------------------------------------
+
+
+# ---------------- Downsampling ----------------
+def _parse_day(s):
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+def _bucket_start(d, interval):
+    if interval == "weekly":
+        return d - timedelta(days=d.weekday())
+    if interval == "monthly":
+        return d.replace(day=1)
+    return d
+
+def _axis(start, end, interval):
+    out, d = [], _bucket_start(start, interval)
+    while d <= end:
+        out.append(d)
+        if interval == "daily":
+            d += timedelta(days=1)
+        elif interval == "weekly":
+            d += timedelta(days=7)
+        else:
+            d = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return out
+
+def moving_average(values, window):
+    """Trailing simple moving average over non-null points; null until `window` points are seen."""
+    out, win = [], []
+    for v in values:
+        if v is not None:
+            win.append(v)
+            if len(win) > window:
+                win.pop(0)
+        out.append(round(sum(win) / window, 2) if len(win) == window and v is not None else None)
+    return out
+# ------------------------------------------------
+
+
+def _csv_arg(name):
+    raw = (request.args.get(name) or "").strip()
+    return [x.strip() for x in raw.split(",") if x.strip()]
+
+@bp.get("/api/prices/history")
+def get_price_history():
+    try:
+        end = _parse_day(request.args.get("to") or date.today().isoformat())
+        start = _parse_day(request.args.get("from") or (end - timedelta(days=29)).isoformat())
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "from must be <= to"}), 400
+    if (end - start).days > HISTORY_MAX_DAYS:
+        return jsonify({"error": f"Range too large (max {HISTORY_MAX_DAYS} days)"}), 400
+
+    interval = (request.args.get("interval") or "daily").strip().lower()
+    if interval not in INTERVALS:
+        return jsonify({"error": "interval must be daily, weekly or monthly"}), 400
+    try:
+        ma = int(request.args.get("ma") or 0)
+    except ValueError:
+        return jsonify({"error": "ma must be an integer"}), 400
+    if ma < 0 or ma > 365:
+        return jsonify({"error": "ma must be between 0 and 365"}), 400
+
+    filt = {"month": {"$gte": start.strftime("%Y-%m"), "$lte": end.strftime("%Y-%m")}}
+    states, crops = _csv_arg("state"), _csv_arg("crop")
+    typ = (request.args.get("type") or "").strip().lower()
+    if states:
+        filt["state"] = {"$in": states}
+    if crops:
+        filt["crop"] = {"$in": crops}
+    if typ:
+        if typ not in ("wholesale", "retail"):
+            return jsonify({"error": "type must be wholesale or retail"}), 400
+        filt["type"] = typ
+
+    # series key -> {bucket start -> [sum, n]}
+    acc = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+    units = {}
+    for b in get_coll().find(filt, {"_id": 0}):
+        key = (b["state"], b["crop"], b["type"])
+        units[key] = b.get("unit")
+        for dd, price in (b.get("prices") or {}).items():
+            if price is None:
+                continue
+            d = date(int(b["month"][:4]), int(b["month"][5:7]), int(dd))
+            if start <= d <= end:
+                cell = acc[key][_bucket_start(d, interval)]
+                cell[0] += price
+                cell[1] += 1
+
+    axis = _axis(start, end, interval)
+    series = []
+    for key in sorted(acc):
+        points = acc[key]
+        values = [round(points[d][0] / points[d][1], 2) if d in points else None for d in axis]
+        item = {"state": key[0], "crop": key[1], "type": key[2], "unit": units.get(key), "values": values}
+        if ma:
+            item["ma"] = moving_average(values, ma)
+        series.append(item)
+
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "interval": interval,
+        "dates": [d.isoformat() for d in axis],
+        "series": series,
+    })
+
+
+if __name__ == "__main__":
+    # Backfill from the day snapshots already in state_prices_today:
+    #   python price_history.py backfill
+    import os
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from price_ingest import active_version, version_filter
+
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python price_history.py backfill")
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))[os.getenv("DB_NAME", "farmunity")]
+    ensure_history_indexes(db.price_history)
+    total = 0
+    for day in sorted(db.state_prices_today.distinct("date")):
+        rows = db.state_prices_today.find(version_filter(day, active_version(db, day)), {"_id": 0})
+        n = record_history(db.price_history, rows)
+        total += n
+        print(f"{day}: {n}")
+    print(f"Backfilled {total} daily prices")
@@ -0,0 +1,232 @@
+# backend/price_ingest.py
+"""
+Versioned ingestion of daily state price snapshots.
+
+Rows for a day are written under a new `version` (bulk_write upserts keyed by
+date+version+state+crop+type), verified, and only then made visible by moving
+the day's pointer in `price_meta`:
+
+  { _id: "active:<date>", date, version, previous, count, ingestedAt }
+
+A version must cover every state/crop/type of the day's active version (or,
+for a new day, of the latest earlier day); partial feeds are merged with the
+active version instead. Before the switch, an all-states matrix for the version is precomputed into
+`price_matrix` (see build_matrix) so /api/prices/matrix never aggregates rows.
+
+After the switch, price alert subscriptions are matched against the new rows
+(price_alerts.evaluate_alerts).
+
+Readers (prices_today.py) resolve the pointer first, so they see either the old
+complete version or the new complete version, never a half-written day.
+The default version id is a hash of the row contents, so re-running the same
+feed is idempotent (same version, upserts are no-ops, pointer unchanged).
+"""
+from datetime import datetime
+import hashlib
+import json
+
+from pymongo import ASCENDING, UpdateOne
+
+from notify import ensure_notification_indexes
+from price_alerts import ensure_alert_indexes, evaluate_alerts
+from price_history import record_history, ensure_history_indexes
+
+SNAPSHOT_FIELDS = ("price_per_qt", "change_pct", "unit", "yesterday_price")
+INGEST_BATCH_SIZE = 1000
+LEGACY_INDEX = "date_1_state_1_crop_1_type_1"
+
+
+def pointer_id(day):
+    return f"active:{day}"
+
+def ensure_snapshot_indexes(db):
+    coll = db.state_prices_today
+    # The pre-versioning unique index would reject a second version of a day
+    if LEGACY_INDEX in coll.index_information():
+        coll.drop_index(LEGACY_INDEX)
+    coll.create_index(
+        [("date", ASCENDING), ("version", ASCENDING), ("state", ASCENDING), ("crop", ASCENDING), ("type", ASCENDING)],
+        unique=True,
+    )
+
+def active_version(db, day):
+    """Active version id for a day; None for days ingested before versioning."""
+    p = db.price_meta.find_one({"_id": pointer_id(day)}, {"version": 1})
+    return p.get("version") if p else None
+
+def version_filter(day, version):
+    return {"date": day, "version": version} if version else {"date": day, "version": {"$exists": False}}
+
+def content_version(rows):
+    h = hashlib.sha1()
+    for r in sorted(rows, key=lambda r: (r["state"], r["crop"], r["type"])):
+        h.update(json.dumps([r["state"], r["crop"], r["type"], *[r.get(f) for f in SNAPSHOT_FIELDS]],
+                            default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def snapshot_ops(day, version, rows):
+    for r in rows:
+        key = {"date": day, "version": version, "state": r["state"], "crop": r["crop"], "type": r["type"]}
+        yield UpdateOne(key, {"$set": {f: r.get(f) for f in SNAPSHOT_FIELDS}}, upsert=True)
+
+def write_version(db, day, version, rows, batch_size=INGEST_BATCH_SIZE):
+    """Upsert rows under (day, version) in unordered batches. Returns rows written."""
+    batch, n = [], 0
+    for op in snapshot_ops(day, version, rows):
+        batch.append(op)
+        if len(batch) >= batch_size:
+            db.state_prices_today.bulk_write(batch, ordered=False)
+            n += len(batch)
+            batch = []
+    if batch:
+        db.state_prices_today.bulk_write(batch, ordered=False)
+        n += len(batch)
+    return n
+
+def matrix_id(day, version):
+    return f"{day}|{version}"
+
+def build_matrix(db, day, version):
+    """
+    Precompute the compact state x crop x type matrix for one snapshot version:
+      { _id, date, version, states: [...], crops: [...], types: [...],
+        price: {type: [...]}, change_pct: {type: [...]} }
+    Each value array is row-major by state: index = stateIdx * len(crops) + cropIdx
+    (null where the feed had no row).
+    """
+    rows = list(db.state_prices_today.find(
+        version_filter(day, version),
+        {"_id": 0, "state": 1, "crop": 1, "type": 1, "price_per_qt": 1, "change_pct": 1}
+    ))
+    states = sorted({r["state"] for r in rows})
+    crops = sorted({r["crop"] for r in rows})
+    types = [t for t in ("wholesale", "retail") if any(r["type"] == t for r in rows)]
+    si = {s: i for i, s in enumerate(states)}
+    ci = {c: i for i, c in enumerate(crops)}
+    size = len(states) * len(crops)
+    price = {t: [None] * size for t in types}
+    change = {t: [None] * size for t in types}
+    for r in rows:
+        if r["type"] not in price:
+            continue
+        i = si[r["state"]] * len(crops) + ci[r["crop"]]
+        price[r["type"]][i] = r.get("price_per_qt")
+        change[r["type"]][i] = r.get("change_pct")
+    doc = {"_id": matrix_id(day, version), "date": day, "version": version,
+           "states": states, "crops": crops, "types": types, "price": price, "change_pct": change}
+    if rows:  # don't persist matrices for dates that have no data
+        db.price_matrix.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+    return doc
+
+def _keys(db, day, version):
+    return {(r["state"], r["crop"], r["type"]) for r in db.state_prices_today.find(
+        version_filter(day, version), {"_id": 0, "state": 1, "crop": 1, "type": 1})}
+
+def coverage_reference(db, day):
+    """(day, version) the new version must cover: the day's active one, else the latest earlier active day."""
+    p = db.price_meta.find_one({"_id": pointer_id(day)}, {"version": 1})
+    if p:
+        return day, p.get("version")
+    p = db.price_meta.find_one({"_id": {"$gte": "active:", "$lt": pointer_id(day)}}, {"date": 1, "version": 1},
+                               sort=[("_id", -1)])
+    return (p["date"], p.get("version")) if p else (None, None)
+
+def merge_previous(db, day, version, prev):
+    """Copy rows of the day's previous version that the new (partial) version lacks. Returns rows copied."""
+    have = _keys(db, day, version)
+    missing = [r for r in db.state_prices_today.find(version_filter(day, prev), {"_id": 0})
+               if (r["state"], r["crop"], r["type"]) not in have]
+    return write_version(db, day, version, missing) if missing else 0
+
+def activate(db, day, version, expected_count, partial=False):
+    """
+    Verify the version is complete, then switch the day's pointer to it in one
+    single-document write. Raises RuntimeError (pointer untouched) on mismatch.
+
+    Complete means the expected row count and every state/crop/type of the
+    coverage_reference, so a feed covering some states cannot hide the others.
+    partial=True instead fills the gaps from the day's active version first.
+    """
+    count = db.state_prices_today.count_documents({"date": day, "version": version})
+    if count != expected_count:
+        raise RuntimeError(f"Version {version} for {day} has {count} rows, expected {expected_count}; not activated")
+    prev = active_version(db, day)
+    if prev == version:
+        return prev  # idempotent re-run: pointer (and readers' caches) unchanged
+    if partial:
+        if db.price_meta.find_one({"_id": pointer_id(day)}, {"_id": 1}):
+            count += merge_previous(db, day, version, prev)
+    else:
+        ref_day, ref_version = coverage_reference(db, day)
+        if ref_day:
+            gaps = _keys(db, ref_day, ref_version) - _keys(db, day, version)
+            if gaps:
+                sample = ", ".join("/".join(k) for k in sorted(gaps)[:5])
+                raise RuntimeError(f"Version {version} for {day} is missing {len(gaps)} state/crop/type rows present "
+                                   f"on {ref_day} (e.g. {sample}); not activated (use partial to merge)")
+    build_matrix(db, day, version)
+    db.price_meta.update_one(
+        {"_id": pointer_id(day)},
+        {"$set": {"date": day, "version": version, "previous": prev,
+                  "count": count, "ingestedAt": datetime.utcnow()}},
+        upsert=True,
+    )
+    return prev
+
+def ingest_snapshot(db, day, rows, version=None, partial=False):
+    """
+    Full ingest for one day: write version -> verify -> switch pointer -> history
+    -> price alerts.
+    rows: [{state, crop, type, price_per_qt, change_pct, unit?, yesterday_price?}]
+    partial: rows update some states only; the rest is carried over (see activate)
+    """
+    rows = list(rows)
+    version = version or content_version(rows)
+    ensure_snapshot_indexes(db)
+    written = write_version(db, day, version, rows)
+    prev = activate(db, day, version, len(rows), partial=partial)
+
+    ensure_history_indexes(db.price_history)
+    record_history(db.price_history, [{**r, "date": day} for r in rows])
+
+    ensure_alert_indexes(db.price_alerts)
+    ensure_notification_indexes(db)
+    alerts = evaluate_alerts(db, day, rows)
+    return {"date": day, "version": version, "previous": prev, "rows": written, "changed": prev != version,
+            "alerts": alerts}
+
+def prune_versions(db, keep_previous=True, days=None):
+    """
+    Delete inactive versions of each day, keeping the active one and (by
+    default) the previous one for rollback(). Returns deleted row count.
+    """
+    coll = db.state_prices_today
+    days = days or coll.distinct("date")
+    deleted = 0
+    for day in days:
+        p = db.price_meta.find_one({"_id": pointer_id(day)}) or {}
+        if not p.get("version"):
+            continue  # never ingested with versions; leave legacy rows alone
+        retain = [p["version"]] + ([p["previous"]] if keep_previous and p.get("previous") else [])
+        res = coll.delete_many({"date": day, "$or": [
+            {"version": {"$nin": retain}},
+            {"version": {"$exists": False}},
+        ]})
+        db.price_matrix.delete_many({"date": day, "version": {"$nin": retain}})
+        deleted += res.deleted_count
+    return deleted
+
+def rollback(db, day):
+    """Point the day back at its previous version (if still present)."""
+    p = db.price_meta.find_one({"_id": pointer_id(day)}) or {}
+    prev = p.get("previous")
+    if not prev:
+        raise RuntimeError(f"No previous version recorded for {day}")
+    count = db.state_prices_today.count_documents({"date": day, "version": prev})
+    if not count:
+        raise RuntimeError(f"Previous version {prev} for {day} was pruned")
+    db.price_meta.update_one(
+        {"_id": pointer_id(day)},
+        {"$set": {"version": prev, "previous": p["version"], "count": count, "ingestedAt": datetime.utcnow()}},
+    )
+    return prev
@@ -1,13 +1,26 @@
 # backend/prices_today.py
-from flask import Blueprint, request, jsonify
-from datetime import date
-from db import mongo 
+from flask import Blueprint, request, jsonify, Response
+from datetime import date, datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from db import mongo
+from price_ingest import active_version, build_matrix, matrix_id, pointer_id, version_filter
 
 bp = Blueprint("prices_today", __name__)
 
 # Fixed set used by UI
 CROPS = ["Wheat", "Rice", "Corn", "Tomato", "Onion", "Potato"]
 
+# How often the snapshot checks (in the background) whether the day's active
+# version pointer moved (see price_ingest.py)
+PRICES_REFRESH_SECONDS = float(os.getenv("PRICES_REFRESH_SECONDS", "60"))
+# Browser / CDN cache lifetime for price responses
+PRICES_MAX_AGE = int(os.getenv("PRICES_MAX_AGE", "300"))
+
+
 def get_coll():
     """
     Resolve the collection after the app has initialized mongo.
@@ -21,15 +34,141 @@ def get_coll():
         )
     return db.state_prices_today
 
+def get_meta_coll():
+    return get_coll().database.price_meta
+
+
+# ---------------- Process-local snapshot ----------------
+class _Snapshot:
+    """Today's prices, indexed for the two read endpoints."""
+    def __init__(self, day, marker, docs):
+        self.date = day
+        self.marker = marker
+        self.loaded_at = time.monotonic()
+        self.checked_at = self.loaded_at
+        self.states = sorted({d["state"] for d in docs})
+        self.rows = {}  # (state, type) -> {crop: item}
+        for d in docs:
+            self.rows.setdefault((d["state"], d["type"]), {})[d["crop"]] = {
+                "crop": d["crop"],
+                "price_per_qt": d.get("price_per_qt"),
+                "change_pct": d.get("change_pct"),
+                "unit": d.get("unit"),
+                "state": d["state"],
+            }
+        self.etag = hashlib.sha1(f"{day}|{marker}|{len(docs)}".encode("utf-8")).hexdigest()[:16]
+        self._matrix = None  # (etag, body) on first /api/prices/matrix request
+
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = _load_matrix(self.date, self.marker)
+        return self._matrix
+
+_snap = None
+_snap_lock = threading.Lock()
+_refreshing = threading.Event()
+
+def _read_marker(day):
+    """Active snapshot version for the day (None = legacy, unversioned rows)."""
+    meta = get_meta_coll().find_one({"_id": pointer_id(day)}, {"version": 1}) or {}
+    return meta.get("version")
+
+def _load(day):
+    marker = _read_marker(day)
+    docs = list(get_coll().find(
+        version_filter(day, marker),
+        {"_id": 0, "state": 1, "type": 1, "crop": 1, "price_per_qt": 1, "change_pct": 1, "unit": 1}
+    ))
+    return _Snapshot(day, marker, docs)
+
+def _load_matrix(day, version):
+    """(etag, compact JSON body) of the precomputed matrix; built on demand for pre-matrix days."""
+    db = get_coll().database
+    doc = db.price_matrix.find_one({"_id": matrix_id(day, version)}) or build_matrix(db, day, version)
+    doc.pop("_id", None)
+    body = json.dumps(doc, separators=(",", ":"), default=str)
+    return f"m-{hashlib.sha1(f'{day}|{version}'.encode('utf-8')).hexdigest()[:16]}", body
+
+def _background_check(snap):
+    try:
+        if _read_marker(snap.date) != snap.marker:
+            fresh = _load(snap.date)
+            global _snap
+            with _snap_lock:
+                if _snap is snap:
+                    _snap = fresh
+    except Exception as e:
+        print(f"[prices] snapshot refresh failed: {e}", flush=True)
+    finally:
+        _refreshing.clear()
+
+def snapshot():
+    """
+    Current snapshot. Mongo is only read synchronously on first use and when the
+    date rolls over; newer ingests are picked up by a background check every
+    PRICES_REFRESH_SECONDS.
+    """
+    global _snap
+    today = date.today().isoformat()
+    snap = _snap
+    if snap is None or snap.date != today:
+        with _snap_lock:
+            if _snap is None or _snap.date != today:
+                _snap = _load(today)
+            return _snap
+    if time.monotonic() - snap.checked_at >= PRICES_REFRESH_SECONDS and not _refreshing.is_set():
+        _refreshing.set()
+        snap.checked_at = time.monotonic()
+        threading.Thread(target=_background_check, args=(snap,), daemon=True).start()
+    return snap
+
+def invalidate():
+    """Drop the snapshot so the next request reloads (call after an in-process ingest)."""
+    global _snap
+    with _snap_lock:
+        _snap = None
+
+# Matrices for dates other than today: date -> (checked_at, version, etag, body)
+_MATRIX_CACHE_MAX = 64
+_matrix_cache = {}
+_matrix_lock = threading.Lock()
+
+def matrix_for(day):
+    """(etag, body) for any date; today is served from the snapshot."""
+    snap = snapshot()
+    if day == snap.date:
+        return snap.matrix()
+    now = time.monotonic()
+    with _matrix_lock:
+        hit = _matrix_cache.get(day)
+    if hit and now - hit[0] < PRICES_REFRESH_SECONDS:
+        return hit[2], hit[3]
+    version = active_version(get_coll().database, day)
+    if hit and hit[1] == version:
+        etag, body = hit[2], hit[3]
+    else:
+        etag, body = _load_matrix(day, version)
+    with _matrix_lock:
+        _matrix_cache[day] = (now, version, etag, body)
+        while len(_matrix_cache) > _MATRIX_CACHE_MAX:
+            _matrix_cache.pop(min(_matrix_cache, key=lambda k: _matrix_cache[k][0]))
+    return etag, body
+
+def _cached(payload, etag):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = f"public, max-age={PRICES_MAX_AGE}"
+    return resp.make_conditional(request)
+# ------------------------------------------------
+
+
 @bp.get("/api/states")
 def get_states():
     """
     Returns the list of states that have a snapshot for today's date.
     """
-    today = date.today().isoformat()
-    coll = get_coll()
-    states = coll.distinct("state", {"date": today})
-    return jsonify({"states": sorted(states)})
+    snap = snapshot()
+    return _cached({"states": snap.states}, f"{snap.etag}-states")
 
 @bp.get("/api/prices/today")
 def get_today_prices():
@@ -50,30 +189,10 @@ def get_today_prices():
     if typ not in ("wholesale", "retail"):
         return jsonify({"error": "type must be wholesale or retail"}), 400
 
-    today = date.today().isoformat()
-    coll = get_coll()
-
-    q = {
-        "date": today,
-        "state": state,
-        "type": typ,
-        "crop": {"$in": CROPS},
-    }
-
-    # Project only fields needed by the UI
-    projection = {
-        "_id": 0,
-        "crop": 1,
-        "price_per_qt": 1,
-        "change_pct": 1,
-        "unit": 1,
-        "state": 1,
-    }
-
-    docs = list(coll.find(q, projection).sort("crop", 1))
+    snap = snapshot()
+    found = snap.rows.get((state, typ), {})
 
     # Ensure exactly one entry per crop; fill missing with nulls so UI is stable
-    found = {d["crop"]: d for d in docs}
     items = []
     for c in CROPS:
         if c in found:
@@ -87,9 +206,34 @@ def get_today_prices():
                 "state": state
             })
 
-    return jsonify({
+    etag = f"{snap.etag}-{hashlib.sha1(f'{state}|{typ}'.encode('utf-8')).hexdigest()[:8]}"
+    return _cached({
         "state": state,
         "type": typ,
-        "date": today,
+        "date": snap.date,
         "items": items
-    })
+    }, etag)
+
+@bp.get("/api/prices/matrix")
+def get_price_matrix():
+    """
+    Every state x crop x type for a date in one compact, columnar response.
+    Query params:
+      date=YYYY-MM-DD   default: today
+    Returns:
+      { date, version, states: [...], crops: [...], types: [...],
+        price: {type: [...]}, change_pct: {type: [...]} }
+      value index = stateIdx * len(crops) + cropIdx  (null = no data)
+    """
+    day = (request.args.get("date") or date.today().isoformat()).strip()
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    etag, body = matrix_for(day)
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = f"public, max-age={PRICES_MAX_AGE}"
+    return resp.make_conditional(request)
+
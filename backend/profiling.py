@@ -0,0 +1,320 @@
+# backend/profiling.py
+"""
+Opt-in request profiling.
+
+A request is profiled when it is sampled (PROFILE_SAMPLE_RATE, 0..1) or carries
+"X-Profile: <PROFILE_KEY>". Results are aggregated per route template in this
+process and served to admins:
+
+  GET    /api/admin/profiling                      config + per-route summary
+  PUT    /api/admin/profiling {sampleRate, mode}   change this worker at runtime
+  GET    /api/admin/profiling/download?route=GET%20/api/crops
+         sample mode:   folded stacks ("a;b;c 12"), for flamegraph.pl / speedscope
+         cprofile mode: a pstats file, for snakeviz / python -m pstats
+  DELETE /api/admin/profiling                      drop collected profiles
+
+Modes (PROFILE_MODE):
+  sample    a background thread snapshots the stacks of profiled requests every
+            PROFILE_INTERVAL_MS; cheap enough for a low sample rate in production
+  cprofile  deterministic cProfile; exact call counts but slow, and only one
+            request is profiled at a time
+
+Time is also bucketed into categories (jwt, mongo, serialization, upstream,
+app) so JWT decoding in attach_request_user, bson/pymongo calls and
+to_jsonable/serialize_* stand out. The hook is installed before the api
+blueprint so its before_request (JWT decode) is inside the profile. With the
+sample rate at 0 and no X-Profile header, a request costs one dict lookup and
+the sampler thread sleeps on an Event until a profiled request arrives.
+"""
+from collections import Counter
+import cProfile
+import hmac
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+from flask import Blueprint, Response, g, jsonify, request
+
+from auth import admin_required
+
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_KEY = os.getenv("PROFILE_KEY", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "64"))
+PROFILE_MAX_ROUTES = int(os.getenv("PROFILE_MAX_ROUTES", "100"))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "5000"))  # distinct stacks kept per route
+TOP_FUNCTIONS = 20
+
+_config = {
+    "sampleRate": min(1.0, max(0.0, float(os.getenv("PROFILE_SAMPLE_RATE", "0")))),
+    "mode": (os.getenv("PROFILE_MODE") or "sample").strip().lower(),
+}
+if _config["mode"] not in PROFILE_MODES:
+    raise RuntimeError(f"Unknown PROFILE_MODE '{_config['mode']}' (expected one of {list(PROFILE_MODES)})")
+
+bp = Blueprint("profiling", __name__)
+
+
+# ---------------- Categories ----------------
+_SERIALIZERS = {"to_jsonable", "_json_default", "jsonify", "dumps", "loads"}
+
+def category(module, func):
+    if module.startswith("jwt"):
+        return "jwt"
+    if module.startswith(("pymongo", "bson")):
+        return "mongo"
+    if module.startswith(("json", "flask.json")) or func in _SERIALIZERS or func.startswith("serialize_"):
+        return "serialization"
+    if module.startswith(("requests", "urllib3", "google", "http_client", "ai_gateway")):
+        return "upstream"
+    return None
+
+def _module_of_file(filename):
+    parts = filename.replace("\\", "/").split("/")
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] in ("site-packages", "dist-packages") or parts[i].startswith("python3"):
+            return ".".join(parts[i + 1:]).rsplit(".py", 1)[0].replace(".__init__", "")
+    return parts[-1].rsplit(".py", 1)[0]
+# ------------------------------------------------
+
+
+class _RouteProfile:
+    __slots__ = ("requests", "wall_ms", "samples", "stacks", "leaves", "categories", "stats")
+
+    def __init__(self):
+        self.requests = 0
+        self.wall_ms = 0.0
+        self.samples = 0
+        self.stacks = Counter()      # folded stack -> samples
+        self.leaves = Counter()      # innermost frame -> samples
+        self.categories = Counter()  # category -> samples (sample) or seconds (cprofile)
+        self.stats = None            # pstats.Stats (cprofile)
+
+    def summary(self, mode):
+        out = {"requests": self.requests, "avgMs": round(self.wall_ms / self.requests, 1) if self.requests else None}
+        if mode == "sample":
+            total = self.samples or 1
+            out["samples"] = self.samples
+            out["categories"] = {k: round(v / total, 3) for k, v in self.categories.most_common()}
+            out["top"] = [{"frame": f, "share": round(n / total, 3)} for f, n in self.leaves.most_common(TOP_FUNCTIONS)]
+        elif self.stats is not None:
+            total = self.stats.total_tt or 1
+            out["categories"] = {k: round(v / total, 3) for k, v in self.categories.most_common()}
+            rows = sorted(self.stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:TOP_FUNCTIONS]
+            out["top"] = [{"frame": f"{_module_of_file(fn)}:{name}:{line}", "calls": nc, "selfMs": round(tt * 1000, 2),
+                           "cumMs": round(ct * 1000, 2)}
+                          for (fn, line, name), (cc, nc, tt, ct, _callers) in rows]
+        return out
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}        # route -> _RouteProfile
+        self._active = {}        # thread ident -> stacks sampled so far (sample mode)
+        self._sampler = None
+        self._wake = threading.Event()   # set while _active is non-empty
+        self._cprofile_busy = threading.Lock()
+
+    def _route_profile(self, route):
+        rp = self._routes.get(route)
+        if rp is None:
+            if len(self._routes) >= PROFILE_MAX_ROUTES:
+                return None
+            rp = self._routes[route] = _RouteProfile()
+        return rp
+
+    # ---- request hooks ----
+    def wanted(self):
+        rate = _config["sampleRate"]
+        if rate > 0 and random.random() < rate:
+            return True
+        key = request.headers.get("X-Profile")
+        return bool(key and PROFILE_KEY and hmac.compare_digest(key, PROFILE_KEY))
+
+    def before(self):
+        if not (_config["sampleRate"] > 0 or "X-Profile" in request.headers) or not self.wanted():
+            return
+        mode = _config["mode"]
+        if mode == "cprofile":
+            if not self._cprofile_busy.acquire(blocking=False):
+                return
+            prof = cProfile.Profile()
+            g._profile = (mode, time.perf_counter(), prof)
+            prof.enable()
+        else:
+            self._ensure_sampler()
+            with self._lock:
+                self._active[threading.get_ident()] = None
+                self._wake.set()
+            g._profile = (mode, time.perf_counter(), None)
+
+    def teardown(self, exc):
+        state = g.pop("_profile", None)
+        if state is None:
+            return
+        mode, t0, prof = state
+        if prof is not None:
+            prof.disable()
+            self._cprofile_busy.release()
+        rule = request.url_rule
+        route = f"{request.method} {rule.rule if rule else '<unmatched>'}"
+        wall_ms = (time.perf_counter() - t0) * 1000
+        stats = pstats.Stats(prof) if prof is not None else None
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None) if prof is None else None
+            rp = self._route_profile(route)
+            if rp is None:
+                return
+            rp.requests += 1
+            rp.wall_ms += wall_ms
+            if stats is not None:
+                self._add_cprofile(rp, stats)
+            elif samples:
+                self._add_samples(rp, samples)
+
+    # ---- sample mode ----
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            with self._lock:
+                if self._sampler is None or not self._sampler.is_alive():
+                    self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                    self._sampler.start()
+
+    def _sample_loop(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while True:
+            self._wake.wait()  # idle (no wakeups) while no request is being profiled
+            time.sleep(interval)
+            with self._lock:
+                idents = list(self._active)
+                if not idents:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = _stack(frame)
+                with self._lock:
+                    if ident in self._active:
+                        pending = self._active[ident] or []
+                        pending.append(stack)
+                        self._active[ident] = pending
+
+    def _add_samples(self, rp, samples):
+        for stack in samples:
+            rp.samples += 1
+            folded = ";".join(f"{m}:{f}" for m, f in stack)
+            if len(rp.stacks) < PROFILE_MAX_STACKS or folded in rp.stacks:
+                rp.stacks[folded] += 1
+            m, f = stack[-1]
+            rp.leaves[f"{m}:{f}"] += 1
+            rp.categories[_innermost_category(stack)] += 1
+
+    # ---- cprofile mode ----
+    def _add_cprofile(self, rp, stats):
+        for (fn, _line, name), (_cc, _nc, tt, _ct, _callers) in stats.stats.items():
+            rp.categories[category(_module_of_file(fn), name) or "app"] += tt
+        if rp.stats is None:
+            rp.stats = stats
+        else:
+            rp.stats.add(stats)
+
+    # ---- admin ----
+    def summary(self):
+        mode = _config["mode"]
+        with self._lock:
+            routes = {r: rp.summary(mode) for r, rp in self._routes.items()}
+        return {**_config, "headerEnabled": bool(PROFILE_KEY), "intervalMs": PROFILE_INTERVAL_MS, "routes": routes}
+
+    def export(self, route):
+        """(body, mimetype) of one route's profile, or None."""
+        with self._lock:
+            rp = self._routes.get(route)
+            if rp is None:
+                return None
+            if rp.stats is not None:
+                return marshal.dumps(rp.stats.stats), "application/octet-stream"
+            body = "".join(f"{stack} {n}\n" for stack, n in rp.stacks.most_common())
+        return body, "text/plain"
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def _stack(frame):
+    out = []
+    while frame is not None and len(out) < PROFILE_MAX_DEPTH:
+        out.append((frame.f_globals.get("__name__", "?"), frame.f_code.co_name))
+        frame = frame.f_back
+    out.reverse()
+    return tuple(out)
+
+def _innermost_category(stack):
+    for m, f in reversed(stack):
+        c = category(m, f)
+        if c:
+            return c
+    return "app"
+
+
+profiler = Profiler()
+
+
+@bp.get("/api/admin/profiling")
+@admin_required
+def profiling_summary():
+    return jsonify(profiler.summary())
+
+@bp.put("/api/admin/profiling")
+@admin_required
+def profiling_configure():
+    data = request.get_json(silent=True) or {}
+    if "sampleRate" in data:
+        try:
+            rate = float(data["sampleRate"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "sampleRate must be a number between 0 and 1"}), 400
+        if not 0 <= rate <= 1:
+            return jsonify({"error": "sampleRate must be a number between 0 and 1"}), 400
+        _config["sampleRate"] = rate
+    if "mode" in data:
+        mode = str(data["mode"]).strip().lower()
+        if mode not in PROFILE_MODES:
+            return jsonify({"error": f"mode must be one of {list(PROFILE_MODES)}"}), 400
+        if mode != _config["mode"]:
+            profiler.reset()  # samples and pstats do not mix
+            _config["mode"] = mode
+    return jsonify({**_config, "note": "applies to this worker process only"})
+
+@bp.get("/api/admin/profiling/download")
+@admin_required
+def profiling_download():
+    route = request.args.get("route") or ""
+    out = profiler.export(route)
+    if out is None:
+        return jsonify({"error": "No profile for this route"}), 404
+    body, mimetype = out
+    ext = "pstats" if mimetype == "application/octet-stream" else "folded"
+    name = "".join(c if c.isalnum() else "_" for c in route).strip("_") or "profile"
+    return Response(body, mimetype=mimetype, headers={"Content-Disposition": f'attachment; filename="{name}.{ext}"'})
+
+@bp.delete("/api/admin/profiling")
+@admin_required
+def profiling_reset():
+    profiler.reset()
+    return jsonify({"ok": True})
+
+
+def init_profiling(app):
+    """Call before registering the api blueprint so JWT decoding is profiled too."""
+    app.before_request(profiler.before)
+    app.teardown_request(profiler.teardown)
+    app.register_blueprint(bp)
@@ -0,0 +1,184 @@
+# backend/query_stats.py
+"""
+Per-request Mongo command accounting.
+
+A pymongo CommandListener (registered on the shared client in db.py) charges
+every command and its duration to the Flask route that issued it; commands
+outside a request (jobs, bootstrap, SSE generators) are charged to
+"<background>". Per route we keep request/command counts, a command latency
+histogram, a commands-per-request histogram and counts by command name.
+
+  - commands slower than SLOW_QUERY_MS are logged with their filter shape
+    (values replaced by "?"), e.g.
+      [slow-query] 182.4ms GET /api/crops find crops {"filter": {"status": "?"}, "sort": {"createdAt": -1}}
+  - a request issuing more than QUERY_BUDGET commands is logged and counted
+    as overBudget for its route
+  - every response carries Server-Timing: db;dur=<ms>;desc="<n> queries"
+
+query_stats() returns the aggregates (/api/health/queries).
+"""
+import json
+import os
+import threading
+
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+from http_client import HostStats
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "25"))
+BACKGROUND = "<background>"
+# Upper bounds for the commands-per-request histogram
+PER_REQUEST_BUCKETS = (1, 2, 5, 10, 25, 50, 100)
+
+# Where each command keeps the part worth showing in the slow log
+_SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+
+
+def query_shape(value, depth=0):
+    """Structure of a filter with the values blanked, so shapes group together."""
+    if depth > 6:
+        return "…"
+    if isinstance(value, dict):
+        return {k: (v if k in ("$sort", "sort") else query_shape(v, depth + 1)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, dict) for v in value):
+            return [query_shape(v, depth + 1) for v in value[:3]]
+        return "?"
+    return "?"
+
+def command_shape(name, command):
+    out = {}
+    for field in _SHAPE_FIELDS.get(name, ()):
+        if field not in command:
+            continue
+        v = command[field]
+        if field in ("updates", "deletes"):
+            v = [{"q": d.get("q")} for d in v[:1]]
+        out[field] = v if field in ("sort", "key") else query_shape(v)
+    return out
+
+
+class _RouteStats:
+    __slots__ = ("requests", "commands", "over_budget", "latency", "per_request", "by_command")
+
+    def __init__(self):
+        self.requests = 0
+        self.commands = 0
+        self.over_budget = 0
+        self.latency = HostStats()
+        self.per_request = [0] * (len(PER_REQUEST_BUCKETS) + 1)
+        self.by_command = {}
+
+    def as_dict(self):
+        cumulative, acc = {}, 0
+        for ub, n in zip(list(PER_REQUEST_BUCKETS) + ["+Inf"], self.per_request):
+            acc += n
+            cumulative[str(ub)] = acc
+        lat = self.latency.as_dict()
+        return {
+            "requests": self.requests,
+            "commands": self.commands,
+            "overBudget": self.over_budget,
+            "commandsPerRequest": cumulative,
+            "latency": {"count": lat["count"], "sumMs": lat["sumMs"], "buckets": lat["buckets"]},
+            "byCommand": dict(self.by_command),
+            "failures": lat["errors"],
+        }
+
+
+def _route():
+    if not has_request_context():
+        return BACKGROUND
+    rule = request.url_rule
+    return f"{request.method} {rule.rule if rule else '<unmatched>'}"
+
+
+class QueryMonitor(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._pending = {}   # (connection, request_id) -> (command name, collection, command) for the slow log
+
+    def _stats(self, route):
+        st = self._routes.get(route)
+        if st is None:
+            st = self._routes[route] = _RouteStats()
+        return st
+
+    def started(self, event):
+        name = event.command_name
+        if name in _SHAPE_FIELDS:
+            coll = event.command.get(name)
+            with self._lock:
+                self._pending[(event.connection_id, event.request_id)] = (name, coll, event.command)
+
+    def _finish(self, event, failure=None):
+        ms = event.duration_micros / 1000
+        route = _route()
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            st = self._stats(route)
+            st.commands += 1
+            st.latency.observe(ms)
+            st.by_command[event.command_name] = st.by_command.get(event.command_name, 0) + 1
+            if failure:
+                st.latency.errors[failure] = st.latency.errors.get(failure, 0) + 1
+        if route != BACKGROUND:
+            g._queries = getattr(g, "_queries", 0) + 1
+            g._query_ms = getattr(g, "_query_ms", 0.0) + ms
+        if ms >= SLOW_QUERY_MS and event.command_name not in ("hello", "isMaster", "ping"):
+            name, coll, command = pending or (event.command_name, None, {})
+            shape = json.dumps(command_shape(name, command), default=str)
+            print(f"[slow-query] {ms:.1f}ms {route} {name} {coll or ''} {shape}", flush=True)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        failure = event.failure.get("codeName") if isinstance(event.failure, dict) else None
+        self._finish(event, failure or "error")
+
+    def finish_request(self, response):
+        """after_request: per-request totals, budget check and Server-Timing header."""
+        n = getattr(g, "_queries", 0)
+        ms = getattr(g, "_query_ms", 0.0)
+        route = _route()
+        with self._lock:
+            st = self._stats(route)
+            st.requests += 1
+            for i, ub in enumerate(PER_REQUEST_BUCKETS):
+                if n <= ub:
+                    st.per_request[i] += 1
+                    break
+            else:
+                st.per_request[-1] += 1
+            if n > QUERY_BUDGET:
+                st.over_budget += 1
+        if n > QUERY_BUDGET:
+            print(f"[query-budget] {route} issued {n} queries ({ms:.1f}ms), budget {QUERY_BUDGET}", flush=True)
+        response.headers.add("Server-Timing", f'db;dur={ms:.1f};desc="{n} queries"')
+        return response
+
+    def as_dict(self):
+        with self._lock:
+            routes = {r: st.as_dict() for r, st in self._routes.items()}
+        return {"slowQueryMs": SLOW_QUERY_MS, "queryBudget": QUERY_BUDGET, "routes": routes}
+
+
+monitor = QueryMonitor()
+
+def init_query_stats(app):
+    app.after_request(monitor.finish_request)
+
+def query_stats():
+    return monitor.as_dict()
@@ -1,30 +1,38 @@
 # seed_today.py  (run from backend folder)
-import json, os, sys
+#   python seed_today.py [state_prices_today.json] [--prune] [--rollback YYYY-MM-DD]
+# Writes the feed as a new snapshot version and switches the day's active
+# pointer only once every row is in (see price_ingest.py). Re-runs are idempotent.
+import argparse, json, os
 from datetime import date
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient
+from price_ingest import ingest_snapshot, prune_versions, rollback
 
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME   = os.getenv("DB_NAME", "farmunity")
-JSON_PATH = sys.argv[1] if len(sys.argv) > 1 else "state_prices_today.json"
+
+ap = argparse.ArgumentParser()
+ap.add_argument("json_path", nargs="?", default="state_prices_today.json")
+ap.add_argument("--prune", action="store_true", help="delete inactive versions (keeps the previous one)")
+ap.add_argument("--rollback", metavar="DATE", help="re-activate the previous version of DATE and exit")
+args = ap.parse_args()
 
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
-coll = db.state_prices_today
 
-# Helpful unique index
-coll.create_index([("date", ASCENDING), ("state", ASCENDING), ("crop", ASCENDING), ("type", ASCENDING)], unique=True)
+if args.rollback:
+  print(f"{args.rollback} -> version {rollback(db, args.rollback)}")
+  raise SystemExit(0)
 
-with open(JSON_PATH, "r", encoding="utf-8") as f:
+with open(args.json_path, "r", encoding="utf-8") as f:
   data = json.load(f)
 
 today = data.get("generated_at") or date.today().isoformat()
-bulk = []
+rows = []
 for s in data["states"]:
   state = s["state"]
   for typ in ["wholesale", "retail"]:
     for crop, row in s["prices"][typ].items():
-      bulk.append({
-        "date": today,
+      rows.append({
         "state": state,
         "crop": crop,
         "type": typ,
@@ -34,8 +42,10 @@ for s in data["states"]:
         "yesterday_price": row.get("yesterday_price")
       })
 
-# Replace today's snapshot
-coll.delete_many({"date": today})
-if bulk:
-  coll.insert_many(bulk)
-print(f"Seeded {len(bulk)} docs for {today}")
+res = ingest_snapshot(db, today, rows)
+print(f"Seeded {res['rows']} docs for {today} · version {res['version']}"
+      + ("" if res["changed"] else " (unchanged)"))
+print(f"Price alerts: {res['alerts']['triggered']} triggered, {res['alerts']['inserted']} notified")
+
+if args.prune:
+  print(f"Pruned {prune_versions(db)} inactive rows")
@@ -0,0 +1,121 @@
+# backend/storage.py
+"""
+Storage backends for uploaded documents.
+
+Files are addressed by a storage key such as "certs/ab/cd/<sha256>.pdf" (two
+levels of hash-prefix shards keep every directory small); the public URL is "/uploads/<key>" (served by uploads.py). Writers stage bytes in a temp
+file (mkstemp() / temp_path()) and hand it over with put_file(), which is a
+no-op when the key already exists (content-addressed keys make that a dedup).
+
+Backends are picked with UPLOAD_STORAGE (default "local"); add one by
+implementing the LocalStorage methods and registering it in BACKENDS.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_ROOT = os.getenv("UPLOAD_FOLDER") or os.path.join(BASE_DIR, "uploads")
+UPLOAD_STORAGE = (os.getenv("UPLOAD_STORAGE") or "local").strip().lower()
+TMP_DIR = ".tmp"  # staging area under the root; never served (see uploads.py)
+QUARANTINE_DIR = ".quarantine"  # orphans set aside by upload_gc.py
+
+
+def content_key(subdir, digest, ext):
+    return f"{subdir}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+def key_from_url(url):
+    return url[len("/uploads/"):].split("?", 1)[0] if url and url.startswith("/uploads/") else None
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root=UPLOAD_ROOT):
+        self.root = root
+        os.makedirs(os.path.join(root, TMP_DIR), exist_ok=True)
+
+    def local_path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def temp_path(self, name):
+        return os.path.join(self.root, TMP_DIR, name)
+
+    def mkstemp(self, prefix="upload-"):
+        """(fd, path) of a new staging file."""
+        return tempfile.mkstemp(dir=os.path.join(self.root, TMP_DIR), prefix=prefix, suffix=".part")
+
+    def exists(self, key):
+        return os.path.isfile(self.local_path(key))
+
+    def put_file(self, src, key):
+        """Move a staged temp file to key. Returns False (and drops src) if key already exists."""
+        dest = self.local_path(key)
+        if os.path.exists(dest):
+            os.remove(src)
+            os.utime(dest)  # freshly referenced again: restart the GC grace period
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.replace(src, dest)
+        except OSError:
+            shutil.move(src, dest)  # staging on another filesystem
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def url(self, key):
+        return f"/uploads/{key}"
+
+    def iter_keys(self, prefix):
+        """(key, mtime) of every stored file under prefix ("certs", ...), skipping dot dirs."""
+        top = self.local_path(prefix)
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, "/"), mtime
+
+    def quarantine(self, key):
+        """Move a file under QUARANTINE_DIR (same key) instead of deleting it."""
+        dest = self.local_path(f"{QUARANTINE_DIR}/{key}")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.replace(self.local_path(key), dest)
+            os.utime(dest)  # quarantine age counts from now
+            return True
+        except FileNotFoundError:
+            return False
+
+
+BACKENDS = {"local": LocalStorage}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Process-wide storage backend, built on first use from UPLOAD_STORAGE."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                cls = BACKENDS.get(UPLOAD_STORAGE)
+                if cls is None:
+                    raise RuntimeError(f"Unknown UPLOAD_STORAGE '{UPLOAD_STORAGE}' (expected one of {sorted(BACKENDS)})")
+                _storage = cls()
+    return _storage
@@ -0,0 +1,619 @@
+# backend/synth.py
+"""
+Synthetic, schema-correct data for benchmarks and local scale tests.
+
+Documents have the shapes the API writes: signup (users), create_crop,
+create_equipment, request_equipment (bookings + notifications),
+chat_start / chat_send_message (conversations + messages, lastMessage kept
+current), forum_create / forum_reply (embedded replies) and ai_ask
+(ai_sessions + ai_messages). Price snapshots and history go through
+price_ingest.ingest_snapshot and price_history.record_history.
+
+Every entity is a pure function of (seed, index): ids, owners and
+timestamps come from a hash, not from shared state, so index ranges are
+generated by parallel worker processes with bulk inserts and still reference
+each other correctly, and memory stays flat at millions of documents.
+createdAt grows with the index and the ObjectId embeds it, so _id order is
+insertion order as in production.
+
+Skew (SKEW, override with --skew name=value):
+  sellers      crops/equipment per seller   power law (a few hot sellers)
+  listings     bookings / crop chats per listing   power law (hot listings)
+  inbox        conversations per user       power law (a few very busy inboxes)
+  threads      messages per conversation    Pareto tail (long chat threads)
+  discussions  replies per discussion       Pareto tail (popular discussions)
+  ai_turns     turns per AI session         Pareto tail
+Power-law knobs are exponents (1 = uniform); Pareto knobs are the alpha
+(smaller = heavier tail). Totals for messages, replies and ai_messages are
+targets; the tails make the actual count land near them.
+
+Library: generate(db, volumes, seed=42, workers=1, uri=None)
+CLI:     python synth.py --db farmunity_scale --preset large --workers 8 --drop
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+from werkzeug.security import generate_password_hash
+
+from price_history import record_history
+from price_ingest import ingest_snapshot
+from prices_today import CROPS
+
+VOLUMES = {
+    "users": 2000,
+    "crops": 20000,
+    "equipment": 5000,
+    "conversations": 5000,
+    "messages": 100000,
+    "bookings": 20000,
+    "discussions": 2000,
+    "replies": 20000,
+    "ai_sessions": 2000,
+    "ai_messages": 20000,
+    "history_days": 365,
+}
+PRESETS = {
+    "bench": VOLUMES,
+    "large": {
+        "users": 200_000, "crops": 1_000_000, "equipment": 200_000, "conversations": 500_000,
+        "messages": 5_000_000, "bookings": 1_000_000, "discussions": 50_000, "replies": 1_000_000,
+        "ai_sessions": 200_000, "ai_messages": 2_000_000, "history_days": 730,
+    },
+}
+SKEW = {"sellers": 3.0, "listings": 2.5, "inbox": 2.0, "threads": 1.5, "discussions": 1.3, "ai_turns": 1.8}
+# Caps keep single documents / threads within sane bounds (embedded replies count toward 16 MB)
+MAX_THREAD = 5000
+MAX_REPLIES = 2000
+MAX_AI_TURNS = 200
+
+INSERT_BATCH = 1000
+CHUNK = 5000          # entities per worker task
+SPAN_DAYS = 365       # createdAt spread
+FARMER_SHARE = 6      # of every 10 users
+
+CITIES = [("Belagavi", "Karnataka"), ("Hubballi", "Karnataka"), ("Mysuru", "Karnataka"), ("Pune", "Maharashtra"),
+          ("Nashik", "Maharashtra"), ("Ludhiana", "Punjab"), ("Indore", "Madhya Pradesh"), ("Guntur", "Andhra Pradesh"),
+          ("Coimbatore", "Tamil Nadu"), ("Rajkot", "Gujarat"), ("Patna", "Bihar"), ("Jaipur", "Rajasthan")]
+CROP_CATEGORIES = {"Wheat": "grains", "Rice": "grains", "Corn": "grains", "Tomato": "vegetables",
+                   "Onion": "vegetables", "Potato": "vegetables", "Organic Turmeric": "organic", "Organic Jaggery": "organic"}
+CROP_NAMES = list(CROP_CATEGORIES)
+QUALITIES = ["Premium", "Grade A", "Grade B", "Standard"]
+EQUIPMENT = {
+    "Tractors": ["Mahindra 575 DI Tractor", "John Deere 5050D Tractor", "Swaraj 744 FE Tractor"],
+    "Harvesters": ["Kartar 4000 Combine Harvester", "Preet 987 Harvester"],
+    "Drones": ["Agri Spraying Drone 10L", "Crop Survey Drone"],
+    "Tillers": ["Kirloskar Power Tiller", "VST Shakti Rotary Tiller"],
+    "Irrigation": ["Drip Irrigation Kit 1 acre", "Diesel Water Pump 5HP", "Sprinkler Set"],
+}
+EQUIPMENT_CATEGORIES = list(EQUIPMENT)
+FEATURES = ["GPS", "4WD", "Power steering", "Operator included", "Diesel", "Fuel included", "Free delivery", "Insured"]
+FORUM_CATEGORIES = ["Crops", "Soil", "Pests", "Irrigation", "Market", "Equipment"]
+WORDS = ("crop soil water yield price market mandi seed fertilizer urea pest spray harvest monsoon rain "
+         "tractor rent quintal storage organic wheat rice onion tomato potato field acre drip irrigation").split()
+BENCH_PASSWORD = "bench-password"  # every synthetic user; hashed once per run
+
+# Entity kinds: first byte after the timestamp in generated ObjectIds
+KINDS = {"users": 1, "crops": 2, "equipment": 3, "conversations": 4, "bookings": 5, "discussions": 6, "ai_sessions": 7}
+
+
+def _states():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state_prices_today.json")
+    with open(path, "r", encoding="utf-8") as f:
+        return [s["state"] for s in json.load(f)["states"]]
+
+def _sentence(rng, lo=6, hi=18):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(lo, hi))).capitalize() + "."
+
+def _tail(rng, mean, alpha, cap):
+    """Pareto-distributed size with roughly the given mean (0 stays 0)."""
+    if mean <= 0:
+        return 0
+    return max(1, min(cap, int(round(mean * (alpha - 1) / alpha * rng.paretovariate(alpha)))))
+
+def _spread(rng, start, end, k):
+    """k sorted datetimes between start and end."""
+    span = max(1.0, (end - start).total_seconds())
+    return [start + timedelta(seconds=s) for s in sorted(rng.uniform(0, span) for _ in range(k))]
+
+
+_MASK = (1 << 64) - 1
+_STRIDE = 2654435761
+
+def _mix(x):
+    # splitmix64 finaliser
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _step(n):
+    """A stride coprime with n, so r -> r * step % n is a permutation of range(n)."""
+    step = _STRIDE % n or 1
+    while math.gcd(step, n) != 1:
+        step += 1
+    return step
+
+def _shuffle(k, n, seed):
+    """Bijection on range(n) that spreads consecutive k (and so creation times) apart."""
+    return (k * _step(n) + seed) % n
+
+def _owner_rank(slot, slots, owners, exponent):
+    """
+    Split range(slots) into contiguous runs per owner, run sizes following a
+    power law (owner 0 largest). Returns (owner, rank of slot within the run).
+    """
+    o = min(owners - 1, int(owners * (slot / slots) ** exponent))
+    first = lambda o: math.ceil(slots * (o / owners) ** (1 / exponent))
+    while o > 0 and first(o) > slot:
+        o -= 1
+    while o < owners - 1 and first(o + 1) <= slot:
+        o += 1
+    return o, slot - first(o)
+
+
+class Plan:
+    """Deterministic view of the data set: any entity's id / owner / timestamp from its index."""
+
+    def __init__(self, volumes=None, seed=42, skew=None, now=None):
+        self.vol = {**VOLUMES, **(volumes or {})}
+        self.seed = seed
+        self.skew = {**SKEW, **(skew or {})}
+        self.now = now or datetime.utcnow().replace(microsecond=0)
+        self.start = self.now - timedelta(days=SPAN_DAYS)
+        n = self.vol["users"]
+        self.n_farmers = (n // 10) * FARMER_SHARE + min(n % 10, FARMER_SHARE)
+        self.n_buyers = n - self.n_farmers
+
+    def args(self):
+        return self.vol, self.seed, self.skew, self.now
+
+    # ---- primitives ----
+    def u(self, kind, i, salt=0):
+        return _mix((self.seed << 40) ^ (KINDS[kind] << 56) ^ (salt << 48) ^ i) / 2.0 ** 64
+
+    def pick(self, n, exponent, kind, i, salt):
+        """Index in [0, n); exponent > 1 favours low indices (power law), 1 is uniform."""
+        return min(n - 1, int(n * self.u(kind, i, salt) ** exponent))
+
+    def created(self, kind, i):
+        n = max(1, self.vol[kind])
+        return self.start + timedelta(seconds=(i + self.u(kind, i, 1)) / n * SPAN_DAYS * 86400)
+
+    def oid(self, kind, i):
+        ts = int((self.created(kind, i) - datetime(1970, 1, 1)).total_seconds())
+        return ObjectId(struct.pack(">IB", ts, KINDS[kind]) + i.to_bytes(7, "big"))
+
+    # ---- users ----
+    def farmer(self, k):
+        return (k // FARMER_SHARE) * 10 + k % FARMER_SHARE
+
+    def buyer(self, k):
+        return (k // (10 - FARMER_SHARE)) * 10 + FARMER_SHARE + k % (10 - FARMER_SHARE)
+
+    def is_farmer(self, i):
+        return i % 10 < FARMER_SHARE
+
+    def user_name(self, i):
+        return f"User {i}"
+
+    def user_city(self, i):
+        return CITIES[int(self.u("users", i, 2) * len(CITIES))]
+
+    def seller(self, kind, j):
+        """Owning farmer of crop / equipment j (hot sellers own most listings)."""
+        if not self.n_farmers:
+            return 0
+        return self.farmer(self.pick(self.n_farmers, self.skew["sellers"], kind, j, 3))
+
+    # ---- conversations ----
+    def conversation_pair(self, i):
+        """
+        (user a, user b, crop index or None) of conversation i, or None if the
+        slot has no free partner left. Injective, so (participantHash, cropId)
+        stays unique as chat_start guarantees: even i are crop chats, odd i
+        direct chats; each is a slot in a shuffled order, a power law over the
+        slots picks the listing / busy user, and the slot's rank within it
+        picks a distinct partner.
+        """
+        n, crops = self.vol["users"], self.vol["crops"]
+        total = self.vol["conversations"]
+        if crops and self.n_buyers:
+            n_crop, n_direct = (total + 1) // 2, total // 2
+            crop_chat, k = i % 2 == 0, i // 2
+        else:
+            n_crop, n_direct, crop_chat, k = 0, total, False, i
+        if crop_chat:
+            j, r = _owner_rank(_shuffle(k, n_crop, self.seed), n_crop, crops, self.skew["listings"])
+            if r >= self.n_buyers:
+                return None
+            off = int(self.u("crops", j, 14) * self.n_buyers)
+            return self.seller("crops", j), self.buyer((off + r * _step(self.n_buyers)) % self.n_buyers), j
+        a, r = _owner_rank(_shuffle(k, n_direct, self.seed + 1), n_direct, n, self.skew["inbox"])
+        span = n - 1 - a  # partners are users after a, so (a, b) never repeats as (b, a)
+        if r >= span:
+            return None
+        off = int(self.u("users", a, 14) * span)
+        return a, a + 1 + (off + r * _step(span)) % span, None
+
+    # ---- listings ----
+    def equipment_title(self, j):
+        category = EQUIPMENT_CATEGORIES[int(self.u("equipment", j, 4) * len(EQUIPMENT_CATEGORIES))]
+        titles = EQUIPMENT[category]
+        return category, titles[int(self.u("equipment", j, 5) * len(titles))]
+
+
+# ---------------- Builders (shapes as written by app.py) ----------------
+def user_doc(plan, i, password_hash):
+    city, _state = plan.user_city(i)
+    return {
+        "_id": plan.oid("users", i),
+        "name": plan.user_name(i),
+        "email": f"user{i}@bench.farmunity.test",
+        "password": password_hash,
+        "role": "farmer" if plan.is_farmer(i) else "buyer",
+        "createdAt": plan.created("users", i),
+        "location": city,
+        "phone": None,
+        "avatarUrl": None,
+        "preferredLanguage": "English",
+        "crops": [],
+        "soil": {},
+    }
+
+def crop_doc(plan, j, rng):
+    owner = plan.seller("crops", j)
+    name = rng.choice(CROP_NAMES)
+    return {
+        "_id": plan.oid("crops", j),
+        "farmer": plan.user_name(owner),
+        "crop": name,
+        "quantity": f"{rng.randint(1, 200) * 5} kg",
+        "price": float(rng.randint(10, 120)),
+        "location": plan.user_city(owner)[0],
+        "quality": rng.choice(QUALITIES),
+        "rating": round(rng.uniform(3.5, 5.0), 1),
+        "image": None,
+        "category": CROP_CATEGORIES[name],
+        "createdAt": plan.created("crops", j),
+        "createdBy": plan.oid("users", owner),
+        "status": None,
+    }
+
+def equipment_doc(plan, j, rng):
+    owner = plan.seller("equipment", j)
+    category, title = plan.equipment_title(j)
+    city, state = rng.choice(CITIES)
+    day = float(rng.randint(5, 60) * 100)
+    created = plan.created("equipment", j)
+    return {
+        "_id": plan.oid("equipment", j),
+        "title": title,
+        "category": category,
+        "owner": {"name": plan.user_name(owner), "userId": plan.oid("users", owner)},
+        "location": {"city": city, "state": state},
+        "features": rng.sample(FEATURES, rng.randint(1, 4)),
+        "rating": round(rng.uniform(3.0, 5.0), 1),
+        "available": rng.random() < 0.8,
+        "price": {"day": day, "week": day * 6},
+        "images": [],
+        "createdAt": created,
+        "updatedAt": created,
+    }
+
+def conversation_docs(plan, i, rng, mean_messages):
+    """
+    One conversation and its messages (None, [] for an unused slot). Half are
+    buyer <-> seller chats about a (popular) crop, the rest direct chats with
+    one side drawn from busy inboxes; see Plan.conversation_pair.
+    """
+    pair = plan.conversation_pair(i)
+    if pair is None:
+        return None, []
+    a, b, j = pair
+    crop_id = str(plan.oid("crops", j)) if j is not None else None
+    ids = [str(plan.oid("users", a)), str(plan.oid("users", b))]
+    created = plan.created("conversations", i)
+    conv_id = plan.oid("conversations", i)
+    msgs = []
+    for ts in _spread(rng, created, plan.now, _tail(rng, mean_messages, plan.skew["threads"], MAX_THREAD)):
+        msgs.append({"conversationId": str(conv_id), "senderId": rng.choice(ids), "text": _sentence(rng, 3, 20),
+                     "createdAt": ts})
+    last = msgs[-1] if msgs else None
+    conv = {
+        "_id": conv_id,
+        "participants": [ObjectId(x) for x in ids],
+        "participantHash": "-".join(sorted(ids)),
+        "cropId": crop_id,
+        "createdAt": created,
+        "updatedAt": last["createdAt"] if last else created,
+        "lastMessage": {"text": last["text"], "senderId": last["senderId"], "createdAt": last["createdAt"]} if last else None,
+    }
+    return conv, msgs
+
+def booking_docs(plan, i, rng):
+    """A booking on a (popular) equipment listing and the owner's notification, as request_equipment writes them."""
+    j = plan.pick(plan.vol["equipment"], plan.skew["listings"], "bookings", i, 10)
+    owner = plan.seller("equipment", j)
+    _category, title = plan.equipment_title(j)
+    requester = int(plan.u("bookings", i, 11) * plan.vol["users"])
+    if requester == owner:
+        requester = (requester + 1) % plan.vol["users"]
+    booking_id = plan.oid("bookings", i)
+    created = plan.created("bookings", i)
+    booking = {
+        "_id": booking_id,
+        "equipmentId": plan.oid("equipment", j),
+        "equipmentTitle": title,
+        "ownerId": plan.oid("users", owner),
+        "requesterId": plan.oid("users", requester),
+        "status": "interest",
+        "note": _sentence(rng, 4, 12) if rng.random() < 0.3 else None,
+        "createdAt": created,
+    }
+    notif = {
+        "userId": booking["ownerId"],
+        "type": "equipment_interest",
+        "title": "New booking interest",
+        "message": f"{plan.user_name(requester)} is interested in your '{title}'.",
+        "metadata": {
+            "equipmentId": str(booking["equipmentId"]),
+            "equipmentTitle": title,
+            "requesterId": str(booking["requesterId"]),
+            "bookingId": str(booking_id),
+        },
+        "isRead": rng.random() < 0.6,
+        "createdAt": created,
+    }
+    return booking, notif
+
+def discussion_doc(plan, i, rng, mean_replies):
+    n = plan.vol["users"]
+    author = int(plan.u("discussions", i, 12) * n)
+    created = plan.created("discussions", i)
+    replies = []
+    for ts in _spread(rng, created, plan.now, _tail(rng, mean_replies, plan.skew["discussions"], MAX_REPLIES)):
+        who = int(rng.random() * n)
+        replies.append({"_id": ObjectId(), "text": _sentence(rng, 5, 30), "createdAt": ts,
+                        "author": {"id": plan.oid("users", who), "name": plan.user_name(who)}})
+    return {
+        "_id": plan.oid("discussions", i),
+        "title": _sentence(rng, 4, 9)[:-1] + "?",
+        "text": _sentence(rng, 20, 60),
+        "category": rng.choice(FORUM_CATEGORIES),
+        "createdAt": created,
+        "author": {"id": plan.oid("users", author), "name": plan.user_name(author)},
+        "replies": replies,
+    }
+
+def ai_session_docs(plan, i, rng, mean_turns):
+    """An AI session summary and its turns (user question + assistant reply), as ai_ask writes them."""
+    user = plan.pick(plan.vol["users"], plan.skew["inbox"], "ai_sessions", i, 13)
+    user_id = plan.oid("users", user)
+    session_id = plan.oid("ai_sessions", i)
+    created = plan.created("ai_sessions", i)
+    turns = _tail(rng, mean_turns, plan.skew["ai_turns"], MAX_AI_TURNS)
+    msgs, title = [], None
+    for ts in _spread(rng, created, min(plan.now, created + timedelta(days=7)), turns):
+        question = _sentence(rng, 5, 15)[:-1] + "?"
+        title = title or question[:50] + ("..." if len(question) > 50 else "")
+        msgs.append({"sessionId": session_id, "userId": user_id, "role": "user", "content": question, "ts": ts})
+        msgs.append({"sessionId": session_id, "userId": user_id, "role": "assistant",
+                     "content": " ".join(_sentence(rng) for _ in range(rng.randint(2, 6))),
+                     "ts": ts + timedelta(seconds=rng.randint(2, 20))})
+    session = {
+        "_id": session_id,
+        "userId": user_id,
+        "messagesCount": len(msgs),
+        "createdAt": created,
+        "updatedAt": msgs[-1]["ts"] if msgs else created,
+        "title": title,
+    }
+    return session, msgs
+
+def price_rows(rng, states, base):
+    """One day of snapshot rows; base[(state, crop, type)] drifts like a random walk."""
+    rows = []
+    for state in states:
+        for crop in CROPS:
+            for typ in ("wholesale", "retail"):
+                key = (state, crop, typ)
+                prev = base.get(key)
+                if prev is None:
+                    prev = float(rng.randint(1500, 4000)) * (1.25 if typ == "retail" else 1.0)
+                price = round(max(500.0, prev * (1 + rng.uniform(-0.03, 0.03))), 2)
+                base[key] = price
+                rows.append({"state": state, "crop": crop, "type": typ, "price_per_qt": price,
+                             "change_pct": round((price - prev) / prev * 100, 2), "unit": "INR_PER_QT",
+                             "yesterday_price": prev})
+    return rows
+# ------------------------------------------------
+
+
+# ---------------- Bulk writer / tasks ----------------
+class _Buffers:
+    def __init__(self, db, batch=INSERT_BATCH):
+        self.db = db
+        self.batch = batch
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, coll, doc):
+        buf = self.pending.setdefault(coll, [])
+        buf.append(doc)
+        if len(buf) >= self.batch:
+            self._flush(coll)
+
+    def _flush(self, coll):
+        buf = self.pending.pop(coll, None)
+        if buf:
+            self.db[coll].insert_many(buf, ordered=False, bypass_document_validation=True)
+            self.counts[coll] = self.counts.get(coll, 0) + len(buf)
+
+    def close(self):
+        for coll in list(self.pending):
+            self._flush(coll)
+        return self.counts
+
+
+def run_task(db, plan, kind, start, end, password_hash=None):
+    """Generate and insert entities [start, end) of one kind. Returns inserted counts per collection."""
+    rng = random.Random(f"{plan.seed}:{kind}:{start}")
+    out = _Buffers(db)
+    vol = plan.vol
+    for i in range(start, end):
+        if kind == "users":
+            out.add("users", user_doc(plan, i, password_hash))
+        elif kind == "crops":
+            out.add("crops", crop_doc(plan, i, rng))
+        elif kind == "equipment":
+            out.add("equipment", equipment_doc(plan, i, rng))
+        elif kind == "conversations":
+            conv, msgs = conversation_docs(plan, i, rng, vol["messages"] / vol["conversations"])
+            if conv is None:
+                continue
+            out.add("conversations", conv)
+            for m in msgs:
+                out.add("messages", m)
+        elif kind == "bookings":
+            booking, notif = booking_docs(plan, i, rng)
+            out.add("bookings", booking)
+            out.add("notifications", notif)
+        elif kind == "discussions":
+            out.add("discussions", discussion_doc(plan, i, rng, vol["replies"] / vol["discussions"]))
+        elif kind == "ai_sessions":
+            session, msgs = ai_session_docs(plan, i, rng, vol["ai_messages"] / 2 / vol["ai_sessions"])
+            out.add("ai_sessions", session)
+            for m in msgs:
+                out.add("ai_messages", m)
+    return out.close()
+
+def _tasks(plan):
+    vol = plan.vol
+    needs = {  # kinds whose references would dangle without these
+        "crops": ("users",), "equipment": ("users",), "conversations": ("users",),
+        "bookings": ("users", "equipment"), "discussions": ("users",), "ai_sessions": ("users",),
+    }
+    tasks = []
+    for kind in KINDS:
+        if not vol[kind] or any(vol[k] <= (1 if k == "users" else 0) for k in needs.get(kind, ())):
+            continue
+        tasks.extend((kind, s, min(vol[kind], s + CHUNK)) for s in range(0, vol[kind], CHUNK))
+    return tasks
+
+
+_worker = {}
+
+def _init_worker(uri, db_name):
+    _worker["db"] = MongoClient(uri, w=1, appname="farmunity-synth")[db_name]
+
+def _worker_task(plan_args, kind, start, end, password_hash):
+    return run_task(_worker["db"], Plan(*plan_args), kind, start, end, password_hash)
+
+def _pool_context():
+    # fork keeps callers that are plain scripts (bench.py) from being re-imported by workers
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+# ------------------------------------------------
+
+
+def generate(db, volumes=None, seed=42, workers=1, uri=None, skew=None, log=print):
+    """
+    Insert a full synthetic data set into db (expected empty). workers > 1 runs
+    index ranges in that many processes, each with its own client to uri.
+    Returns inserted counts per collection.
+    """
+    plan = Plan(volumes, seed, skew)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    tasks = _tasks(plan)
+    counts, done, t0 = {}, 0, time.perf_counter()
+
+    def merge(res):
+        nonlocal done
+        done += 1
+        for k, v in res.items():
+            counts[k] = counts.get(k, 0) + v
+        if done == len(tasks) or done % max(1, len(tasks) // 20) == 0:
+            total = sum(counts.values())
+            log(f"{done}/{len(tasks)} chunks · {total} docs · {total / max(1e-9, time.perf_counter() - t0):.0f} docs/s")
+
+    if workers > 1:
+        if not uri:
+            raise ValueError("uri is required when workers > 1")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                 initializer=_init_worker, initargs=(uri, db.name)) as pool:
+            futures = [pool.submit(_worker_task, plan.args(), kind, s, e, password_hash) for kind, s, e in tasks]
+            for fut in as_completed(futures):
+                merge(fut.result())
+    else:
+        for kind, s, e in tasks:
+            merge(run_task(db, plan, kind, s, e, password_hash))
+
+    # Prices: history for every day, the last day also as today's active snapshot
+    rng = random.Random(f"{seed}:prices")
+    states, base = _states(), {}
+    today = date.today()
+    days = max(1, plan.vol["history_days"])
+    for i in range(days - 1, 0, -1):
+        d = (today - timedelta(days=i)).isoformat()
+        record_history(db.price_history, [{**r, "date": d} for r in price_rows(rng, states, base)])
+    res = ingest_snapshot(db, today.isoformat(), price_rows(rng, states, base))
+    counts["price_history_days"] = days
+    counts["price_snapshots"] = res["rows"]
+    log(f"prices {days} days × {res['rows']} rows")
+    return counts
+
+
+def _skew_arg(raw):
+    name, _, value = raw.partition("=")
+    if name not in SKEW:
+        raise argparse.ArgumentTypeError(f"unknown skew '{name}' (expected one of {sorted(SKEW)})")
+    return name, float(value)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Generate a synthetic Farmunity data set")
+    ap.add_argument("--uri", default=os.getenv("SYNTH_MONGO_URI", "mongodb://127.0.0.1:27017"))
+    ap.add_argument("--db", default="farmunity_scale")
+    ap.add_argument("--preset", choices=sorted(PRESETS), default="bench")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--skew", type=_skew_arg, action="append", default=[], metavar="NAME=VALUE")
+    ap.add_argument("--drop", action="store_true", help="drop the database first")
+    ap.add_argument("--no-indexes", action="store_true", help="skip building app indexes after the load")
+    for k in VOLUMES:
+        ap.add_argument(f"--{k.replace('_', '-')}", dest=k, type=int, help=f"override the preset's {k}")
+    args = ap.parse_args()
+
+    volumes = {**PRESETS[args.preset], **{k: getattr(args, k) for k in VOLUMES if getattr(args, k) is not None}}
+    db = MongoClient(args.uri)[args.db]
+    if args.drop:
+        db.client.drop_database(args.db)
+    elif db.users.estimated_document_count():
+        sys.exit(f"{args.db} already has data; pass --drop to replace it")
+
+    print(f"Generating into {args.db} with {args.workers} workers: {volumes}", flush=True)
+    t0 = time.perf_counter()
+    counts = generate(db, volumes, seed=args.seed, workers=args.workers, uri=args.uri, skew=dict(args.skew),
+                      log=lambda m: print("  " + m, flush=True))
+    if not args.no_indexes:
+        from app import ensure_indexes
+
+        t1 = time.perf_counter()
+        ensure_indexes(db, force=True)
+        print(f"  indexes {time.perf_counter() - t1:.1f}s", flush=True)
+    print(f"Done in {time.perf_counter() - t0:.1f}s: {counts}")
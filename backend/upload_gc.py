@@ -0,0 +1,83 @@
+# backend/upload_gc.py
+"""
+Garbage collection of orphaned certification documents.
+
+Files are content-addressed and shared, so nothing is deleted when a seller
+resubmits or an equipment item is removed. gc_orphan_uploads (jobs.py:
+upload_gc) instead compares what is on disk with what is referenced:
+
+  referenced = equipment.certification.documents[].url
+             + documents of finalized resumable uploads not yet submitted
+
+and handles unreferenced files older than UPLOAD_GC_GRACE_HOURS (so an
+upload between "saved" and "referenced" is never touched; storage.put_file
+refreshes the mtime when identical bytes are uploaded again) in batches of
+UPLOAD_GC_BATCH:
+
+  UPLOAD_GC_MODE=quarantine (default)  move under .quarantine/, purged after
+                                       UPLOAD_QUARANTINE_DAYS
+  UPLOAD_GC_MODE=delete                remove right away
+  UPLOAD_GC_MODE=dry-run               only count
+"""
+import os
+import time
+
+from storage import QUARANTINE_DIR, get_storage, key_from_url
+
+GC_DIRS = ("invoices", "certs")
+UPLOAD_GC_MODE = (os.getenv("UPLOAD_GC_MODE") or "quarantine").strip().lower()
+UPLOAD_GC_GRACE_HOURS = float(os.getenv("UPLOAD_GC_GRACE_HOURS", "24"))
+UPLOAD_GC_BATCH = int(os.getenv("UPLOAD_GC_BATCH", "500"))
+UPLOAD_QUARANTINE_DAYS = float(os.getenv("UPLOAD_QUARANTINE_DAYS", "7"))
+
+
+def referenced_keys(db):
+    keys = set()
+    cur = db.equipment.find({"certification.documents.url": {"$exists": True}},
+                            {"certification.documents.url": 1})
+    for eq in cur.batch_size(1000):
+        for d in (eq.get("certification") or {}).get("documents") or []:
+            k = key_from_url(d.get("url"))
+            if k:
+                keys.add(k)
+    for s in db.upload_sessions.find({"status": "complete"}, {"document.url": 1}).batch_size(1000):
+        k = key_from_url((s.get("document") or {}).get("url"))
+        if k:
+            keys.add(k)
+    return keys
+
+def _orphan_batches(storage, keys, cutoff):
+    batch = []
+    for top in GC_DIRS:
+        for key, mtime in storage.iter_keys(top):
+            if key in keys or mtime > cutoff:
+                continue
+            batch.append(key)
+            if len(batch) >= UPLOAD_GC_BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def gc_orphan_uploads(db):
+    storage = get_storage()
+    # Reference set is read before the walk; anything newer than the grace cutoff is skipped
+    cutoff = time.time() - UPLOAD_GC_GRACE_HOURS * 3600
+    keys = referenced_keys(db)
+
+    orphans = handled = 0
+    for batch in _orphan_batches(storage, keys, cutoff):
+        orphans += len(batch)
+        if UPLOAD_GC_MODE == "delete":
+            handled += sum(1 for k in batch if storage.delete(k))
+        elif UPLOAD_GC_MODE == "quarantine":
+            handled += sum(1 for k in batch if storage.quarantine(k))
+
+    purged = 0
+    if UPLOAD_GC_MODE != "dry-run":
+        purge_before = time.time() - UPLOAD_QUARANTINE_DAYS * 86400
+        for key, mtime in list(storage.iter_keys(QUARANTINE_DIR)):
+            if mtime < purge_before and storage.delete(key):
+                purged += 1
+    return {"mode": UPLOAD_GC_MODE, "referenced": len(keys), "orphans": orphans,
+            "handled": handled, "purgedFromQuarantine": purged}
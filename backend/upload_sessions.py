@@ -0,0 +1,290 @@
+# backend/upload_sessions.py
+"""
+Resumable, chunked uploads for certification documents.
+
+  POST /api/uploads/sessions                 {kind: invoice|certificate, filename, size}
+       -> {uploadId, offset: 0, chunkSize, expiresAt}
+  PUT  /api/uploads/sessions/<id>?offset=N   raw bytes (<= chunkSize)
+       -> {offset}   409 {offset} if N is not the current offset (resume from there)
+  GET  /api/uploads/sessions/<id>            -> {offset, size, status}   (after a dropped connection)
+  POST /api/uploads/sessions/<id>/finalize   -> {document: {url, hash, name, size}}
+
+The completed upload id is then passed to submit_certs as
+invoiceUploadId / certificateUploadId instead of the file itself, so each HTTP
+request stays well under MAX_CONTENT_LENGTH while documents can be up to
+UPLOAD_RESUMABLE_MAX_MB.
+
+Bytes are appended to a staging file in the storage backend. The session's
+offset is the end of the bytes on disk: it only advances after a chunk's write
+returned, and a chunk is only accepted at exactly that offset, so the staged
+file never has gaps and finalize can trust offset == size. The SHA-256 is
+updated as each chunk arrives; the running hasher lives in this process, so if
+a chunk lands on another worker (or after a restart) finalize re-hashes the
+staged file instead. Sessions idle for UPLOAD_SESSION_TTL are removed with
+their staged bytes by gc_upload_sessions (jobs.py: upload_sessions_gc).
+"""
+from datetime import datetime, timedelta
+import hashlib
+import os
+import secrets
+import threading
+
+from bson import ObjectId
+from flask import Blueprint, request, jsonify
+from pymongo import ASCENDING
+from werkzeug.utils import secure_filename
+
+from auth import current_user, auth_required
+from db import mongo
+from storage import content_key, get_storage
+
+bp = Blueprint("upload_sessions", __name__)
+
+KINDS = {"invoice": "invoices", "certificate": "certs"}  # kind -> storage subdir
+ALLOWED_EXTS = {"pdf", "jpg", "jpeg", "png"}
+UPLOAD_RESUMABLE_MAX_MB = int(os.getenv("UPLOAD_RESUMABLE_MAX_MB", "25"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+UPLOAD_CLAIM_TTL = int(os.getenv("UPLOAD_CLAIM_TTL", "60"))  # seconds a chunk writer may hold its offset
+HASH_READ_CHUNK = 64 * 1024
+
+# uploadId -> (offset, sha256 object) for chunks received by this process
+_HASHERS_MAX = 256
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def get_coll():
+    db = mongo.db
+    if db is None:
+        raise RuntimeError("Mongo is not initialized. Ensure mongo.init_app(app) runs before registering blueprints.")
+    return db.upload_sessions
+
+def ensure_upload_session_indexes(coll):
+    coll.create_index([("status", ASCENDING), ("updatedAt", ASCENDING)])
+    coll.create_index([("userId", ASCENDING), ("createdAt", ASCENDING)])
+
+def _staged(upload_id):
+    return get_storage().temp_path(f"session-{upload_id}.part")
+
+def _session_for_user(upload_id):
+    try:
+        _id = ObjectId(upload_id)
+    except Exception:
+        return None
+    return get_coll().find_one({"_id": _id, "userId": current_user()["_id"]})
+
+def _public(s):
+    return {
+        "uploadId": str(s["_id"]),
+        "kind": s["kind"],
+        "filename": s["filename"],
+        "size": s["size"],
+        "offset": s["offset"],
+        "status": s["status"],
+        "chunkSize": UPLOAD_CHUNK_SIZE,
+        "expiresAt": (s["updatedAt"] + timedelta(seconds=UPLOAD_SESSION_TTL)).isoformat() + "Z",
+    }
+
+
+# ---------------- Incremental hashing ----------------
+def _hash_advance(upload_id, offset, chunk):
+    """Feed a chunk written at `offset` to this process's hasher (dropped if it missed a chunk)."""
+    with _hashers_lock:
+        cur = _hashers.pop(upload_id, None)
+        if cur is None and offset == 0:
+            cur = (0, hashlib.sha256())
+        if cur is None or cur[0] != offset:
+            return
+        cur[1].update(chunk)
+        _hashers[upload_id] = (offset + len(chunk), cur[1])
+        while len(_hashers) > _HASHERS_MAX:
+            _hashers.pop(next(iter(_hashers)))
+
+def _hash_final(upload_id, path, size):
+    with _hashers_lock:
+        cur = _hashers.pop(upload_id, None)
+    if cur and cur[0] == size:
+        return cur[1].hexdigest()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+# ------------------------------------------------
+
+
+@bp.post("/api/uploads/sessions")
+@auth_required
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    kind = str(data.get("kind") or "").strip().lower()
+    if kind not in KINDS:
+        return jsonify({"error": "kind must be invoice or certificate"}), 400
+    raw_name = str(data.get("filename") or "")
+    ext = raw_name.rsplit(".", 1)[1].lower() if "." in raw_name else ""
+    if ext not in ALLOWED_EXTS:
+        return jsonify({"error": "Only PDF/JPG/PNG allowed"}), 400
+    filename = secure_filename(raw_name)
+    if not filename.lower().endswith("." + ext):  # non-ASCII names lose everything but the extension
+        filename = f"document.{ext}"
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer"}), 400
+    if size <= 0:
+        return jsonify({"error": "Empty file"}), 400
+    if size > UPLOAD_RESUMABLE_MAX_MB * 1024 * 1024:
+        return jsonify({"error": f"File exceeds {UPLOAD_RESUMABLE_MAX_MB} MB"}), 400
+
+    now = datetime.utcnow()
+    doc = {
+        "userId": current_user()["_id"],
+        "kind": kind,
+        "filename": filename,
+        "ext": ext,
+        "size": size,
+        "offset": 0,
+        "status": "open",
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    doc["_id"] = get_coll().insert_one(doc).inserted_id
+    open(_staged(doc["_id"]), "wb").close()
+    return jsonify(_public(doc)), 201
+
+@bp.get("/api/uploads/sessions/<upload_id>")
+@auth_required
+def get_upload_session(upload_id):
+    s = _session_for_user(upload_id)
+    if not s:
+        return jsonify({"error": "Upload not found"}), 404
+    out = _public(s)
+    if s["status"] == "complete":
+        out["document"] = s["document"]
+    return jsonify(out)
+
+@bp.put("/api/uploads/sessions/<upload_id>")
+@auth_required
+def put_upload_chunk(upload_id):
+    s = _session_for_user(upload_id)
+    if not s:
+        return jsonify({"error": "Upload not found"}), 404
+    if s["status"] != "open":
+        return jsonify({"error": "Upload already finalized"}), 409
+    try:
+        offset = int(request.args.get("offset"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "offset is required"}), 400
+    if offset != s["offset"]:
+        return jsonify({"error": "Offset mismatch", "offset": s["offset"]}), 409
+
+    if (request.content_length or 0) > UPLOAD_CHUNK_SIZE:
+        return jsonify({"error": f"Chunk exceeds {UPLOAD_CHUNK_SIZE} bytes"}), 413
+    chunk = request.get_data(cache=False)
+    if not chunk:
+        return jsonify({"error": "Empty chunk"}), 400
+    if len(chunk) > UPLOAD_CHUNK_SIZE:
+        return jsonify({"error": f"Chunk exceeds {UPLOAD_CHUNK_SIZE} bytes"}), 413
+    if offset + len(chunk) > s["size"]:
+        return jsonify({"error": "Chunk runs past the declared size"}), 400
+
+    # `offset` is the end of the bytes actually on disk and only moves after a
+    # write returns. A short-lived claim makes one PUT the writer at that
+    # offset; a claim left by a killed worker expires after UPLOAD_CLAIM_TTL
+    end = offset + len(chunk)
+    now = datetime.utcnow()
+    claim = {"token": secrets.token_hex(8), "at": now}
+    claimed = get_coll().find_one_and_update(
+        {"_id": s["_id"], "status": "open", "offset": offset,
+         "$or": [{"claim": None}, {"claim.at": {"$lt": now - timedelta(seconds=UPLOAD_CLAIM_TTL)}}]},
+        {"$set": {"claim": claim, "updatedAt": now}},
+        projection={"_id": 1},
+    )
+    if not claimed:
+        return _offset_conflict(s["_id"])
+
+    path = _staged(s["_id"])
+    try:
+        with open(path, "r+b") as f:
+            f.seek(offset)
+            f.write(chunk)
+    except OSError as e:
+        get_coll().update_one({"_id": s["_id"], "claim.token": claim["token"]}, {"$set": {"claim": None}})
+        if isinstance(e, FileNotFoundError):
+            return jsonify({"error": "Upload expired"}), 410
+        raise
+
+    res = get_coll().update_one(
+        {"_id": s["_id"], "status": "open", "offset": offset, "claim.token": claim["token"]},
+        {"$set": {"offset": end, "claim": None, "updatedAt": datetime.utcnow()}},
+    )
+    if not res.modified_count:  # our claim expired and another PUT took over
+        return _offset_conflict(s["_id"])
+    _hash_advance(str(s["_id"]), offset, chunk)
+    return jsonify({"offset": end, "size": s["size"]})
+
+def _offset_conflict(_id):
+    cur = get_coll().find_one({"_id": _id}, {"offset": 1}) or {}
+    return jsonify({"error": "Offset mismatch", "offset": cur.get("offset")}), 409
+
+@bp.post("/api/uploads/sessions/<upload_id>/finalize")
+@auth_required
+def finalize_upload(upload_id):
+    s = _session_for_user(upload_id)
+    if not s:
+        return jsonify({"error": "Upload not found"}), 404
+    if s["status"] == "complete":
+        return jsonify({"document": s["document"]})
+    if s["offset"] != s["size"]:
+        return jsonify({"error": "Upload incomplete", "offset": s["offset"], "size": s["size"]}), 409
+
+    path = _staged(s["_id"])
+    if not os.path.exists(path):
+        return jsonify({"error": "Upload expired"}), 410
+    digest = _hash_final(str(s["_id"]), path, s["size"])
+    storage = get_storage()
+    key = content_key(KINDS[s["kind"]], digest, s["ext"])
+    storage.put_file(path, key)
+
+    document = {"url": storage.url(key), "hash": "sha256:" + digest, "name": s["filename"], "size": s["size"]}
+    get_coll().update_one(
+        {"_id": s["_id"]},
+        {"$set": {"status": "complete", "document": document, "updatedAt": datetime.utcnow()}},
+    )
+    return jsonify({"document": document})
+
+
+def completed_document(upload_id, user_id, kind):
+    """(document meta, error) of a finalized upload owned by user_id, for submit_certs."""
+    try:
+        _id = ObjectId(upload_id)
+    except Exception:
+        return None, f"Invalid {kind} upload id"
+    s = get_coll().find_one({"_id": _id, "userId": user_id, "kind": kind, "status": "complete"})
+    if not s:
+        return None, f"{kind.capitalize()} upload not found or not finalized"
+    return s["document"], None
+
+
+def gc_upload_sessions(db):
+    """
+    Job (jobs.py: upload_sessions_gc). Deletes sessions idle for longer than
+    UPLOAD_SESSION_TTL together with any staged bytes. Finalized documents
+    live on in storage; only the session record goes.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL)
+    ids, staged = [], 0
+    for s in db.upload_sessions.find({"status": {"$in": ["open", "complete"]}, "updatedAt": {"$lt": cutoff}},
+                                     {"status": 1}).batch_size(1000):
+        ids.append(s["_id"])
+        if s["status"] == "open":
+            try:
+                os.remove(_staged(s["_id"]))
+                staged += 1
+            except FileNotFoundError:
+                pass
+    deleted = 0
+    for i in range(0, len(ids), 1000):
+        deleted += db.upload_sessions.delete_many({"_id": {"$in": ids[i:i + 1000]}}).deleted_count
+    return {"sessions": deleted, "stagedFiles": staged}
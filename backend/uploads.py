@@ -0,0 +1,119 @@
+# backend/uploads.py
+"""
+Delivery of uploaded files (/uploads/<path>).
+
+- Content-addressed files (<sha256>.<ext>, see certs._save_file) never change,
+  so their ETag is the hash and public ones are cached as immutable.
+- Conditional GET and HTTP Range come from send_file(conditional=True).
+- Certification documents (invoices/, certs/) are private: the URL must carry
+  a signature from sign_url() (the API signs document URLs for the people it
+  shows them to), or the request must come from an admin. Signatures expire;
+  exp is rounded to UPLOAD_URL_TTL windows so a URL stays stable (and
+  cacheable) for at least one window.
+- UPLOAD_OFFLOAD=nginx|sendfile hands the bytes to the front proxy
+  (X-Accel-Redirect to UPLOAD_ACCEL_PREFIX, or X-Sendfile with the absolute
+  path) after the access check, so no worker streams large PDFs.
+"""
+import hashlib
+import hmac
+import mimetypes
+import os
+import re
+import time
+
+from flask import Blueprint, current_app, jsonify, request, send_file, Response
+from werkzeug.security import safe_join
+
+from auth import current_user
+
+bp = Blueprint("uploads", __name__)
+
+PRIVATE_DIRS = ("invoices", "certs")
+UPLOAD_URL_TTL = int(os.getenv("UPLOAD_URL_TTL", "3600"))
+UPLOAD_SIGNING_KEY = (os.getenv("UPLOAD_SIGNING_KEY") or os.getenv("JWT_SECRET", "dev-secret")).encode("utf-8")
+UPLOAD_OFFLOAD = (os.getenv("UPLOAD_OFFLOAD") or "").strip().lower()  # "" | nginx | sendfile
+UPLOAD_ACCEL_PREFIX = os.getenv("UPLOAD_ACCEL_PREFIX", "/_protected_uploads/")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+LEGACY_MAX_AGE = 300
+
+_HASHED_NAME = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+
+
+# ---------------- Signing ----------------
+def _signature(path, exp):
+    return hmac.new(UPLOAD_SIGNING_KEY, f"{path}|{exp}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def sign_url(url, ttl=None):
+    """/uploads/<path> -> /uploads/<path>?exp=..&sig=.. (other URLs unchanged)."""
+    if not url or not url.startswith("/uploads/"):
+        return url
+    ttl = ttl or UPLOAD_URL_TTL
+    exp = (int(time.time()) // ttl + 2) * ttl
+    path = url[len("/uploads/"):]
+    return f"{url}?exp={exp}&sig={_signature(path, exp)}"
+
+def sign_documents(cert):
+    """Copy of a certification dict with its document URLs signed."""
+    if not cert or not cert.get("documents"):
+        return cert
+    return {**cert, "documents": [{**d, "url": sign_url(d.get("url"))} for d in cert["documents"]]}
+
+def _exp_arg():
+    try:
+        return int(request.args.get("exp") or 0)
+    except ValueError:
+        return 0
+
+def _valid_signature(path):
+    exp = _exp_arg()
+    sig = request.args.get("sig") or ""
+    return exp >= time.time() and hmac.compare_digest(sig, _signature(path, exp))
+# ------------------------------------------------
+
+
+def _is_private(path):
+    return path.split("/", 1)[0] in PRIVATE_DIRS
+
+def _offload(path, mimetype, etag):
+    resp = Response(mimetype=mimetype)
+    if UPLOAD_OFFLOAD == "nginx":
+        resp.headers["X-Accel-Redirect"] = UPLOAD_ACCEL_PREFIX.rstrip("/") + "/" + path
+    else:
+        resp.headers["X-Sendfile"] = safe_join(current_app.config["UPLOAD_FOLDER"], path)
+    if etag:
+        resp.set_etag(etag)
+        resp = resp.make_conditional(request)
+    return resp
+
+@bp.get("/uploads/<path:filename>")
+def serve_uploads(filename):
+    full = safe_join(current_app.config["UPLOAD_FOLDER"], filename)
+    hidden = any(part.startswith(".") for part in filename.split("/"))  # staging area (storage.TMP_DIR)
+    if full is None or hidden or not os.path.isfile(full):
+        return jsonify({"error": "Not found"}), 404
+
+    private = _is_private(filename)
+    if private:
+        u = current_user()
+        if not _valid_signature(filename) and not (u and u.get("role") == "admin"):
+            return jsonify({"error": "Forbidden"}), 403
+
+    m = _HASHED_NAME.match(os.path.basename(filename))
+    etag = m.group(1) if m else None
+    if m and private:
+        # signed URLs expire, so cache no longer than the signature lives
+        exp = _exp_arg()
+        max_age = max(0, min(IMMUTABLE_MAX_AGE, exp - int(time.time()))) if exp else 0
+        cache_control = f"private, max-age={max_age}"
+    elif m:
+        cache_control = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"{'private' if private else 'public'}, max-age={LEGACY_MAX_AGE}"
+
+    mimetype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+    if UPLOAD_OFFLOAD in ("nginx", "sendfile"):
+        resp = _offload(filename, mimetype, etag)
+    else:
+        resp = send_file(full, mimetype=mimetype, conditional=True, etag=etag or True)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
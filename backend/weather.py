@@ -0,0 +1,446 @@
+# backend/weather.py
+"""
+OpenWeather helpers + a process-local response cache.
+
+Cache keys are location grid cells (lat/lon rounded to WEATHER_GRID_DEG) or a
+normalized `q`, so farmers in the same district share one upstream fetch.
+  - TTL: entries are fresh for WEATHER_TTL_SECONDS
+  - coalescing: concurrent misses for a cell wait on a single in-flight fetch
+  - current + forecast are fetched in parallel
+  - stale-while-revalidate: once stale (up to WEATHER_STALE_SECONDS), a request
+    waits at most WEATHER_SWR_WAIT_SECONDS for the refresh, else gets the stale copy
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from datetime import datetime
+import math
+import os
+import re
+import threading
+import time
+
+from http_client import get_http
+
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY") or os.getenv("OWM_API_KEY")
+# Override to point at a local stub server in tests / load tests
+OPENWEATHER_BASE_URL = (os.getenv("OPENWEATHER_BASE_URL") or "https://api.openweathermap.org/data/2.5").rstrip("/")
+
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.1"))            # ~11 km cells
+WEATHER_TTL_SECONDS = float(os.getenv("WEATHER_TTL_SECONDS", "600"))
+WEATHER_STALE_SECONDS = float(os.getenv("WEATHER_STALE_SECONDS", "3600"))
+WEATHER_SWR_WAIT_SECONDS = float(os.getenv("WEATHER_SWR_WAIT_SECONDS", "1.5"))
+WEATHER_CACHE_MAX = int(os.getenv("WEATHER_CACHE_MAX", "5000"))
+WEATHER_FETCH_WORKERS = int(os.getenv("WEATHER_FETCH_WORKERS", "8"))
+
+
+# ---------------- OpenWeather ----------------
+def _owm_request(endpoint, params):
+    if not OPENWEATHER_API_KEY:
+        raise RuntimeError("OPENWEATHER_API_KEY missing")
+    url = f"{OPENWEATHER_BASE_URL}/{endpoint}"
+    p = {"appid": OPENWEATHER_API_KEY, "units": "metric", **params}
+    return get_http().get_json(url, params=p)
+
+def _aggregate_3days(forecast_json):
+    """
+    Input: OpenWeather 5-day/3-hour forecast JSON
+    Output: list of up to 3 day summaries [{date, min, max, rain_mm, main, desc}]
+    """
+    from collections import defaultdict, Counter
+    buckets = defaultdict(list)
+    for it in forecast_json.get("list", []):
+        dt_txt = it.get("dt_txt")  # 'YYYY-MM-DD HH:MM:SS'
+        if not dt_txt:
+            continue
+        day = dt_txt.split(" ")[0]
+        buckets[day].append(it)
+
+    out = []
+    today = datetime.utcnow().date()
+    for i, day in enumerate(sorted(buckets.keys())):
+        # Skip "today" partial day; take next 3 calendar days total including today if early enough
+        d_date = datetime.strptime(day, "%Y-%m-%d").date()
+        if d_date < today:
+            continue
+        temps = [x["main"]["temp"] for x in buckets[day] if x.get("main")]
+        rains = []
+        for x in buckets[day]:
+            # rain can be {'3h': mm}
+            mm = (x.get("rain") or {}).get("3h", 0.0)
+            if isinstance(mm, (int, float)):
+                rains.append(float(mm))
+        mains = [ (x.get("weather") or [{}])[0].get("main") for x in buckets[day] ]
+        descs = [ (x.get("weather") or [{}])[0].get("description") for x in buckets[day] ]
+        if not temps:
+            continue
+        mains = [m for m in mains if m]
+        descs = [d for d in descs if d]
+        main = Counter(mains).most_common(1)[0][0] if mains else None
+        desc = Counter(descs).most_common(1)[0][0] if descs else None
+        out.append({
+            "date": day,
+            "min": round(min(temps), 1),
+            "max": round(max(temps), 1),
+            "rain_mm": round(sum(rains), 1) if rains else 0.0,
+            "main": main,
+            "desc": desc
+        })
+        if len(out) == 3:
+            break
+    return out
+
+def _format_location_from_owm(cur):
+    name = cur.get("name")
+    sys = cur.get("sys") or {}
+    country = sys.get("country")
+    coord = cur.get("coord") or {}
+    return {
+        "display": ", ".join([x for x in [name, country] if x]),
+        "lat": coord.get("lat"),
+        "lon": coord.get("lon"),
+        "name": name,
+        "country": country
+    }
+
+# ------------------------------------------------
+
+
+# ---------------- Location keys ----------------
+def _grid(v):
+    return round(float(v) / WEATHER_GRID_DEG)
+
+def location_key(lat=None, lon=None, q=None):
+    """
+    Returns (cache_key, upstream_params). lat/lon snap to the centre of their
+    grid cell; q is lower-cased with whitespace/commas normalized.
+    Raises ValueError on missing/invalid input.
+    """
+    if lat not in (None, "") and lon not in (None, ""):
+        try:
+            flat, flon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise ValueError("lat/lon must be numbers")
+        if not (math.isfinite(flat) and math.isfinite(flon)):
+            raise ValueError("lat/lon must be finite numbers")
+        if not (-90 <= flat <= 90 and -180 <= flon <= 180):
+            raise ValueError("lat must be within -90..90 and lon within -180..180")
+        gy, gx = _grid(flat), _grid(flon)
+        return f"grid:{gy}:{gx}", {"lat": round(gy * WEATHER_GRID_DEG, 4), "lon": round(gx * WEATHER_GRID_DEG, 4)}
+    if q and q.strip():
+        norm = re.sub(r"\s*,\s*", ",", re.sub(r"\s+", " ", q.strip().lower()))
+        return f"q:{norm}", {"q": norm}
+    raise ValueError("Provide lat/lon or q")
+# ------------------------------------------------
+
+
+# ---------------- Cache ----------------
+class WeatherCache:
+    def __init__(self, ttl=WEATHER_TTL_SECONDS, stale=WEATHER_STALE_SECONDS, swr_wait=WEATHER_SWR_WAIT_SECONDS,
+                 max_entries=WEATHER_CACHE_MAX, workers=WEATHER_FETCH_WORKERS, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale = stale
+        self.swr_wait = swr_wait
+        self.max_entries = max(1, max_entries)
+        self.clock = clock
+        self._entries = OrderedDict()   # key -> (fetched_at, value)
+        self._inflight = {}             # key -> Future
+        # re-entrant: add_done_callback runs _store inline if the fetch already finished
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="weather")
+        self.counters = {"hit": 0, "miss": 0, "stale": 0, "coalesced": 0, "errors": 0}
+
+    def _store(self, key, fut):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if fut.exception() is not None:
+                self.counters["errors"] += 1
+                return
+            self._entries[key] = (self.clock(), fut.result())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, fetch):
+        """Start (or join) the single in-flight fetch for key. Caller holds the lock."""
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.counters["coalesced"] += 1
+            return fut
+        fut = self._pool.submit(fetch)
+        self._inflight[key] = fut
+        fut.add_done_callback(lambda f: self._store(key, f))
+        return fut
+
+    def begin(self, key, fetch):
+        """
+        Non-blocking first half of get(): returns ("hit", value) for a fresh
+        entry, else ("wait", (future, stale_entry_or_None)) after starting or
+        joining the refresh.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            age = self.clock() - entry[0] if entry else None
+            if entry and age < self.ttl:
+                self.counters["hit"] += 1
+                return "hit", entry[1]
+            stale = entry if entry is not None and age < self.ttl + self.stale else None
+            return "wait", (self._refresh(key, fetch), stale)
+
+    def finish(self, pending):
+        """Second half of get(): (value, status) with status in miss|stale."""
+        fut, stale = pending
+        if stale is None:
+            with self._lock:
+                self.counters["miss"] += 1
+            return fut.result(), "miss"
+
+        try:
+            value = fut.result(timeout=self.swr_wait)
+            with self._lock:
+                self.counters["miss"] += 1
+            return value, "miss"
+        except FuturesTimeout:
+            pass
+        except Exception:
+            pass  # provider error -> fall back to the stale copy
+        with self._lock:
+            self.counters["stale"] += 1
+        return stale[1], "stale"
+
+    def get(self, key, fetch):
+        """Returns (value, status) with status in hit|miss|stale."""
+        kind, val = self.begin(key, fetch)
+        return (val, "hit") if kind == "hit" else self.finish(val)
+
+    def warm(self, key, fetch, min_remaining=0.0):
+        """
+        Start a background refresh if the entry is missing or will go stale
+        within min_remaining seconds. Returns the Future, or None if still fresh.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self.ttl - (self.clock() - entry[0]) > min_remaining:
+                return None
+            return self._refresh(key, fetch)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "inflight": len(self._inflight), **self.counters}
+# ------------------------------------------------
+
+
+_cache = WeatherCache()
+_upstream_pool = ThreadPoolExecutor(max_workers=max(1, WEATHER_FETCH_WORKERS), thread_name_prefix="owm")
+
+def _fetch_bundle(params):
+    # current + forecast in parallel; the forecast call runs on the upstream pool
+    fc_fut = _upstream_pool.submit(_owm_request, "forecast", params)
+    cur = _owm_request("weather", params)
+    return {"current": cur, "forecast": fc_fut.result()}
+
+def get_weather(lat=None, lon=None, q=None):
+    """
+    Cached {current, forecast} OpenWeather payloads for a location.
+    Returns (bundle, cache_status). Raises ValueError for bad input and the
+    upstream exception when there is nothing cached to fall back on.
+    """
+    key, params = location_key(lat=lat, lon=lon, q=q)
+    return _cache.get(key, lambda: _fetch_bundle(params))
+
+def get_weather_many(locations):
+    """
+    Batch lookup. locations: [{lat, lon} | {q}]. Locations sharing a grid cell
+    (or normalized q) share one cache entry / upstream fetch, and all misses are
+    fetched concurrently. Returns a list aligned with the input:
+      {"key", "cache", "bundle"}  or  {"error", "status": 400|502}
+    """
+    keyed, pending, ready = [], {}, {}
+    for loc in locations:
+        loc = loc if isinstance(loc, dict) else {}
+        try:
+            key, params = location_key(lat=loc.get("lat"), lon=loc.get("lon"), q=loc.get("q"))
+        except ValueError as e:
+            keyed.append((None, str(e)))
+            continue
+        keyed.append((key, None))
+        if key in pending or key in ready:
+            continue
+        kind, val = _cache.begin(key, lambda params=params: _fetch_bundle(params))
+        if kind == "hit":
+            ready[key] = (val, "hit", None)
+        else:
+            pending[key] = val
+
+    for key, p in pending.items():
+        try:
+            bundle, status = _cache.finish(p)
+            ready[key] = (bundle, status, None)
+        except Exception as e:
+            ready[key] = (None, None, f"Weather provider error: {e}")
+
+    out = []
+    for key, err in keyed:
+        if key is None:
+            out.append({"error": err, "status": 400})
+            continue
+        bundle, status, err = ready[key]
+        out.append({"error": err, "status": 502} if err else {"key": key, "cache": status, "bundle": bundle})
+    return out
+
+def summarize_now(bundle):
+    """Shape a cached bundle as the /api/weather/now payload."""
+    cur, fc = bundle["current"], bundle["forecast"]
+    return {
+        "location": _format_location_from_owm(cur),
+        "current": {
+            "temp": (cur.get("main") or {}).get("temp"),
+            "feels_like": (cur.get("main") or {}).get("feels_like"),
+            "humidity": (cur.get("main") or {}).get("humidity"),
+            "pressure": (cur.get("main") or {}).get("pressure"),
+            "wind_speed": (cur.get("wind") or {}).get("speed"),
+            "wind_deg": (cur.get("wind") or {}).get("deg"),
+            "weather": (cur.get("weather") or [{}])[0]
+        },
+        "outlook3d": _aggregate_3days(fc)
+    }
+
+def weather_cache_stats():
+    return _cache.stats()
+
+
+# ---------------- Background prefetch ----------------
+WEATHER_PREFETCH_MAX = int(os.getenv("WEATHER_PREFETCH_MAX", "500"))
+
+def prefetch_user_locations(db):
+    """
+    Job (jobs.py: weather_prefetch). Warms this process's cache for the distinct
+    users.location values, refreshing entries that would expire before the next
+    run. Upstream work scales with distinct locations, not users.
+    """
+    from jobs import interval_of
+
+    names = db.users.distinct("location", {"location": {"$nin": [None, ""]}})
+    keys = {}
+    for name in names:
+        try:
+            key, params = location_key(q=name)
+        except ValueError:
+            continue
+        keys.setdefault(key, params)
+        if len(keys) >= WEATHER_PREFETCH_MAX:
+            break
+
+    # Refresh what would expire before the next run, but never more than half
+    # the TTL ahead: a horizon >= ttl would refetch every fresh entry each run
+    horizon = min(interval_of("weather_prefetch") * 1.5, _cache.ttl * 0.5)
+    futures = [f for f in (_cache.warm(k, lambda p=p: _fetch_bundle(p), horizon) for k, p in keys.items()) if f]
+    failed = 0
+    for f in futures:
+        try:
+            f.result()
+        except Exception:
+            failed += 1
+    return {"locations": len(names), "cells": len(keys), "refreshed": len(futures) - failed, "failed": failed}
+
+
+# ---------------- Advisory rules ----------------
+# (id, crops it applies to or None for everyone, predicate(day), tip)
+# Crop names match users.crops case-insensitively.
+ADVISORY_RULES = [
+    ("rain", None, lambda d: d["rain_mm"] >= 5,
+     "Rain likely — delay irrigation and keep harvested grain covered."),
+    ("heat", None, lambda d: d["max"] is not None and d["max"] >= 35,
+     "High heat — irrigate in the evening/morning; mulch to reduce evap loss."),
+    ("cold", None, lambda d: d["min"] is not None and d["min"] <= 10,
+     "Cool nights — consider row covers for nurseries/seedlings."),
+    ("storm", None, lambda d: (d["main"] or "").lower() in ["thunderstorm"],
+     "Thunderstorms possible — secure shade nets and tall trellises."),
+    # crop-specific
+    ("rice_heavy_rain", {"rice", "paddy"}, lambda d: d["rain_mm"] >= 50,
+     "Heavy rain — open paddy bund outlets so standing water doesn't overtop."),
+    ("wheat_heat", {"wheat"}, lambda d: d["max"] is not None and d["max"] >= 34,
+     "Heat stress for wheat — give a light irrigation to protect grain filling."),
+    ("maize_waterlogging", {"corn", "maize"}, lambda d: d["rain_mm"] >= 40,
+     "Waterlogging risk for maize — clear field drains after the rain."),
+    ("blight", {"tomato", "potato"},
+     lambda d: d["rain_mm"] >= 5 and d["min"] is not None and d["min"] >= 10 and d["max"] is not None and d["max"] <= 25,
+     "Cool, wet spell favours late blight — plan a preventive fungicide spray (e.g. mancozeb)."),
+    ("onion_wet", {"onion"}, lambda d: d["rain_mm"] >= 5,
+     "Wet spell — postpone onion harvest/curing and keep stored bulbs dry."),
+]
+NO_SIGNAL_TIP = "No severe signals — proceed with routine field work."
+
+def evaluate_rules(days, crops=None):
+    """
+    Triggered rules for a 3-day outlook: [(rule_id, first_date, tip)].
+    General rules always apply; crop rules only for crops in `crops`.
+    """
+    crops = {str(c).strip().lower() for c in (crops or [])}
+    hits = []
+    for rule_id, for_crops, pred, tip in ADVISORY_RULES:
+        if for_crops is not None and not (for_crops & crops):
+            continue
+        day = next((d for d in days if pred(d)), None)
+        if day:
+            hits.append((rule_id, day["date"], tip))
+    return hits
+
+def advisory_tips(days, crops=None):
+    tips = [tip for _id, _date, tip in evaluate_rules(days, crops)]
+    return tips or [NO_SIGNAL_TIP]
+# ------------------------------------------------
+
+
+# ---------------- Proactive advisories (job) ----------------
+WEATHER_ADVISORY_CHUNK = 50
+
+def send_weather_advisories(db):
+    """
+    Job (jobs.py: weather_advisories). Groups users by location cell, fetches
+    each cell's forecast once, evaluates the rules per cell (crop rules per
+    distinct crop set) and bulk-inserts notifications. Notifications are
+    deduplicated per (user, rule, day) by notify.dedupeKey, so re-runs only
+    add new alerts.
+    """
+    from notify import ensure_notification_indexes, insert_notifications, make_notification
+
+    ensure_notification_indexes(db)
+
+    # cell key -> {"q": name, "users": [(userId, crops)]}
+    cells = {}
+    cur = db.users.find({"location": {"$nin": [None, ""]}}, {"location": 1, "crops": 1})
+    for u in cur.batch_size(1000):
+        try:
+            key, _params = location_key(q=u["location"])
+        except ValueError:
+            continue
+        cell = cells.setdefault(key, {"q": u["location"], "users": []})
+        cell["users"].append((u["_id"], u.get("crops") or []))
+
+    keys = list(cells)
+    outlooks, failed = {}, 0
+    for i in range(0, len(keys), WEATHER_ADVISORY_CHUNK):
+        chunk = keys[i:i + WEATHER_ADVISORY_CHUNK]
+        for key, r in zip(chunk, get_weather_many([{"q": cells[k]["q"]} for k in chunk])):
+            if r.get("error"):
+                failed += 1
+                continue
+            outlooks[key] = (_format_location_from_owm(r["bundle"]["current"]), _aggregate_3days(r["bundle"]["forecast"]))
+
+    def docs():
+        for key, (loc, days) in outlooks.items():
+            by_crops = {}  # evaluate once per distinct crop set in the cell
+            for user_id, crops in cells[key]["users"]:
+                crop_key = tuple(sorted({str(c).strip().lower() for c in crops}))
+                if crop_key not in by_crops:
+                    by_crops[crop_key] = evaluate_rules(days, crop_key)
+                for rule_id, date, tip in by_crops[crop_key]:
+                    yield make_notification(
+                        user_id, "weather_alert", f"Weather alert · {loc.get('display') or cells[key]['q']}", tip,
+                        metadata={"rule": rule_id, "date": date, "location": loc, "cell": key},
+                        dedupe_key=f"weather:{user_id}:{rule_id}:{date}",
+                    )
+
+    res = insert_notifications(db, docs())
+    return {"cells": len(keys), "fetchFailed": failed, **res}
+
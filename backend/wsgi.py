@@ -0,0 +1,5 @@
+# backend/wsgi.py
+# WSGI entry point:  gunicorn wsgi:app   (flask run also finds app.create_app)
+from app import create_app
+
+app = create_app()
@@ -371,8 +371,11 @@ export const api = {
    */
   async uploadCerts(equipmentId, payload) {
     const fd = new FormData();
-    fd.append("invoice", payload.invoice);
-    fd.append("certificate", payload.certificate);
+    // Either the files themselves or ids from uploadDocumentResumable()
+    if (payload.invoiceUploadId) fd.append("invoiceUploadId", payload.invoiceUploadId);
+    else fd.append("invoice", payload.invoice);
+    if (payload.certificateUploadId) fd.append("certificateUploadId", payload.certificateUploadId);
+    else fd.append("certificate", payload.certificate);
     if (payload.issuer) fd.append("issuer", payload.issuer);
     if (payload.certificateNo) fd.append("certificateNo", payload.certificateNo);
     if (payload.issueDate) fd.append("issueDate", payload.issueDate);
@@ -389,9 +392,65 @@ export const api = {
     return data;
   },
 
-  /** Admin: list all pending certification requests */
-  getPendingCerts: () =>
-    req("/api/admin/certs/pending", { headers: { ...authHeaders() } }),
+  /**
+   * Resumable upload of one certification document (kind: "invoice" | "certificate").
+   * Sends the file in chunks; after a failed chunk it asks the server for the
+   * committed offset and continues from there. Resolves to the uploadId to pass
+   * to uploadCerts as invoiceUploadId / certificateUploadId.
+   */
+  async uploadDocumentResumable(file, kind, { onProgress, retries = 5 } = {}) {
+    const session = await req("/api/uploads/sessions", {
+      method: "POST",
+      headers: { ...authHeaders() },
+      body: JSON.stringify({ kind, filename: file.name, size: file.size }),
+    });
+    const base = `${API_URL}/api/uploads/sessions/${session.uploadId}`;
+    let offset = session.offset;
+    let failures = 0;
+    while (offset < file.size) {
+      try {
+        const resp = await fetchWithTimeout(`${base}?offset=${offset}`, {
+          method: "PUT",
+          headers: { ...authHeaders(), "Content-Type": "application/octet-stream" },
+          body: file.slice(offset, offset + session.chunkSize),
+        }, 60000);
+        const data = await resp.json().catch(() => ({}));
+        // 409 with another offset means "resume from there"; the same offset means
+        // another write still holds it, so back off like any other failure
+        if (resp.ok || (resp.status === 409 && typeof data.offset === "number" && data.offset !== offset)) {
+          offset = data.offset;
+          failures = 0;
+          onProgress?.(offset / file.size);
+          continue;
+        }
+        throw new Error(data?.error || "Upload failed");
+      } catch (e) {
+        if (++failures > retries) throw e;
+        await new Promise((r) => setTimeout(r, 1000 * failures));
+        const st = await req(`/api/uploads/sessions/${session.uploadId}`, { headers: { ...authHeaders() } });
+        offset = st.offset;
+      }
+    }
+    await req(`/api/uploads/sessions/${session.uploadId}/finalize`, {
+      method: "POST",
+      headers: { ...authHeaders() },
+    });
+    return session.uploadId;
+  },
+
+  /**
+   * Admin: one page of the certification queue (oldest first)
+   * params: { status?, issuer?, minAgeDays?, maxAgeDays?, limit?, cursor? }
+   * -> { items, nextCursor }
+   */
+  getPendingCerts: (params = {}) => {
+    const sp = new URLSearchParams();
+    Object.entries(params).forEach(([k, v]) => {
+      if (v !== undefined && v !== null && v !== "") sp.append(k, v);
+    });
+    const qs = sp.toString() ? `?${sp.toString()}` : "";
+    return req(`/api/admin/certs/pending${qs}`, { headers: { ...authHeaders() } });
+  },
 
   /**
    * Admin: approve or reject a specific equipment certification
@@ -403,6 +462,17 @@ export const api = {
       headers: { ...authHeaders() },
       body: JSON.stringify(body),
     }),
+
+  /**
+   * Admin: approve or reject many pending certifications at once
+   * body: { ids, approve, notes? } or { items: [{ id, approve, notes?, expiryDate? }] }
+   */
+  bulkDecideCerts: (body) =>
+    req("/api/admin/certs/bulk", {
+      method: "POST",
+      headers: { ...authHeaders() },
+      body: JSON.stringify(body),
+    }),
 };
 
 export default api;